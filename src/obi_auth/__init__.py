@@ -1,13 +1,63 @@
-"""obi_auth."""
+"""obi_auth.
 
-from obi_auth.client import get_token, get_token_info, get_user_info
-from obi_auth.typedef import AuthMode, DeploymentEnvironment, TokenProvider
+The public names are imported from their submodule on first access (PEP 562), so that
+importing obi_auth does not pull in the dependencies of the features that are not used.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from obi_auth.auth import TokenAuth
+    from obi_auth.client import (
+        get_token,
+        get_token_async,
+        get_tokens,
+        get_user_info,
+        get_user_info_async,
+    )
+    from obi_auth.eviction import prune_cache
+    from obi_auth.token_info import get_token_info
+    from obi_auth.typedef import AuthMode, DeploymentEnvironment, TokenProvider
+
+_EXPORTS = {
+    "get_token": "obi_auth.client",
+    "get_token_async": "obi_auth.client",
+    "get_token_info": "obi_auth.token_info",
+    "get_tokens": "obi_auth.client",
+    "get_user_info": "obi_auth.client",
+    "get_user_info_async": "obi_auth.client",
+    "prune_cache": "obi_auth.eviction",
+    "DeploymentEnvironment": "obi_auth.typedef",
+    "AuthMode": "obi_auth.typedef",
+    "TokenProvider": "obi_auth.typedef",
+    "TokenAuth": "obi_auth.auth",
+}
 
 __all__ = [
     "get_token",
+    "get_token_async",
     "get_token_info",
+    "get_tokens",
     "get_user_info",
+    "get_user_info_async",
+    "prune_cache",
     "DeploymentEnvironment",
     "AuthMode",
     "TokenProvider",
+    "TokenAuth",
 ]
+
+
+def __getattr__(name: str):
+    """Import the public names lazily."""
+    if (module_name := _EXPORTS.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    """Return the module attributes, including the ones not imported yet."""
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,187 @@
+"""Token agent serving the tokens of a host over a Unix socket.
+
+A long-running agent owns the memory and disk caches and the refresh logic, like ssh-agent.
+When its socket exists, ``get_token`` asks the agent instead of reading, decrypting and
+minting tokens in each process, so a host has a single refresh point.
+
+Each request and response is a line of JSON on its own connection. The request holds the
+``get_token`` arguments, and the response either ``access_token``, ``error``, or
+``login_required`` when getting the token needs an interactive login. The agent cannot show a
+browser or a user code to its client, so the client runs the login itself and stores the token
+in the shared cache, where the agent finds it for the next requests.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, Self
+
+from obi_auth.config import settings
+from obi_auth.exception import ClientError, LocalServerError, LoginRequiredError
+from obi_auth.storage import FILE_MODE
+from obi_auth.typedef import TokenCacheKey
+
+L = logging.getLogger(__name__)
+
+SOCKET_FILE_NAME = "agent.sock"
+
+
+def get_socket_path() -> Path:
+    """Return the path of the agent socket, from the ``AGENT_SOCKET`` setting by default."""
+    return settings.AGENT_SOCKET or settings.config_dir / SOCKET_FILE_NAME
+
+
+def request_token(key: TokenCacheKey, *, force_refresh: bool) -> str | None:
+    """Get a token from the agent, or return None if no agent is listening or a login is needed.
+
+    Raises:
+        ClientError: If the agent failed to get the token.
+    """
+    if not (socket_path := get_socket_path()).exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(settings.AGENT_TIMEOUT)
+            sock.connect(str(socket_path))
+            sock.sendall(_encode_request(key, force_refresh=force_refresh))
+            with sock.makefile("rb") as reader:
+                response = reader.readline()
+    except OSError as e:
+        L.debug("Agent not available on %s: %s", socket_path, e)
+        return None
+    return _decode_response(response)
+
+
+async def request_token_async(key: TokenCacheKey, *, force_refresh: bool) -> str | None:
+    """Get a token from the agent without blocking the event loop, see ``request_token``."""
+    if not (socket_path := get_socket_path()).exists():
+        return None
+    try:
+        async with asyncio.timeout(settings.AGENT_TIMEOUT):
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            try:
+                writer.write(_encode_request(key, force_refresh=force_refresh))
+                await writer.drain()
+                response = await reader.readline()
+            finally:
+                writer.close()
+                await writer.wait_closed()
+    except (OSError, TimeoutError) as e:
+        L.debug("Agent not available on %s: %s", socket_path, e)
+        return None
+    return _decode_response(response)
+
+
+def _encode_request(key: TokenCacheKey, *, force_refresh: bool) -> bytes:
+    return json.dumps({**key._asdict(), "force_refresh": force_refresh}).encode() + b"\n"
+
+
+def _decode_response(response: bytes) -> str | None:
+    if not response:
+        # the agent closed the connection, for example while stopping
+        return None
+    data = json.loads(response)
+    if data.get("login_required"):
+        L.debug("The agent has no token, a login is required")
+        return None
+    if (error := data.get("error")) is not None:
+        raise ClientError(error)
+    return data["access_token"]
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    """Request handler answering a token request."""
+
+    def handle(self) -> None:
+        """Read a token request and write the token or the error."""
+        # imported here, as the client imports this module to talk to the agent
+        from obi_auth.client import _get_cache_key, _get_token
+
+        try:
+            request = json.loads(self.rfile.readline())
+            key = _get_cache_key(
+                request["environment"],
+                request["auth_mode"],
+                request["token_provider"],
+                request["persistent_token_id"],
+            )
+            access_token = _get_token(
+                key, force_refresh=request["force_refresh"], use_agent=False, interactive=False
+            )
+        except LoginRequiredError:
+            response: dict[str, Any] = {"login_required": True}
+        except ClientError as e:
+            response = {"error": str(e)}
+        except Exception:
+            L.exception("Agent failed to get a token")
+            response = {"error": "Authentication process failed."}
+        else:
+            response = {"access_token": access_token}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class TokenAgent:
+    """Agent serving tokens over a Unix socket."""
+
+    def __init__(self, socket_path: Path | None = None):
+        """Initialize the agent, listening on the ``AGENT_SOCKET`` setting by default."""
+        self.socket_path = socket_path or get_socket_path()
+
+    @contextlib.contextmanager
+    def run(self) -> Iterator[Self]:
+        """Serve the requests in a background thread."""
+        with self._listen() as server:
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                yield self
+            finally:
+                server.shutdown()
+                thread.join(timeout=1)
+
+    def serve_forever(self) -> None:
+        """Serve the requests until interrupted."""
+        with self._listen() as server:
+            server.serve_forever()
+
+    @contextlib.contextmanager
+    def _listen(self) -> Iterator[socketserver.ThreadingUnixStreamServer]:
+        self.socket_path.parent.mkdir(exist_ok=True, parents=True)
+        self._remove_stale_socket()
+        # the socket must not be reachable by other users, even before the chmod
+        umask = os.umask(0o077)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), _AgentHandler)
+        except OSError as e:
+            raise LocalServerError(f"Failed to listen on {self.socket_path}") from e
+        finally:
+            os.umask(umask)
+        server.daemon_threads = True
+        try:
+            os.chmod(self.socket_path, FILE_MODE)
+            L.info("Agent listening on %s", self.socket_path)
+            yield server
+        finally:
+            L.debug("Stopping the agent")
+            server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+
+    def _remove_stale_socket(self) -> None:
+        """Remove the socket left by a stopped agent, or raise if an agent is listening."""
+        if not self.socket_path.exists():
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(str(self.socket_path))
+            except OSError:
+                L.debug("Removing stale agent socket %s", self.socket_path)
+                self.socket_path.unlink(missing_ok=True)
+                return
+        raise LocalServerError(f"An agent is already listening on {self.socket_path}")
@@ -0,0 +1,109 @@
+"""httpx2 authentication with obi_auth tokens."""
+
+import logging
+import threading
+import time
+from collections.abc import AsyncGenerator, Generator
+
+import httpx2
+
+from obi_auth.client import get_token, get_token_async
+from obi_auth.config import settings
+from obi_auth.token_info import get_token_info
+from obi_auth.typedef import AuthMode, DeploymentEnvironment, TokenProvider
+
+L = logging.getLogger(__name__)
+
+
+class TokenAuth(httpx2.Auth):
+    """Attach an obi_auth bearer token to the requests of an httpx2 client.
+
+    The token is kept in memory and used until ``EPSILON_TOKEN_TTL_SECONDS`` before it
+    expires, then a new one is obtained through ``get_token``, so its cache and flows are used. If a request is
+    rejected with 401, the token is refreshed once and the request retried.
+
+    Works with both ``httpx2.Client`` and ``httpx2.AsyncClient``:
+
+    .. code-block:: python
+
+        auth = TokenAuth(environment="production")
+        with httpx2.Client(auth=auth) as client:
+            client.get(url)
+    """
+
+    def __init__(
+        self,
+        *,
+        environment: DeploymentEnvironment = DeploymentEnvironment.staging,
+        auth_mode: AuthMode = AuthMode.pkce,
+        token_provider: TokenProvider = TokenProvider.keycloak,
+        persistent_token_id: str | None = None,
+    ) -> None:
+        """Initialize the auth with the same arguments as ``get_token``."""
+        self._environment = environment
+        self._auth_mode = auth_mode
+        self._token_provider = token_provider
+        self._persistent_token_id = persistent_token_id
+        self._lock = threading.Lock()
+        self._token: str | None = None
+        self._expires_at = 0
+
+    def sync_auth_flow(self, request: httpx2.Request) -> Generator[httpx2.Request, httpx2.Response]:
+        """Authenticate the request, and retry it once with a new token on 401."""
+        token = self._get_valid_token()
+        if token is None:
+            token = self._set_token(self._get_token(force_refresh=False))
+        response = yield self._authorize(request, token)
+        if response.status_code == httpx2.codes.UNAUTHORIZED:
+            L.debug("Request rejected with 401, refreshing the token")
+            token = self._set_token(self._get_token(force_refresh=True))
+            yield self._authorize(request, token)
+
+    async def async_auth_flow(
+        self, request: httpx2.Request
+    ) -> AsyncGenerator[httpx2.Request, httpx2.Response]:
+        """Authenticate the request without blocking the event loop, see ``sync_auth_flow``."""
+        token = self._get_valid_token()
+        if token is None:
+            token = self._set_token(await self._get_token_async(force_refresh=False))
+        response = yield self._authorize(request, token)
+        if response.status_code == httpx2.codes.UNAUTHORIZED:
+            L.debug("Request rejected with 401, refreshing the token")
+            token = self._set_token(await self._get_token_async(force_refresh=True))
+            yield self._authorize(request, token)
+
+    def _get_token(self, *, force_refresh: bool) -> str:
+        return get_token(
+            environment=self._environment,
+            auth_mode=self._auth_mode,
+            token_provider=self._token_provider,
+            force_refresh=force_refresh,
+            persistent_token_id=self._persistent_token_id,
+        )
+
+    async def _get_token_async(self, *, force_refresh: bool) -> str:
+        return await get_token_async(
+            environment=self._environment,
+            auth_mode=self._auth_mode,
+            token_provider=self._token_provider,
+            force_refresh=force_refresh,
+            persistent_token_id=self._persistent_token_id,
+        )
+
+    def _get_valid_token(self) -> str | None:
+        with self._lock:
+            if self._token is not None and time.time() < self._expires_at:
+                return self._token
+        return None
+
+    def _set_token(self, token: str) -> str:
+        expires_at = get_token_info(token)["exp"] - settings.EPSILON_TOKEN_TTL_SECONDS
+        with self._lock:
+            self._token = token
+            self._expires_at = expires_at
+        return token
+
+    @staticmethod
+    def _authorize(request: httpx2.Request, token: str) -> httpx2.Request:
+        request.headers["Authorization"] = f"Bearer {token}"
+        return request
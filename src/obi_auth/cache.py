@@ -1,80 +1,165 @@
 """Token cache module."""
 
+import functools
+import logging
+import random
 import time
+from collections.abc import Sequence
 
 import jwt
 from cryptography.fernet import Fernet, InvalidToken
 
+from obi_auth import metrics, profiling
 from obi_auth.config import settings
-from obi_auth.storage import Storage
+from obi_auth.record import StoredCachedTokenInfo
+from obi_auth.storage import TokenStorage, read_many
 from obi_auth.typedef import (
     AuthManagerTokenInfo,
     CachedAuthManagerTokenInfo,
     CachedTokenInfo,
     KeycloakTokenInfo,
+    TokenCacheKey,
 )
 from obi_auth.util import derive_fernet_key
 
+L = logging.getLogger(__name__)
+
 
 class BaseTokenCache:
     """Shared Fernet helpers for token caches."""
 
-    def __init__(self):
-        """Initialize the token cache."""
-        self._cipher = Fernet(key=derive_fernet_key())
+    @functools.cached_property
+    def _cipher(self) -> Fernet:
+        # derived on first use, so that importing obi_auth stays cheap
+        secret = settings.ENCRYPTION_KEY
+        return Fernet(key=derive_fernet_key(secret.get_secret_value() if secret else None))
+
+    def get_expiry_time(
+        self, cached_token_info: CachedTokenInfo | CachedAuthManagerTokenInfo
+    ) -> int:
+        """Return the UTC timestamp at which a cached access token expires.
+
+        The plaintext ``exp`` is used when stored, else the timestamp of the Fernet token.
+
+        Raises:
+            InvalidToken: If the token was not encrypted with the key of this machine.
+        """
+        if cached_token_info.exp is not None:
+            return cached_token_info.exp
+        creation_time = self._cipher.extract_timestamp(cached_token_info.token)
+        return creation_time + cached_token_info.ttl
+
+    def _is_expired(self, cached_token_info: CachedTokenInfo | CachedAuthManagerTokenInfo) -> bool:
+        """Return True if the metadata shows that the access token expired.
 
-    def _encrypt_access_token(self, access_token: str) -> tuple[bytes, int]:
+        Entries without metadata are left to the TTL check of the decryption.
+        """
+        return cached_token_info.exp is not None and cached_token_info.exp < _now()
+
+    def _is_other_key(self, token: bytes) -> bool:
+        """Return True if the token was encrypted with another key, e.g. by another host."""
+        try:
+            self._cipher.extract_timestamp(token)
+        except InvalidToken:
+            return True
+        return False
+
+    def _encrypt_access_token(self, access_token: str) -> tuple[bytes, int, int]:
         creation_time, time_to_live = _get_token_times(access_token)
         fernet_token = self._cipher.encrypt_at_time(
             data=access_token.encode(encoding="utf-8"),
             current_time=creation_time,
         )
-        return fernet_token, time_to_live
+        return fernet_token, creation_time, time_to_live
 
     def _decrypt_access_token(self, token: bytes, ttl: int) -> str:
-        return self._cipher.decrypt_at_time(
-            token=token,
-            ttl=ttl,
-            current_time=_now(),
-        ).decode()
+        with profiling.span("decrypt"), metrics.timer(metrics.DECRYPT_DURATION):
+            return self._cipher.decrypt_at_time(
+                token=token,
+                ttl=ttl,
+                current_time=_now(),
+            ).decode()
 
 
 class TokenCache(BaseTokenCache):
     """Cache for Keycloak access tokens."""
 
-    def get(self, storage: Storage) -> KeycloakTokenInfo | None:
+    def get(self, storage: TokenStorage) -> KeycloakTokenInfo | None:
         """Get a cached Keycloak token if still valid, else None."""
+        token_info = self._get(storage)
+        _record_lookup("disk", hit=token_info is not None)
+        return token_info
+
+    def _get(self, storage: TokenStorage) -> KeycloakTokenInfo | None:
         if not (cached_token_info := storage.read()):
             return None
         if not isinstance(cached_token_info, CachedTokenInfo):
             storage.clear()
             return None
+        if self._is_expired(cached_token_info):
+            storage.clear()
+            return None
         try:
             access_token = self._decrypt_access_token(
                 cached_token_info.token, cached_token_info.ttl
             )
         except InvalidToken:
-            storage.clear()
+            # the entries of other keys are left to the hosts that can read them
+            if self._is_other_key(cached_token_info.token):
+                _warn_other_key(storage)
+            else:
+                storage.clear()
             return None
         return KeycloakTokenInfo(access_token=access_token)
 
-    def set(self, token_info: KeycloakTokenInfo, storage: Storage) -> None:
+    def set(self, token_info: KeycloakTokenInfo, storage: TokenStorage) -> None:
         """Store a Keycloak token in the cache."""
-        fernet_token, time_to_live = self._encrypt_access_token(token_info.access_token)
-        storage.write(CachedTokenInfo(token=fernet_token, ttl=time_to_live))
+        fernet_token, creation_time, time_to_live = self._encrypt_access_token(
+            token_info.access_token
+        )
+        storage.write(
+            CachedTokenInfo(
+                token=fernet_token,
+                ttl=time_to_live,
+                iat=creation_time,
+                exp=creation_time + time_to_live,
+            )
+        )
 
 
 class AuthManagerTokenCache(BaseTokenCache):
     """Cache for auth-manager access tokens and persistent token ids."""
 
-    def get(self, storage: Storage) -> AuthManagerTokenInfo | None:
+    def get(self, storage: TokenStorage) -> AuthManagerTokenInfo | None:
         """Get a cached auth-manager token.
 
         Returns a valid access token when available. If the access token has expired
         but a persistent token id is stored, returns ``AuthManagerTokenInfo`` with an
         empty ``access_token`` so the caller can remint.
         """
-        if not (cached_token_info := storage.read()):
+        return self._get(storage, storage.read())
+
+    def get_many(self, storages: Sequence[TokenStorage]) -> list[AuthManagerTokenInfo | None]:
+        """Get the cached auth-manager tokens of many entries of the same backend, see ``get``.
+
+        The entries are read in a batch, with a single query when the backend supports it.
+        """
+        return [
+            self._get(storage, cached_token_info)
+            for storage, cached_token_info in zip(storages, read_many(storages), strict=True)
+        ]
+
+    def _get(
+        self, storage: TokenStorage, cached_token_info: StoredCachedTokenInfo | None
+    ) -> AuthManagerTokenInfo | None:
+        token_info = self._get_token_info(storage, cached_token_info)
+        _record_lookup("disk", hit=token_info is not None and token_info.access_token is not None)
+        return token_info
+
+    def _get_token_info(
+        self, storage: TokenStorage, cached_token_info: StoredCachedTokenInfo | None
+    ) -> AuthManagerTokenInfo | None:
+        if not cached_token_info:
             return None
         if not isinstance(cached_token_info, CachedAuthManagerTokenInfo):
             storage.clear()
@@ -85,9 +170,11 @@ class AuthManagerTokenCache(BaseTokenCache):
                 cached_token_info.persistent_token_id
             ).decode()
         except InvalidToken:
-            storage.clear()
+            _warn_other_key(storage)
             return None
 
+        if self._is_expired(cached_token_info):
+            return AuthManagerTokenInfo(access_token=None, persistent_token_id=persistent_token_id)
         try:
             access_token = self._decrypt_access_token(
                 cached_token_info.token, cached_token_info.ttl
@@ -99,12 +186,14 @@ class AuthManagerTokenCache(BaseTokenCache):
             access_token=access_token, persistent_token_id=persistent_token_id
         )
 
-    def set(self, token_info: AuthManagerTokenInfo, storage: Storage) -> None:
+    def set(self, token_info: AuthManagerTokenInfo, storage: TokenStorage) -> None:
         """Store an auth-manager token and persistent id in the cache."""
         if token_info.access_token is None:
             msg = "Cannot cache AuthManagerTokenInfo without an access_token"
             raise ValueError(msg)
-        fernet_token, time_to_live = self._encrypt_access_token(token_info.access_token)
+        fernet_token, creation_time, time_to_live = self._encrypt_access_token(
+            token_info.access_token
+        )
         persistent_token_id = self._cipher.encrypt(
             token_info.persistent_token_id.encode(encoding="utf-8")
         )
@@ -113,17 +202,88 @@ class AuthManagerTokenCache(BaseTokenCache):
                 token=fernet_token,
                 ttl=time_to_live,
                 persistent_token_id=persistent_token_id,
+                iat=creation_time,
+                exp=creation_time + time_to_live,
             )
         )
 
 
+class MemoryTokenCache:
+    """Process-local cache of plaintext access tokens in front of the on-disk caches.
+
+    Entries expire at the same effective TTL used for the encrypted disk entries, so a
+    hit never touches the filesystem and never runs a Fernet decryption. The entries hit
+    since they were set are tracked, to stop refreshing the tokens nobody uses anymore.
+    """
+
+    def __init__(self):
+        """Initialize an empty memory cache."""
+        self._entries: dict[TokenCacheKey, tuple[str, int]] = {}
+        self._read_keys: set[TokenCacheKey] = set()
+
+    def get(self, key: TokenCacheKey) -> str | None:
+        """Get a cached access token if still valid, else None."""
+        if not (entry := self._entries.get(key)):
+            _record_lookup("memory", hit=False)
+            return None
+        access_token, expires_at = entry
+        if expires_at <= _now():
+            self._entries.pop(key, None)
+            _record_lookup("memory", hit=False)
+            return None
+        _record_lookup("memory", hit=True)
+        self._read_keys.add(key)
+        return access_token
+
+    def set(self, key: TokenCacheKey, access_token: str) -> None:
+        """Store an access token until its effective expiry time."""
+        creation_time, time_to_live = _get_token_times(access_token)
+        self._entries[key] = (access_token, creation_time + time_to_live)
+        self._read_keys.discard(key)
+
+    def was_read(self, key: TokenCacheKey) -> bool:
+        """Return whether the entry was hit since it was set."""
+        return key in self._read_keys
+
+    def clear(self, key: TokenCacheKey | None = None) -> None:
+        """Remove a single entry, or all of them when no key is given."""
+        if key is None:
+            self._entries.clear()
+            self._read_keys.clear()
+        else:
+            self._entries.pop(key, None)
+            self._read_keys.discard(key)
+
+
+def _warn_other_key(storage: TokenStorage) -> None:
+    L.warning(
+        "Cache entry %s was encrypted with another key, set the same ENCRYPTION_KEY on all the "
+        "hosts sharing the cache",
+        storage.name,
+    )
+
+
+def _record_lookup(cache: str, *, hit: bool) -> None:
+    metrics.increment(metrics.CACHE_LOOKUPS, cache=cache, result="hit" if hit else "miss")
+
+
 def _now() -> int:
     """Return UTC timestamp now."""
     return int(time.time())
 
 
 def _get_token_times(token: str) -> tuple[int, int]:
-    """Get the creation time and time to live of a token."""
+    """Get the creation time and time to live of a token.
+
+    The time to live is shortened by the ``EPSILON_TOKEN_TTL_SECONDS`` margin, plus a random
+    jitter of up to ``TOKEN_TTL_JITTER_SECONDS`` to spread the refreshes.
+    """
     info = jwt.decode(token.encode(), options={"verify_signature": False})
-    effective_ttl = info["exp"] - info["iat"] - settings.EPSILON_TOKEN_TTL_SECONDS
+    margin = settings.EPSILON_TOKEN_TTL_SECONDS + _get_jitter()
+    effective_ttl = info["exp"] - info["iat"] - margin
     return info["iat"], effective_ttl
+
+
+def _get_jitter() -> int:
+    """Return a random number of seconds up to ``TOKEN_TTL_JITTER_SECONDS``."""
+    return random.randint(0, settings.TOKEN_TTL_JITTER_SECONDS)  # noqa: S311
@@ -3,6 +3,7 @@
 import json
 import logging
 import sys
+from pathlib import Path
 
 try:
     import click
@@ -149,3 +150,49 @@ def get_user_info(
         force_refresh=force_refresh,
     )
     print(json.dumps(obi_auth.get_user_info(access_token, environment=environment), indent=2))
+
+
+@main.command()
+@click.option(
+    "--max-entries",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Also evict the least recently written entries above this number",
+)
+@click.option(
+    "--dry-run",
+    help="Only show the entries that would be evicted",
+    is_flag=True,
+    default=False,
+)
+def prune_cache(max_entries: int | None, dry_run: bool):
+    """Evict the stale entries of the token cache, print the evicted ones."""
+    report = obi_auth.prune_cache(max_entries=max_entries, dry_run=dry_run)
+    for name in report.expired:
+        print(f"expired: {name}")
+    for name in report.over_capacity:
+        print(f"over capacity: {name}")
+    for name in report.temp_files:
+        print(f"stale temporary file: {name}")
+    verb = "Would evict" if dry_run else "Evicted"
+    print(f"{verb} {report.removed} entries, {report.kept} kept.")
+
+
+@main.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Path of the Unix socket, defaults to agent.sock in the config dir",
+)
+def agent(socket_path: Path | None):
+    """Serve the tokens to the local processes over a Unix socket, until interrupted."""
+    from obi_auth.agent import TokenAgent
+
+    token_agent = TokenAgent(socket_path)
+    print(f"Agent listening on {token_agent.socket_path}", file=sys.stderr)
+    try:
+        token_agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
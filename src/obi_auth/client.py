@@ -1,35 +1,126 @@
 """This module provides a client for the obi_auth service."""
 
+import asyncio
+import contextvars
+import functools
 import logging
-from collections.abc import Callable
-
-import jwt
-
-from obi_auth.cache import AuthManagerTokenCache, TokenCache
+import threading
+import time
+from collections.abc import Awaitable, Callable, Hashable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager
+from dataclasses import dataclass, field
+from typing import Generic, TypeVar
+
+from obi_auth import profiling
+from obi_auth.agent import request_token, request_token_async
+from obi_auth.cache import AuthManagerTokenCache, MemoryTokenCache, TokenCache
 from obi_auth.config import settings
-from obi_auth.exception import AuthFlowError, ClientError, ConfigError, LocalServerError
+from obi_auth.eviction import maybe_prune_cache
+from obi_auth.exception import (
+    AuthFlowError,
+    ClientError,
+    ConfigError,
+    LocalServerError,
+    LoginRequiredError,
+)
 from obi_auth.flows.auth_manager import (
     auth_manager_exchange_token,
+    auth_manager_exchange_token_async,
     auth_manager_mint_access_token,
+    auth_manager_mint_access_token_async,
 )
-from obi_auth.flows.daf import daf_authenticate
-from obi_auth.flows.pkce import pkce_authenticate
-from obi_auth.request import user_info
-from obi_auth.server import AuthServer
-from obi_auth.storage import Storage
+from obi_auth.refresh import RefreshScheduler
+from obi_auth.request import user_info, user_info_async
+from obi_auth.storage import STORAGE_CLASSES, TokenStorage
+from obi_auth.token_info import get_token_info
 from obi_auth.typedef import (
     AuthManagerTokenInfo,
     AuthMode,
     DeploymentEnvironment,
     KeycloakTokenInfo,
+    TokenCacheKey,
     TokenProvider,
 )
 
 L = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+@dataclass
+class _Call(Generic[T]):
+    """Result of an in-flight call shared with concurrent callers."""
+
+    done: threading.Event = field(default_factory=threading.Event)
+    result: T | None = None
+    error: BaseException | None = None
+
+
+class _SingleFlight:
+    """Coalesce concurrent calls with the same key into a single execution.
+
+    The first caller for a key runs the function, while the other callers block until
+    it completes and then receive its result, or re-raise its exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> T:
+        """Run ``func`` once for all the concurrent callers sharing ``key``."""
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result  # ty: ignore[invalid-return-type]
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class _AsyncSingleFlight:
+    """Coalesce concurrent coroutines with the same key into a single task.
+
+    The task is shielded, so cancelling one of the waiters does not cancel it for the
+    others.
+    """
+
+    def __init__(self):
+        self._tasks: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """Run ``func`` once for all the concurrent callers sharing ``key``."""
+        task_key = (asyncio.get_running_loop(), key)
+        if (task := self._tasks.get(task_key)) is None:
+            task = self._tasks[task_key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+        return await asyncio.shield(task)
+
 
 _TOKEN_CACHE = TokenCache()
 _AUTH_MANAGER_TOKEN_CACHE = AuthManagerTokenCache()
+_MEMORY_TOKEN_CACHE = MemoryTokenCache()
+_SINGLE_FLIGHT = _SingleFlight()
+_ASYNC_SINGLE_FLIGHT = _AsyncSingleFlight()
+_REFRESH_SCHEDULER = RefreshScheduler()
+# cleared by the agent, which cannot show a browser or a user code to its clients
+_INTERACTIVE: contextvars.ContextVar[bool] = contextvars.ContextVar("interactive", default=True)
 
 
 def get_token(
@@ -39,6 +130,7 @@ def get_token(
     token_provider: TokenProvider = TokenProvider.keycloak,
     force_refresh: bool = False,
     persistent_token_id: str | None = None,
+    min_ttl: int = 0,
 ) -> str:
     """Get token.
 
@@ -53,7 +145,210 @@ def get_token(
             Ignored when ``auth_mode`` is ``persistent_token``.
         force_refresh: Clear the cached token and authenticate again.
         persistent_token_id: Required when ``auth_mode`` is ``persistent_token``.
+        min_ttl: Min number of seconds the returned token must remain valid. A cached
+            token expiring sooner is refreshed.
+
+    Raises:
+        ClientError: If even a new token does not remain valid for ``min_ttl`` seconds.
+    """
+    key = _get_cache_key(environment, auth_mode, token_provider, persistent_token_id)
+    with _trace("get_token", key):
+        access_token = _get_token(key, force_refresh=force_refresh)
+        if min_ttl and not force_refresh and _get_remaining_ttl(access_token) < min_ttl:
+            L.debug("Cached token expires in less than %ss, refreshing it", min_ttl)
+            access_token = _get_token(key, force_refresh=True)
+        return _check_min_ttl(access_token, min_ttl)
+
+
+def _get_token(
+    key: TokenCacheKey, *, force_refresh: bool, use_agent: bool = True, interactive: bool = True
+) -> str:
+    """Get a token from the memory cache, the agent, or the on-disk cache and the flows.
+
+    Raises:
+        LoginRequiredError: If not ``interactive`` and getting the token needs a login.
+    """
+    if force_refresh:
+        _MEMORY_TOKEN_CACHE.clear(key)
+    elif access_token := _MEMORY_TOKEN_CACHE.get(key):
+        L.debug("Using in-memory cached token")
+        return access_token
+
+    if use_agent:
+        with profiling.span("agent"):
+            access_token = request_token(key, force_refresh=force_refresh)
+        if access_token:
+            L.debug("Using token from the agent")
+            _MEMORY_TOKEN_CACHE.set(key, access_token)
+            return access_token
+
+    def acquire() -> str:
+        token = _INTERACTIVE.set(interactive)
+        try:
+            return _acquire_token(key, force_refresh=force_refresh)
+        finally:
+            _INTERACTIVE.reset(token)
+
+    # concurrent callers for the same token share a single login or mint
+    with profiling.span("acquire"):
+        return _SINGLE_FLIGHT.do((key, force_refresh, interactive), acquire)
+
+
+def get_tokens(
+    persistent_token_ids: Iterable[str],
+    *,
+    environment: DeploymentEnvironment = DeploymentEnvironment.staging,
+    force_refresh: bool = False,
+    max_workers: int | None = None,
+) -> dict[str, str | ClientError]:
+    """Get auth-manager tokens for many persistent token ids.
+
+    The tokens still valid in cache are returned without any request, the others are
+    minted concurrently, like ``get_token`` with the ``persistent_token`` auth mode.
+
+    Args:
+        persistent_token_ids: Auth-manager persistent token ids, duplicates are minted once.
+        environment: Target deployment environment.
+        force_refresh: Clear the cached tokens and mint them all again.
+        max_workers: Max number of concurrent mints, defaults to the
+            ``BULK_MINT_MAX_WORKERS`` setting.
+
+    Returns:
+        The access token of each id, or the ``ClientError`` raised while getting it, so
+        that a failure does not fail the whole batch.
+    """
+    token_ids = list(dict.fromkeys(persistent_token_ids))
+    results: dict[str, str | ClientError] = {}
+    if not force_refresh:
+        results.update(_get_cached_tokens(token_ids, environment))
+    misses = [token_id for token_id in token_ids if token_id not in results]
+    L.debug("%s tokens found in cache, minting %s", len(results), len(misses))
+    if not misses:
+        return results
+
+    def get_one(token_id: str) -> str | ClientError:
+        try:
+            return get_token(
+                environment=environment,
+                auth_mode=AuthMode.persistent_token,
+                force_refresh=force_refresh,
+                persistent_token_id=token_id,
+            )
+        except ClientError as e:
+            return e
+        except Exception as e:
+            L.debug("Failed to get token for %s", token_id, exc_info=True)
+            error = ClientError("Authentication process failed.")
+            error.__cause__ = e
+            return error
+
+    max_workers = min(max_workers or settings.BULK_MINT_MAX_WORKERS, len(misses))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="obi-auth-mint") as pool:
+        results.update(zip(misses, pool.map(get_one, misses), strict=True))
+    return {token_id: results[token_id] for token_id in token_ids}
+
+
+def _get_cached_tokens(
+    persistent_token_ids: list[str], environment: DeploymentEnvironment
+) -> dict[str, str]:
+    """Return the valid access tokens cached in memory or on disk for persistent ids.
+
+    The entries missing from the memory cache are read from the storage in a batch.
+    """
+    results = {}
+    keys = {}
+    for token_id in persistent_token_ids:
+        try:
+            key = _get_cache_key(
+                environment, AuthMode.persistent_token, TokenProvider.auth_manager, token_id
+            )
+        except ClientError:
+            continue
+        if access_token := _MEMORY_TOKEN_CACHE.get(key):
+            results[token_id] = access_token
+        else:
+            keys[token_id] = key
+    if not keys:
+        return results
+
+    token_infos = _AUTH_MANAGER_TOKEN_CACHE.get_many([_get_storage(key) for key in keys.values()])
+    for (token_id, key), token_info in zip(keys.items(), token_infos, strict=True):
+        if token_info and token_info.access_token:
+            _remember_token(key, token_info.access_token)
+            results[token_id] = token_info.access_token
+    return results
+
+
+async def get_token_async(
+    *,
+    environment: DeploymentEnvironment = DeploymentEnvironment.staging,
+    auth_mode: AuthMode = AuthMode.pkce,
+    token_provider: TokenProvider = TokenProvider.keycloak,
+    force_refresh: bool = False,
+    persistent_token_id: str | None = None,
+    min_ttl: int = 0,
+) -> str:
+    """Get token without blocking the event loop.
+
+    Same as ``get_token``, and sharing the same memory and disk caches, but the network
+    requests, the authentication flows and the disk accesses are awaited.
     """
+    key = _get_cache_key(environment, auth_mode, token_provider, persistent_token_id)
+    with _trace("get_token_async", key):
+        access_token = await _get_token_async(key, force_refresh=force_refresh)
+        if min_ttl and not force_refresh and _get_remaining_ttl(access_token) < min_ttl:
+            L.debug("Cached token expires in less than %ss, refreshing it", min_ttl)
+            access_token = await _get_token_async(key, force_refresh=True)
+        return _check_min_ttl(access_token, min_ttl)
+
+
+async def _get_token_async(key: TokenCacheKey, *, force_refresh: bool) -> str:
+    if force_refresh:
+        _MEMORY_TOKEN_CACHE.clear(key)
+    elif access_token := _MEMORY_TOKEN_CACHE.get(key):
+        L.debug("Using in-memory cached token")
+        return access_token
+
+    with profiling.span("agent"):
+        access_token = await request_token_async(key, force_refresh=force_refresh)
+    if access_token:
+        L.debug("Using token from the agent")
+        _MEMORY_TOKEN_CACHE.set(key, access_token)
+        return access_token
+
+    with profiling.span("acquire"):
+        return await _ASYNC_SINGLE_FLIGHT.do(
+            (key, force_refresh), lambda: _acquire_token_async(key, force_refresh=force_refresh)
+        )
+
+
+def _trace(name: str, key: TokenCacheKey) -> AbstractContextManager:
+    return profiling.trace(
+        name,
+        environment=key.environment,
+        auth_mode=key.auth_mode,
+        token_provider=key.token_provider,
+    )
+
+
+def _get_remaining_ttl(access_token: str) -> float:
+    """Return the number of seconds before the token expires."""
+    return get_token_info(access_token)["exp"] - time.time()
+
+
+def _check_min_ttl(access_token: str, min_ttl: int) -> str:
+    if min_ttl and _get_remaining_ttl(access_token) < min_ttl:
+        raise ClientError(f"The new token does not remain valid for {min_ttl} seconds.")
+    return access_token
+
+
+def _get_cache_key(
+    environment: DeploymentEnvironment,
+    auth_mode: AuthMode,
+    token_provider: TokenProvider,
+    persistent_token_id: str | None,
+) -> TokenCacheKey:
+    """Validate the get_token arguments and return the identity of the requested token."""
     auth_mode = AuthMode(auth_mode)
     token_provider = TokenProvider(token_provider)
 
@@ -63,65 +358,138 @@ def get_token(
     if auth_mode == AuthMode.persistent_token:
         if not persistent_token_id:
             raise ClientError("persistent_token_id is required when auth_mode is persistent_token.")
-        return _get_persistent_token(
-            environment=environment,
-            persistent_token_id=persistent_token_id,
-            force_refresh=force_refresh,
+        return TokenCacheKey(
+            environment, auth_mode, TokenProvider.auth_manager, persistent_token_id
+        )
+    return TokenCacheKey(environment, auth_mode, token_provider)
+
+
+def _acquire_token(key: TokenCacheKey, *, force_refresh: bool) -> str:
+    """Fetch a token and store it in the memory cache."""
+    access_token = _fetch_token(key, force_refresh=force_refresh)
+    _remember_token(key, access_token)
+    with profiling.span("prune_cache"):
+        maybe_prune_cache()
+    return access_token
+
+
+def _remember_token(key: TokenCacheKey, access_token: str) -> None:
+    """Store a token in the memory cache and schedule its background refresh if enabled."""
+    _MEMORY_TOKEN_CACHE.set(key, access_token)
+    if settings.BACKGROUND_REFRESH and key.token_provider == TokenProvider.auth_manager:
+        _REFRESH_SCHEDULER.schedule(
+            key,
+            due=_get_refresh_time(access_token),
+            callback=functools.partial(_refresh_in_background, key),
         )
 
-    storage = Storage(
-        config_dir=settings.config_dir,
-        environment=environment,
-        key=f"{auth_mode}_{token_provider}",
-    )
 
-    if token_provider == TokenProvider.auth_manager:
+def _fetch_token(key: TokenCacheKey, *, force_refresh: bool) -> str:
+    """Get a token from the on-disk cache, or authenticate/mint a new one."""
+    with profiling.span("storage.init"):
+        storage = _get_storage(key)
+
+    if key.persistent_token_id is not None:
+        return _get_persistent_token(
+            storage=storage,
+            environment=key.environment,
+            persistent_token_id=key.persistent_token_id,
+            force_refresh=force_refresh,
+        )
+    if key.token_provider == TokenProvider.auth_manager:
         return _get_auth_manager_token(
             storage=storage,
-            environment=environment,
-            auth_mode=auth_mode,
+            environment=key.environment,
+            auth_mode=key.auth_mode,
             force_refresh=force_refresh,
         )
     return _get_keycloak_token(
         storage=storage,
-        environment=environment,
-        auth_mode=auth_mode,
+        environment=key.environment,
+        auth_mode=key.auth_mode,
         force_refresh=force_refresh,
     )
 
 
+def _get_storage(key: TokenCacheKey) -> TokenStorage:
+    """Return the on-disk storage of the token identified by key."""
+    return STORAGE_CLASSES[settings.STORAGE_BACKEND](
+        config_dir=settings.config_dir,
+        environment=key.environment,
+        key=key.persistent_token_id or f"{key.auth_mode}_{key.token_provider}",
+    )
+
+
+def _get_refresh_time(access_token: str) -> float:
+    """Return when a background refresh should re-mint the access token.
+
+    Tokens living less than twice the refresh margin are refreshed at half-life.
+    """
+    info = get_token_info(access_token)
+    return max(
+        info["exp"] - settings.BACKGROUND_REFRESH_MARGIN_SECONDS,
+        (info["iat"] + info["exp"]) / 2,
+    )
+
+
+def _refresh_in_background(key: TokenCacheKey) -> float | None:
+    """Re-mint the auth-manager token identified by key from its cached persistent id.
+
+    Returns the time of the next refresh, or None if there is nothing to refresh or if the
+    token was not read since it was last refreshed.
+    """
+    if not _MEMORY_TOKEN_CACHE.was_read(key):
+        L.debug("Auth-manager token unused since its last refresh, stopping its refresh")
+        return None
+    storage = _get_storage(key)
+    with storage.lock(timeout=settings.STORAGE_LOCK_TIMEOUT):
+        if not (token_info := _AUTH_MANAGER_TOKEN_CACHE.get(storage)):
+            L.debug("No cached auth-manager token left to refresh in background")
+            return None
+        # skip the mint if another process already refreshed the token
+        if not token_info.access_token or _get_refresh_time(token_info.access_token) <= time.time():
+            L.debug("Refreshing auth-manager token in background")
+            token_info = auth_manager_mint_access_token(
+                token_info.persistent_token_id, environment=key.environment
+            )
+            _AUTH_MANAGER_TOKEN_CACHE.set(token_info, storage)
+    access_token = token_info.access_token
+    if access_token is None:
+        raise ClientError("Authentication process failed.")
+    _MEMORY_TOKEN_CACHE.set(key, access_token)
+    return _get_refresh_time(access_token)
+
+
 def _get_persistent_token(
     *,
+    storage: TokenStorage,
     environment: DeploymentEnvironment,
     persistent_token_id: str,
     force_refresh: bool,
 ) -> str:
     """Mint from a known persistent id using the auth-manager cache/mint helpers."""
-    storage = Storage(
-        config_dir=settings.config_dir,
-        environment=environment,
-        key=persistent_token_id,
-    )
     if force_refresh:
         L.debug("Forcing token refresh, clearing cached token")
         storage.clear()
-    elif token_info := _AUTH_MANAGER_TOKEN_CACHE.get(storage):
-        if token_info.access_token:
-            L.debug("Using cached token")
-            return token_info.access_token
-        if refreshed := _refresh_auth_manager_token(
-            token_info.persistent_token_id, storage=storage, environment=environment
+    elif (token_info := _AUTH_MANAGER_TOKEN_CACHE.get(storage)) and token_info.access_token:
+        L.debug("Using cached token")
+        return token_info.access_token
+
+    with storage.lock(timeout=settings.STORAGE_LOCK_TIMEOUT) as lock:
+        # another process may have minted a token while we were waiting for the lock
+        if (not force_refresh or lock.refreshed) and (
+            access_token := _get_or_refresh_auth_manager_token(storage, environment=environment)
         ):
-            if refreshed.access_token is None:
-                raise ClientError("Authentication process failed.")
-            return refreshed.access_token
+            return access_token
 
-    try:
-        token_info = auth_manager_mint_access_token(persistent_token_id, environment=environment)
-    except AuthFlowError as e:
-        raise ClientError("Authentication process failed.") from e
+        try:
+            token_info = auth_manager_mint_access_token(
+                persistent_token_id, environment=environment
+            )
+        except AuthFlowError as e:
+            raise ClientError("Authentication process failed.") from e
 
-    _AUTH_MANAGER_TOKEN_CACHE.set(token_info, storage)
+        _AUTH_MANAGER_TOKEN_CACHE.set(token_info, storage)
     if token_info.access_token is None:
         raise ClientError("Authentication process failed.")
     return token_info.access_token
@@ -129,7 +497,7 @@ def _get_persistent_token(
 
 def _get_keycloak_token(
     *,
-    storage: Storage,
+    storage: TokenStorage,
     environment: DeploymentEnvironment,
     auth_mode: AuthMode,
     force_refresh: bool,
@@ -141,15 +509,21 @@ def _get_keycloak_token(
         L.debug("Using cached token")
         return token_info.access_token
 
-    auth_method = _get_auth_method(auth_mode)
-    token_info = auth_method(environment=environment)
-    _TOKEN_CACHE.set(token_info, storage)
+    with storage.lock(timeout=settings.STORAGE_LOCK_TIMEOUT) as lock:
+        # another process may have authenticated while we were waiting for the lock
+        if (not force_refresh or lock.refreshed) and (token_info := _TOKEN_CACHE.get(storage)):
+            L.debug("Using token cached by another process")
+            return token_info.access_token
+
+        auth_method = _get_auth_method(auth_mode)
+        token_info = auth_method(environment=environment)
+        _TOKEN_CACHE.set(token_info, storage)
     return token_info.access_token
 
 
 def _get_auth_manager_token(
     *,
-    storage: Storage,
+    storage: TokenStorage,
     environment: DeploymentEnvironment,
     auth_mode: AuthMode,
     force_refresh: bool,
@@ -157,32 +531,50 @@ def _get_auth_manager_token(
     if force_refresh:
         L.debug("Forcing token refresh, clearing cached token")
         storage.clear()
-    elif token_info := _AUTH_MANAGER_TOKEN_CACHE.get(storage):
-        if token_info.access_token:
-            L.debug("Using cached token")
-            return token_info.access_token
-        if refreshed := _refresh_auth_manager_token(
-            token_info.persistent_token_id, storage=storage, environment=environment
+    elif (token_info := _AUTH_MANAGER_TOKEN_CACHE.get(storage)) and token_info.access_token:
+        L.debug("Using cached token")
+        return token_info.access_token
+
+    with storage.lock(timeout=settings.STORAGE_LOCK_TIMEOUT) as lock:
+        # another process may have minted a token while we were waiting for the lock
+        if (not force_refresh or lock.refreshed) and (
+            access_token := _get_or_refresh_auth_manager_token(storage, environment=environment)
         ):
-            if refreshed.access_token is None:
-                raise ClientError("Authentication process failed.")
-            return refreshed.access_token
+            return access_token
 
-    auth_method = _get_auth_method(auth_mode)
-    keycloak_token = auth_method(environment=environment)
-    try:
-        token_info = auth_manager_exchange_token(keycloak_token, environment=environment)
-    except AuthFlowError as e:
-        raise ClientError("Authentication process failed.") from e
+        auth_method = _get_auth_method(auth_mode)
+        keycloak_token = auth_method(environment=environment)
+        try:
+            token_info = auth_manager_exchange_token(keycloak_token, environment=environment)
+        except AuthFlowError as e:
+            raise ClientError("Authentication process failed.") from e
 
-    _AUTH_MANAGER_TOKEN_CACHE.set(token_info, storage)
+        _AUTH_MANAGER_TOKEN_CACHE.set(token_info, storage)
     if token_info.access_token is None:
         raise ClientError("Authentication process failed.")
     return token_info.access_token
 
 
+def _get_or_refresh_auth_manager_token(
+    storage: TokenStorage, *, environment: DeploymentEnvironment
+) -> str | None:
+    """Return the cached auth-manager token, reminting it from the cached persistent id."""
+    if not (token_info := _AUTH_MANAGER_TOKEN_CACHE.get(storage)):
+        return None
+    if token_info.access_token:
+        L.debug("Using token cached by another process")
+        return token_info.access_token
+    if refreshed := _refresh_auth_manager_token(
+        token_info.persistent_token_id, storage=storage, environment=environment
+    ):
+        if refreshed.access_token is None:
+            raise ClientError("Authentication process failed.")
+        return refreshed.access_token
+    return None
+
+
 def _refresh_auth_manager_token(
-    persistent_token_id: str, *, storage: Storage, environment: DeploymentEnvironment
+    persistent_token_id: str, *, storage: TokenStorage, environment: DeploymentEnvironment
 ) -> AuthManagerTokenInfo | None:
     """Mint a new access token from a cached persistent token id."""
     L.debug("Cached access token expired, minting a new one from persistent token id")
@@ -198,6 +590,8 @@ def _refresh_auth_manager_token(
 
 
 def _get_auth_method(auth_mode: AuthMode) -> Callable[..., KeycloakTokenInfo]:
+    if not _INTERACTIVE.get():
+        raise LoginRequiredError(f"A {auth_mode} login is required to get the token.")
     methods: dict[AuthMode, Callable[..., KeycloakTokenInfo]] = {
         AuthMode.pkce: _pkce_authenticate,
         AuthMode.daf: _daf_authenticate,
@@ -206,6 +600,11 @@ def _get_auth_method(auth_mode: AuthMode) -> Callable[..., KeycloakTokenInfo]:
 
 
 def _pkce_authenticate(*, environment: DeploymentEnvironment) -> KeycloakTokenInfo:
+    # the flows and the local server are imported only when their auth mode is used
+    with profiling.span("import"):
+        from obi_auth.flows.pkce import pkce_authenticate
+        from obi_auth.server import AuthServer
+
     try:
         with AuthServer().run() as local_server:
             return pkce_authenticate(server=local_server, environment=environment)
@@ -218,15 +617,152 @@ def _pkce_authenticate(*, environment: DeploymentEnvironment) -> KeycloakTokenIn
 
 
 def _daf_authenticate(*, environment: DeploymentEnvironment) -> KeycloakTokenInfo:
+    with profiling.span("import"):
+        from obi_auth.flows.daf import daf_authenticate
+
     try:
         return daf_authenticate(environment=environment)
     except AuthFlowError as e:
         raise ClientError("Authentication process failed.") from e
 
 
-def get_token_info(token: str) -> dict:
-    """Decode token information."""
-    return jwt.decode(token, options={"verify_signature": False})
+async def _acquire_token_async(key: TokenCacheKey, *, force_refresh: bool) -> str:
+    """Fetch a token without blocking the event loop and store it in the memory cache."""
+    with profiling.span("storage.init"):
+        storage = await asyncio.to_thread(_get_storage, key)
+    if key.token_provider == TokenProvider.auth_manager:
+        access_token = await _get_auth_manager_token_async(
+            storage, key=key, force_refresh=force_refresh
+        )
+    else:
+        access_token = await _get_keycloak_token_async(
+            storage, key=key, force_refresh=force_refresh
+        )
+    _remember_token(key, access_token)
+    with profiling.span("prune_cache"):
+        await asyncio.to_thread(maybe_prune_cache)
+    return access_token
+
+
+async def _get_keycloak_token_async(
+    storage: TokenStorage, *, key: TokenCacheKey, force_refresh: bool
+) -> str:
+    if force_refresh:
+        L.debug("Forcing token refresh, clearing cached token")
+        await asyncio.to_thread(storage.clear)
+    elif token_info := await asyncio.to_thread(_TOKEN_CACHE.get, storage):
+        L.debug("Using cached token")
+        return token_info.access_token
+
+    async with storage.lock(timeout=settings.STORAGE_LOCK_TIMEOUT) as lock:
+        # another process may have authenticated while we were waiting for the lock
+        if (not force_refresh or lock.refreshed) and (
+            token_info := await asyncio.to_thread(_TOKEN_CACHE.get, storage)
+        ):
+            L.debug("Using token cached by another process")
+            return token_info.access_token
+
+        auth_method = _get_async_auth_method(key.auth_mode)
+        token_info = await auth_method(environment=key.environment)
+        await asyncio.to_thread(_TOKEN_CACHE.set, token_info, storage)
+    return token_info.access_token
+
+
+async def _get_auth_manager_token_async(
+    storage: TokenStorage, *, key: TokenCacheKey, force_refresh: bool
+) -> str:
+    """Get an auth-manager token, minting it from the persistent id in key or in the cache.
+
+    Without a persistent id in key, a new one is obtained by authenticating with Keycloak
+    and exchanging the Keycloak token.
+    """
+    if force_refresh:
+        L.debug("Forcing token refresh, clearing cached token")
+        await asyncio.to_thread(storage.clear)
+    elif (
+        token_info := await asyncio.to_thread(_AUTH_MANAGER_TOKEN_CACHE.get, storage)
+    ) and token_info.access_token:
+        L.debug("Using cached token")
+        return token_info.access_token
+
+    async with storage.lock(timeout=settings.STORAGE_LOCK_TIMEOUT) as lock:
+        # another process may have minted a token while we were waiting for the lock
+        if (not force_refresh or lock.refreshed) and (
+            token_info := await asyncio.to_thread(_AUTH_MANAGER_TOKEN_CACHE.get, storage)
+        ):
+            if token_info.access_token:
+                L.debug("Using token cached by another process")
+                return token_info.access_token
+            L.debug("Cached access token expired, minting a new one from persistent token id")
+            try:
+                token_info = await auth_manager_mint_access_token_async(
+                    token_info.persistent_token_id, environment=key.environment
+                )
+            except AuthFlowError:
+                L.debug("Failed to mint access token from persistent token id, clearing cache")
+                await asyncio.to_thread(storage.clear)
+            else:
+                return await _store_auth_manager_token_async(token_info, storage)
+
+        try:
+            if key.persistent_token_id is not None:
+                token_info = await auth_manager_mint_access_token_async(
+                    key.persistent_token_id, environment=key.environment
+                )
+            else:
+                auth_method = _get_async_auth_method(key.auth_mode)
+                keycloak_token = await auth_method(environment=key.environment)
+                token_info = await auth_manager_exchange_token_async(
+                    keycloak_token, environment=key.environment
+                )
+        except AuthFlowError as e:
+            raise ClientError("Authentication process failed.") from e
+        return await _store_auth_manager_token_async(token_info, storage)
+
+
+async def _store_auth_manager_token_async(
+    token_info: AuthManagerTokenInfo, storage: TokenStorage
+) -> str:
+    if token_info.access_token is None:
+        raise ClientError("Authentication process failed.")
+    await asyncio.to_thread(_AUTH_MANAGER_TOKEN_CACHE.set, token_info, storage)
+    return token_info.access_token
+
+
+def _get_async_auth_method(
+    auth_mode: AuthMode,
+) -> Callable[..., Awaitable[KeycloakTokenInfo]]:
+    methods: dict[AuthMode, Callable[..., Awaitable[KeycloakTokenInfo]]] = {
+        AuthMode.pkce: _pkce_authenticate_async,
+        AuthMode.daf: _daf_authenticate_async,
+    }
+    return methods[auth_mode]
+
+
+async def _pkce_authenticate_async(*, environment: DeploymentEnvironment) -> KeycloakTokenInfo:
+    with profiling.span("import"):
+        from obi_auth.flows.pkce import pkce_authenticate_async
+        from obi_auth.server import AuthServer
+
+    try:
+        async with AuthServer().run_async() as local_server:
+            return await pkce_authenticate_async(server=local_server, environment=environment)
+    except AuthFlowError as e:
+        raise ClientError("Authentication process failed.") from e
+    except LocalServerError as e:
+        raise ClientError("Local server failed to authenticate.") from e
+    except ConfigError as e:
+        raise ClientError("There is a mistake with configuration settings.") from e
+
+
+async def _daf_authenticate_async(*, environment: DeploymentEnvironment) -> KeycloakTokenInfo:
+    with profiling.span("import"):
+        from obi_auth.flows.daf import daf_authenticate_async
+
+    try:
+        return await daf_authenticate_async(environment=environment)
+    except AuthFlowError as e:
+        raise ClientError("Authentication process failed.") from e
 
 
 def get_user_info(
@@ -234,3 +770,10 @@ def get_user_info(
 ) -> dict:
     """Get user info from valid token."""
     return user_info(token, environment=environment).json()
+
+
+async def get_user_info_async(
+    token: str, environment: DeploymentEnvironment = DeploymentEnvironment.staging
+) -> dict:
+    """Get user info from valid token, without blocking the event loop."""
+    return (await user_info_async(token, environment=environment)).json()
@@ -1,13 +1,14 @@
 """This module provides a config for the obi_auth service."""
 
+import threading
 from pathlib import Path
-from typing import Annotated
+from typing import Annotated, Any, cast
 
-from pydantic import Field
+from pydantic import Field, SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from obi_auth.exception import ConfigError
-from obi_auth.typedef import DeploymentEnvironment, KeycloakRealm
+from obi_auth.typedef import DeploymentEnvironment, KeycloakRealm, LockMode, StorageBackend
 from obi_auth.util import get_config_dir
 
 
@@ -33,13 +34,81 @@ class Settings(BaseSettings):
     KEYCLOAK_ENV: DeploymentEnvironment = DeploymentEnvironment.staging
     KEYCLOAK_REALM: KeycloakRealm = KeycloakRealm.sbo
     KEYCLOAK_CLIENT_ID: str = "obi-entitysdk-auth"
+    # domain of Keycloak and auth-manager for all the environments, e.g. a local emulator
+    DOMAIN_URL: str | None = None
 
     EPSILON_TOKEN_TTL_SECONDS: int = 60
+    # random extra margin per token, so that the processes minting at the same time do not
+    # all refresh at the same second
+    TOKEN_TTL_JITTER_SECONDS: int = 30
 
     LOCAL_SERVER_TIMEOUT: int = 60
 
+    # one file per token, all the tokens in a single sqlite database, in the memory of the
+    # process, in the keyring of the user, or in a redis-compatible server
+    STORAGE_BACKEND: StorageBackend = StorageBackend.file
+    # flush the token files to disk when writing them, to survive a power loss
+    STORAGE_FSYNC: bool = False
+    # server of the redis storage backend, and prefix of its keys
+    REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_KEY_PREFIX: str = "obi-auth"
+
+    # evict the expired cache entries at most once per interval when fetching a token, 0 to
+    # disable. Auth-manager entries hold the persistent token id and are kept for a grace period
+    CACHE_EVICTION_INTERVAL_SECONDS: int = 24 * 3600
+    CACHE_EVICTION_GRACE_SECONDS: int = 30 * 24 * 3600
+    # max number of cache entries, the least recently written are evicted first
+    CACHE_MAX_ENTRIES: int | None = None
+
+    # secret of the key encrypting the cached tokens, to set to the same value on all the hosts
+    # sharing a cache (redis backend, or a config dir on a shared filesystem). By default the
+    # key is derived from the host and user, and the tokens cached by other hosts are ignored
+    ENCRYPTION_KEY: SecretStr | None = None
+
+    # max seconds to wait for another process refreshing the same token
+    STORAGE_LOCK_TIMEOUT: float = 90
+    # lock of the token files: advisory locks, or lease files renewed while held and expiring
+    # otherwise, for shared filesystems such as NFS or Lustre where advisory locks are unreliable
+    LOCK_MODE: LockMode = LockMode.flock
+    # the lease files expire this many seconds after their last renewal, their holder renewing
+    # them every third of it
+    LEASE_TTL_SECONDS: float = 30
+
+    # re-mint auth-manager tokens in a daemon thread this many seconds before they expire
+    BACKGROUND_REFRESH: bool = False
+    BACKGROUND_REFRESH_MARGIN_SECONDS: int = 300
+
+    # get_token asks the agent listening on this socket when it exists, defaults to
+    # agent.sock in the config dir. Timeout in seconds of a request to the agent
+    AGENT_SOCKET: Path | None = None
+    AGENT_TIMEOUT: float = 120
+
+    # retries of the transient auth-manager failures, with exponential backoff and jitter
+    AUTH_MANAGER_MAX_RETRIES: int = 3
+    AUTH_MANAGER_RETRY_BACKOFF_SECONDS: float = 0.5
+    AUTH_MANAGER_RETRY_MAX_DELAY_SECONDS: float = 10
+    # fail fast after this many consecutive failed calls to auth-manager (0 to disable), and
+    # try again after the reset delay
+    AUTH_MANAGER_CIRCUIT_BREAKER_THRESHOLD: int = 5
+    AUTH_MANAGER_CIRCUIT_BREAKER_RESET_SECONDS: float = 30
+
+    # shared HTTP client, HTTP2 requires the http2 extra
+    HTTP_TIMEOUT: float = 5.0
+    HTTP_MAX_CONNECTIONS: int = 10
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2: bool = False
+
+    # max concurrent mints of get_tokens
+    BULK_MINT_MAX_WORKERS: int = 8
+
+    # log the duration of the phases of each get_token call
+    PROFILE: bool = False
+
     def _get_domain_url(self, override_env: DeploymentEnvironment) -> str:
         """Return domain url based on environment."""
+        if self.DOMAIN_URL:
+            return self.DOMAIN_URL.rstrip("/")
         match env := override_env or self.KEYCLOAK_ENV:
             case DeploymentEnvironment.staging:
                 return "https://staging.cell-a.openbraininstitute.org"
@@ -97,4 +166,36 @@ class Settings(BaseSettings):
         return f"{base_url}/token-exchange"
 
 
-settings = Settings()
+class _LazySettings:
+    """Proxy creating the settings on first access.
+
+    Importing obi_auth does not read the environment and the .env file, and the settings
+    are still loaded only once per process.
+    """
+
+    def __init__(self):
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "_settings", None)
+
+    def _get_settings(self) -> Settings:
+        if (settings := self._settings) is None:
+            with self._lock:
+                if (settings := self._settings) is None:
+                    settings = Settings()
+                    object.__setattr__(self, "_settings", settings)
+        return settings
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get_settings(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._get_settings(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(self._get_settings(), name)
+
+    def __repr__(self) -> str:
+        return repr(self._get_settings())
+
+
+settings = cast(Settings, _LazySettings())
@@ -0,0 +1,190 @@
+"""Eviction of stale entries from the on-disk token cache."""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from cryptography.fernet import InvalidToken
+
+from obi_auth.cache import BaseTokenCache
+from obi_auth.config import settings
+from obi_auth.storage import FILE_MODE, TokenStorage, scan, scan_temp_files
+from obi_auth.typedef import CachedAuthManagerTokenInfo, StorageBackend
+
+L = logging.getLogger(__name__)
+
+MARKER_FILE_NAME = ".last-eviction"
+# the temporary files written for longer are left by a crash
+TEMP_FILE_MAX_AGE_SECONDS = 600
+
+
+@dataclass
+class EvictionReport:
+    """Names of the entries removed from the cache, or that would be removed in a dry run."""
+
+    expired: list[str] = field(default_factory=list)
+    over_capacity: list[str] = field(default_factory=list)
+    kept: int = 0
+    temp_files: list[str] = field(default_factory=list)
+
+    @property
+    def removed(self) -> int:
+        """Return the number of removed entries."""
+        return len(self.expired) + len(self.over_capacity)
+
+
+def prune_cache(
+    *,
+    config_dir: Path | None = None,
+    backend: StorageBackend | None = None,
+    max_entries: int | None = None,
+    grace_seconds: int | None = None,
+    dry_run: bool = False,
+) -> EvictionReport:
+    """Remove the expired cache entries, then the least recently written ones above a cap.
+
+    Keycloak entries expire with their access token. Auth-manager entries also hold the
+    persistent token id used to mint a new access token without logging in, so they are
+    kept for a grace period after. The expiry is read from the plaintext metadata of the
+    entries, without decrypting them. Entries written by older versions fall back to the
+    encrypted timestamp. If it cannot be decrypted, as the entry was encrypted with the key of
+    another host, the entry is kept for the grace period after its last write, and corrupted
+    entries are removed as expired. Entries being refreshed by another process are left. The
+    temporary files left by the writes of the file backend interrupted by a crash are removed.
+
+    Args:
+        config_dir: Directory of the cache, defaults to the ``config_dir`` setting.
+        backend: Storage engine of the cache, defaults to the ``STORAGE_BACKEND`` setting.
+        max_entries: Max number of entries kept, defaults to the ``CACHE_MAX_ENTRIES``
+            setting. None for no limit.
+        grace_seconds: How long to keep the expired auth-manager entries, defaults to the
+            ``CACHE_EVICTION_GRACE_SECONDS`` setting.
+        dry_run: Only report the entries that would be removed.
+    """
+    config_dir = config_dir or settings.config_dir
+    backend = backend or settings.STORAGE_BACKEND
+    if max_entries is None:
+        max_entries = settings.CACHE_MAX_ENTRIES
+    if grace_seconds is None:
+        grace_seconds = settings.CACHE_EVICTION_GRACE_SECONDS
+
+    cache = BaseTokenCache()
+    now = time.time()
+    report = EvictionReport()
+    entries = []
+    for storage in scan(config_dir, backend):
+        if (eviction_time := _get_eviction_time(storage, cache, grace_seconds)) is None:
+            continue
+        if eviction_time <= now and _remove(storage, dry_run=dry_run):
+            report.expired.append(storage.name)
+        else:
+            entries.append(storage)
+
+    if max_entries is not None and len(entries) > max_entries:
+        entries.sort(key=lambda storage: storage.updated_at() or 0)
+        for storage in entries[: len(entries) - max_entries]:
+            if _remove(storage, dry_run=dry_run):
+                report.over_capacity.append(storage.name)
+
+    report.kept = len(entries) - len(report.over_capacity)
+    if backend == StorageBackend.file:
+        report.temp_files = _prune_temp_files(config_dir, now, dry_run=dry_run)
+    L.debug(
+        "Evicted %s expired and %s over capacity cache entries",
+        len(report.expired),
+        len(report.over_capacity),
+    )
+    return report
+
+
+_MAYBE_PRUNE_LOCK = threading.Lock()
+_NEXT_PRUNE_TIMES: dict[Path, float] = {}
+
+
+def maybe_prune_cache() -> EvictionReport | None:
+    """Run ``prune_cache`` if no process did in the last ``CACHE_EVICTION_INTERVAL_SECONDS``.
+
+    Called after the cache is written. Failures are logged, never raised.
+    """
+    if not (interval := settings.CACHE_EVICTION_INTERVAL_SECONDS):
+        return None
+    if not _MAYBE_PRUNE_LOCK.acquire(blocking=False):
+        return None
+    try:
+        config_dir = settings.config_dir
+        now = time.time()
+        if _NEXT_PRUNE_TIMES.get(config_dir, 0) > now:
+            return None
+        # the marker file records the last run of all the processes sharing the cache, the
+        # memory backend is not shared and must not touch the disk
+        shared = settings.STORAGE_BACKEND != StorageBackend.memory
+        marker = config_dir / MARKER_FILE_NAME
+        try:
+            last_run = marker.stat().st_mtime if shared else 0
+        except FileNotFoundError:
+            last_run = 0
+        if (next_run := last_run + interval) > now:
+            _NEXT_PRUNE_TIMES[config_dir] = next_run
+            return None
+        _NEXT_PRUNE_TIMES[config_dir] = now + interval
+        if shared:
+            marker.touch(mode=FILE_MODE)
+        return prune_cache(config_dir=config_dir)
+    except Exception:
+        L.exception("Failed to prune the token cache")
+        return None
+    finally:
+        _MAYBE_PRUNE_LOCK.release()
+
+
+def _get_eviction_time(
+    storage: TokenStorage, cache: BaseTokenCache, grace_seconds: int
+) -> float | None:
+    """Return when the entry should be evicted, or None if it does not exist anymore."""
+    try:
+        if (cached_token_info := storage.read()) is None:
+            return None
+        expiry_time = cache.get_expiry_time(cached_token_info)
+    except InvalidToken:
+        # encrypted with the key of another host, kept for the grace period after its write
+        L.debug("Cache entry %s was encrypted with another key", storage.name)
+        return (storage.updated_at() or 0) + grace_seconds
+    except ValueError:
+        L.debug("Cache entry %s cannot be read", storage.name)
+        return 0
+    if isinstance(cached_token_info, CachedAuthManagerTokenInfo):
+        return expiry_time + grace_seconds
+    return expiry_time
+
+
+def _prune_temp_files(config_dir: Path, now: float, *, dry_run: bool) -> list[str]:
+    """Remove the stale temporary files of the file backend, and return their names."""
+    removed = []
+    for path in scan_temp_files(config_dir):
+        try:
+            if path.stat().st_mtime > now - TEMP_FILE_MAX_AGE_SECONDS:
+                continue  # may still be written
+            if not dry_run:
+                path.unlink()
+        except FileNotFoundError:
+            continue  # renamed by its writer
+        removed.append(path.name)
+    return removed
+
+
+def _remove(storage: TokenStorage, *, dry_run: bool) -> bool:
+    """Remove the entry unless it is locked by a refresh, and return True if removed."""
+    if dry_run:
+        return True
+    # the timeout is also the lease length of the lease locks, try_acquire does not wait for it
+    lock = storage.lock(timeout=settings.STORAGE_LOCK_TIMEOUT)
+    try:
+        if not lock.try_acquire():
+            L.debug("Cache entry %s is being refreshed, not evicting it", storage.name)
+            return False
+        storage.purge()
+    finally:
+        lock.release()
+    return True
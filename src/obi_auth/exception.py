@@ -19,3 +19,11 @@ class LocalServerError(ObiAuthError):
 
 class ConfigError(ObiAuthError):
     """Configuration settings error."""
+
+
+class CircuitOpenError(ClientError):
+    """Service unavailable, the requests fail fast until it recovers."""
+
+
+class LoginRequiredError(ClientError):
+    """Interactive login needed, while the caller cannot run it."""
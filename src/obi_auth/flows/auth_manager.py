@@ -2,10 +2,11 @@
 
 import logging
 
-import httpx2
-
+from obi_auth import metrics, profiling
 from obi_auth.config import settings
 from obi_auth.exception import AuthFlowError
+from obi_auth.http_client import get_async_client, get_client
+from obi_auth.resilience import call_with_retry, call_with_retry_async
 from obi_auth.typedef import (
     AuthManagerTokenInfo,
     DeploymentEnvironment,
@@ -19,39 +20,94 @@ def auth_manager_mint_access_token(
     persistent_token_id: str, *, environment: DeploymentEnvironment
 ) -> AuthManagerTokenInfo:
     """Mint an auth-manager access token from a persistent token id."""
-    mint_data = (
-        httpx2.post(
-            url=settings.get_auth_manager_access_token_endpoint(override_env=environment),
-            headers={"id": persistent_token_id},
+    metrics.increment(metrics.MINTS, environment=_get_environment(environment))
+    with profiling.span("auth_manager.mint"):
+        response = call_with_retry(
+            _get_service_name(environment),
+            lambda: get_client().post(
+                url=settings.get_auth_manager_access_token_endpoint(override_env=environment),
+                headers={"id": persistent_token_id},
+            ),
         )
-        .raise_for_status()
-        .json()
-    )
+    return _parse_mint_data(response.json(), persistent_token_id)
 
-    if not (access_token := mint_data.get("data", {}).get("access_token")):
-        msg = f"AuthManager unexpected payload: {mint_data}"
-        L.error(msg)
-        raise AuthFlowError(msg)
 
-    return AuthManagerTokenInfo(access_token=access_token, persistent_token_id=persistent_token_id)
+async def auth_manager_mint_access_token_async(
+    persistent_token_id: str, *, environment: DeploymentEnvironment
+) -> AuthManagerTokenInfo:
+    """Mint an auth-manager access token from a persistent token id, asynchronously."""
+    metrics.increment(metrics.MINTS, environment=_get_environment(environment))
+    with profiling.span("auth_manager.mint"):
+        response = await call_with_retry_async(
+            _get_service_name(environment),
+            lambda: get_async_client().post(
+                url=settings.get_auth_manager_access_token_endpoint(override_env=environment),
+                headers={"id": persistent_token_id},
+            ),
+        )
+    return _parse_mint_data(response.json(), persistent_token_id)
 
 
 def auth_manager_exchange_token(
     token_info: KeycloakTokenInfo, *, environment: DeploymentEnvironment
 ) -> AuthManagerTokenInfo:
     """Exchange a Keycloak access token and mint an auth-manager access token."""
-    exchange_data = (
-        httpx2.post(
-            url=settings.get_auth_manager_token_exchange_endpoint(override_env=environment),
-            headers={"Authorization": f"Bearer {token_info.access_token}"},
+    metrics.increment(metrics.EXCHANGES, environment=_get_environment(environment))
+    with profiling.span("auth_manager.exchange"):
+        response = call_with_retry(
+            _get_service_name(environment),
+            lambda: get_client().post(
+                url=settings.get_auth_manager_token_exchange_endpoint(override_env=environment),
+                headers={"Authorization": f"Bearer {token_info.access_token}"},
+            ),
+            # each exchange creates a persistent token
+            idempotent=False,
+        )
+    token_id = _parse_exchange_data(response.json())
+    return auth_manager_mint_access_token(token_id, environment=environment)
+
+
+async def auth_manager_exchange_token_async(
+    token_info: KeycloakTokenInfo, *, environment: DeploymentEnvironment
+) -> AuthManagerTokenInfo:
+    """Exchange a Keycloak access token and mint an auth-manager access token, asynchronously."""
+    metrics.increment(metrics.EXCHANGES, environment=_get_environment(environment))
+    with profiling.span("auth_manager.exchange"):
+        response = await call_with_retry_async(
+            _get_service_name(environment),
+            lambda: get_async_client().post(
+                url=settings.get_auth_manager_token_exchange_endpoint(override_env=environment),
+                headers={"Authorization": f"Bearer {token_info.access_token}"},
+            ),
+            # each exchange creates a persistent token
+            idempotent=False,
         )
-        .raise_for_status()
-        .json()
-    )
+    token_id = _parse_exchange_data(response.json())
+    return await auth_manager_mint_access_token_async(token_id, environment=environment)
 
+
+def _get_service_name(environment: DeploymentEnvironment | None) -> str:
+    """Return the name of the circuit breaker of the auth-manager of an environment."""
+    return f"auth-manager-{_get_environment(environment)}"
+
+
+def _get_environment(environment: DeploymentEnvironment | None) -> str:
+    return str(environment or settings.KEYCLOAK_ENV)
+
+
+def _parse_mint_data(mint_data: dict, persistent_token_id: str) -> AuthManagerTokenInfo:
+    if not (access_token := mint_data.get("data", {}).get("access_token")):
+        msg = f"AuthManager unexpected payload: {mint_data}"
+        L.error(msg)
+        raise AuthFlowError(msg)
+
+    return AuthManagerTokenInfo(access_token=access_token, persistent_token_id=persistent_token_id)
+
+
+def _parse_exchange_data(exchange_data: dict) -> str:
     if not (token_id := exchange_data.get("data", {}).get("id")):
         msg = f"AuthManager unexpected payload: {exchange_data}"
         L.error(msg)
         raise AuthFlowError(msg)
 
-    return auth_manager_mint_access_token(token_id, environment=environment)
+    return token_id
@@ -1,18 +1,26 @@
 """Authorization flow module."""
 
+import asyncio
 import logging
-from time import sleep
+import threading
+import time
+from dataclasses import dataclass, field
 from typing import TypedDict
 
 import httpx2
 
+from obi_auth import metrics, profiling
 from obi_auth.config import settings
 from obi_auth.exception import AuthFlowError
+from obi_auth.http_client import get_async_client, get_client
 from obi_auth.typedef import AuthDeviceInfo, DeploymentEnvironment, KeycloakTokenInfo
 from obi_auth.util import is_running_in_notebook
 
 L = logging.getLogger(__name__)
 
+# RFC 8628: the polling interval must be increased by 5 seconds on slow_down
+SLOW_DOWN_INCREMENT = 5
+
 
 class AuthMessageData(TypedDict):
     """Data structure for authentication message content."""
@@ -33,19 +41,45 @@ AUTHENTICATION_MESSAGE_DATA: AuthMessageData = {
 }
 
 
-def daf_authenticate(*, environment: DeploymentEnvironment) -> KeycloakTokenInfo:
-    """Get access token using Device Authentication Flow."""
+def daf_authenticate(
+    *, environment: DeploymentEnvironment, cancel_event: threading.Event | None = None
+) -> KeycloakTokenInfo:
+    """Get access token using Device Authentication Flow.
+
+    Args:
+        environment: Target deployment environment.
+        cancel_event: Event set from another thread to stop waiting for the user.
+    """
+    metrics.increment(metrics.AUTHENTICATIONS, auth_mode="daf")
     device_info = _get_device_url_code(environment=environment)
 
     # Display user-friendly authentication prompt
     _display_auth_prompt(device_info)
 
-    if token := _poll_device_code_token(device_info, environment):
+    if token := _poll_device_code_token(device_info, environment, cancel_event=cancel_event):
+        print("\r   ✓ Authentication completed successfully!", flush=True)
+        return KeycloakTokenInfo(access_token=token)
+
+    print("\r   ✗ Authentication failed - timeout reached", flush=True)
+    raise AuthFlowError("Device code expired before the authentication was completed.")
+
+
+async def daf_authenticate_async(*, environment: DeploymentEnvironment) -> KeycloakTokenInfo:
+    """Get access token using Device Authentication Flow, without blocking the event loop.
+
+    Cancelling the task stops waiting for the user.
+    """
+    metrics.increment(metrics.AUTHENTICATIONS, auth_mode="daf")
+    device_info = await _get_device_url_code_async(environment=environment)
+
+    _display_auth_prompt(device_info)
+
+    if token := await _poll_device_code_token_async(device_info, environment):
         print("\r   ✓ Authentication completed successfully!", flush=True)
         return KeycloakTokenInfo(access_token=token)
 
     print("\r   ✗ Authentication failed - timeout reached", flush=True)
-    raise AuthFlowError("Polling using device code reached max retries.")
+    raise AuthFlowError("Device code expired before the authentication was completed.")
 
 
 def _get_device_url_code(
@@ -53,40 +87,164 @@ def _get_device_url_code(
     environment: DeploymentEnvironment,
 ) -> AuthDeviceInfo:
     url = settings.get_keycloak_device_auth_endpoint(environment)
-    response = httpx2.post(
-        url=url,
-        data={
-            "client_id": settings.KEYCLOAK_CLIENT_ID,
-        },
-    )
+    with profiling.span("daf.device_code"):
+        response = get_client().post(
+            url=url,
+            data={
+                "client_id": settings.KEYCLOAK_CLIENT_ID,
+            },
+        )
+    response.raise_for_status()
+    return AuthDeviceInfo.model_validate(response.json())
+
+
+async def _get_device_url_code_async(
+    *,
+    environment: DeploymentEnvironment,
+) -> AuthDeviceInfo:
+    url = settings.get_keycloak_device_auth_endpoint(environment)
+    with profiling.span("daf.device_code"):
+        response = await get_async_client().post(
+            url=url,
+            data={
+                "client_id": settings.KEYCLOAK_CLIENT_ID,
+            },
+        )
     response.raise_for_status()
     return AuthDeviceInfo.model_validate(response.json())
 
 
+class _SlowDown(Exception):
+    """The authorization server asks to poll less often."""
+
+
+class _Expired(Exception):
+    """The authorization server reports that the device code expired."""
+
+
+@dataclass
+class _DevicePoll:
+    """Adaptive polling schedule, until the device code expires."""
+
+    interval: float
+    deadline: float
+    started_at: float = field(default_factory=time.monotonic)
+    polls: int = 0
+
+    @classmethod
+    def start(cls, device_info: AuthDeviceInfo) -> "_DevicePoll":
+        now = time.monotonic()
+        return cls(
+            interval=device_info.interval, deadline=now + device_info.expires_in, started_at=now
+        )
+
+    def slow_down(self) -> None:
+        self.interval += SLOW_DOWN_INCREMENT
+        L.debug("Polling the device code token every %ss", self.interval)
+
+    def next_delay(self) -> float | None:
+        """Return the delay before the next poll, or None if the device code expired."""
+        if (remaining := self.deadline - time.monotonic()) <= 0:
+            return None
+        return min(self.interval, remaining)
+
+    def report(self, *, completed: bool) -> None:
+        L.info(
+            "Device authentication %s after %s polls in %.1fs",
+            "completed" if completed else "expired",
+            self.polls,
+            time.monotonic() - self.started_at,
+        )
+
+
 def _poll_device_code_token(
+    device_info: AuthDeviceInfo,
+    environment: DeploymentEnvironment,
+    *,
+    cancel_event: threading.Event | None = None,
+) -> str | None:
+    cancel_event = cancel_event or threading.Event()
+    poll = _DevicePoll.start(device_info)
+    while True:
+        poll.polls += 1
+        try:
+            if token := _get_device_code_token(device_info, environment):
+                poll.report(completed=True)
+                return token
+        except _SlowDown:
+            poll.slow_down()
+        except _Expired:
+            poll.report(completed=False)
+            return None
+        if (delay := poll.next_delay()) is None:
+            poll.report(completed=False)
+            return None
+        if cancel_event.wait(delay):
+            raise AuthFlowError("Device authentication was cancelled.")
+
+
+async def _poll_device_code_token_async(
     device_info: AuthDeviceInfo, environment: DeploymentEnvironment
 ) -> str | None:
-    for _ in range(device_info.max_retries):
-        if token := _get_device_code_token(device_info, environment):
-            return token
-        sleep(device_info.interval)
-    return None
+    poll = _DevicePoll.start(device_info)
+    while True:
+        poll.polls += 1
+        try:
+            if token := await _get_device_code_token_async(device_info, environment):
+                poll.report(completed=True)
+                return token
+        except _SlowDown:
+            poll.slow_down()
+        except _Expired:
+            poll.report(completed=False)
+            return None
+        if (delay := poll.next_delay()) is None:
+            poll.report(completed=False)
+            return None
+        await asyncio.sleep(delay)
 
 
 def _get_device_code_token(
     device_info: AuthDeviceInfo, environment: DeploymentEnvironment
 ) -> str | None:
     url = settings.get_keycloak_token_endpoint(environment)
-    response = httpx2.post(
-        url=url,
-        data={
-            "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
-            "client_id": settings.KEYCLOAK_CLIENT_ID,
-            "device_code": device_info.device_code,
-        },
-    )
-    if response.status_code == 400 and response.json()["error"] == "authorization_pending":
-        return None
+    with profiling.span("daf.poll"):
+        response = get_client().post(url=url, data=_device_code_token_data(device_info))
+    return _parse_device_code_token_response(response)
+
+
+async def _get_device_code_token_async(
+    device_info: AuthDeviceInfo, environment: DeploymentEnvironment
+) -> str | None:
+    url = settings.get_keycloak_token_endpoint(environment)
+    with profiling.span("daf.poll"):
+        response = await get_async_client().post(url=url, data=_device_code_token_data(device_info))
+    return _parse_device_code_token_response(response)
+
+
+def _device_code_token_data(device_info: AuthDeviceInfo) -> dict[str, str]:
+    return {
+        "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
+        "client_id": settings.KEYCLOAK_CLIENT_ID,
+        "device_code": device_info.device_code,
+    }
+
+
+def _parse_device_code_token_response(response: httpx2.Response) -> str | None:
+    """Return the access token, or None if the user did not complete the authentication yet.
+
+    Raises:
+        _SlowDown: If the authorization server asks to poll less often.
+        _Expired: If the device code expired, before the ``expires_in`` deadline.
+    """
+    if response.status_code == httpx2.codes.BAD_REQUEST:
+        match response.json().get("error"):
+            case "authorization_pending":
+                return None
+            case "slow_down":
+                raise _SlowDown
+            case "expired_token":
+                raise _Expired
     response.raise_for_status()
     data = response.json()
     return data["access_token"]
@@ -9,8 +9,9 @@ import secrets
 import urllib.parse
 import webbrowser
 
+from obi_auth import metrics, profiling
 from obi_auth.config import settings
-from obi_auth.request import exchange_code_for_token
+from obi_auth.request import exchange_code_for_token, exchange_code_for_token_async
 from obi_auth.server import AuthServer
 from obi_auth.typedef import DeploymentEnvironment, KeycloakTokenInfo
 
@@ -62,23 +63,54 @@ def _authorize(
     server: AuthServer, code_challenge: str, override_env: DeploymentEnvironment | None
 ) -> str:
     """Ask user to login in order to retrieve a code to exchange for a token."""
+    _open_auth_url(server, code_challenge, override_env)
+    with profiling.span("pkce.wait_for_code"):
+        return server.wait_for_code()
+
+
+async def _authorize_async(
+    server: AuthServer, code_challenge: str, override_env: DeploymentEnvironment | None
+) -> str:
+    """Ask user to login and wait for the code without blocking the event loop."""
+    _open_auth_url(server, code_challenge, override_env)
+    with profiling.span("pkce.wait_for_code"):
+        return await server.wait_for_code_async()
+
+
+def _open_auth_url(
+    server: AuthServer, code_challenge: str, override_env: DeploymentEnvironment | None
+) -> None:
+    """Open the authentication url in a browser, expecting a fresh OAuth state."""
     state = _generate_state()
     server.expect_state(state)
     auth_url = _build_auth_url(code_challenge, server.redirect_uri, state, override_env)
     L.info("Authentication url: %s", auth_url)
     webbrowser.open(auth_url)
-    return server.wait_for_code()
 
 
 def _exchange_code_for_token(
     code: str, redirect_uri: str, code_verifier: str, override_env: DeploymentEnvironment | None
 ) -> str:
-    response = exchange_code_for_token(
-        code=code,
-        redirect_uri=redirect_uri,
-        code_verifier=code_verifier,
-        override_env=override_env,
-    )
+    with profiling.span("pkce.exchange_code"):
+        response = exchange_code_for_token(
+            code=code,
+            redirect_uri=redirect_uri,
+            code_verifier=code_verifier,
+            override_env=override_env,
+        )
+    return response.json()["access_token"]
+
+
+async def _exchange_code_for_token_async(
+    code: str, redirect_uri: str, code_verifier: str, override_env: DeploymentEnvironment | None
+) -> str:
+    with profiling.span("pkce.exchange_code"):
+        response = await exchange_code_for_token_async(
+            code=code,
+            redirect_uri=redirect_uri,
+            code_verifier=code_verifier,
+            override_env=override_env,
+        )
     return response.json()["access_token"]
 
 
@@ -86,7 +118,21 @@ def pkce_authenticate(
     *, server: AuthServer, environment: DeploymentEnvironment | None = None
 ) -> KeycloakTokenInfo:
     """Get access token using the PCKE authentication flow."""
+    metrics.increment(metrics.AUTHENTICATIONS, auth_mode="pkce")
     code_verifier, code_challenge = _generate_pkce_pair()
     code = _authorize(server, code_challenge, environment)
     access_token = _exchange_code_for_token(code, server.redirect_uri, code_verifier, environment)
     return KeycloakTokenInfo(access_token=access_token)
+
+
+async def pkce_authenticate_async(
+    *, server: AuthServer, environment: DeploymentEnvironment | None = None
+) -> KeycloakTokenInfo:
+    """Get access token using the PCKE authentication flow, without blocking the event loop."""
+    metrics.increment(metrics.AUTHENTICATIONS, auth_mode="pkce")
+    code_verifier, code_challenge = _generate_pkce_pair()
+    code = await _authorize_async(server, code_challenge, environment)
+    access_token = await _exchange_code_for_token_async(
+        code, server.redirect_uri, code_verifier, environment
+    )
+    return KeycloakTokenInfo(access_token=access_token)
@@ -0,0 +1,220 @@
+"""Shared HTTP client module.
+
+All the requests go through a lazily created, process-wide client, so that consecutive
+requests to the same host reuse a kept-alive connection instead of doing a new TCP and TLS
+handshake each time.
+
+The default async clients, one per event loop, can only close their connections in their
+loop. Await ``aclose_clients`` before the loop is closed, for example at the end of the
+coroutine run by ``asyncio.run``. The clients replaced by ``set_async_client`` are closed in
+their loop, and the clients of the loops still open are closed at exit.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import TypeVar
+
+import httpx2
+
+from obi_auth import metrics
+from obi_auth.config import settings
+from obi_auth.exception import ConfigError
+
+L = logging.getLogger(__name__)
+
+ClientT = TypeVar("ClientT", httpx2.Client, httpx2.AsyncClient)
+
+
+class _ClientPool:
+    """Hold the default clients, the async ones per event loop, and the custom clients."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._custom_client: httpx2.Client | None = None
+        self._custom_async_client: httpx2.AsyncClient | None = None
+        self.reset()
+
+    def get_client(self) -> httpx2.Client:
+        with self._lock:
+            if self._custom_client is not None:
+                return self._custom_client
+            if self._client is None:
+                L.debug("Creating shared HTTP client")
+                self._client = _create_client(httpx2.Client)
+            return self._client
+
+    def get_async_client(self) -> httpx2.AsyncClient:
+        # async connections are bound to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._custom_async_client is not None:
+                return self._custom_async_client
+            # the clients of the closed loops cannot be closed anymore
+            for closed_loop in [item for item in self._async_clients if item.is_closed()]:
+                del self._async_clients[closed_loop]
+            if (client := self._async_clients.get(loop)) is None:
+                L.debug("Creating shared async HTTP client")
+                client = self._async_clients[loop] = _create_client(httpx2.AsyncClient)
+            return client
+
+    def pop_async_client(self, loop: asyncio.AbstractEventLoop) -> httpx2.AsyncClient | None:
+        with self._lock:
+            return self._async_clients.pop(loop, None)
+
+    def set_client(self, client: httpx2.Client | None) -> None:
+        with self._lock:
+            default_client, self._client = self._client, None
+            self._custom_client = client
+        if default_client is not None:
+            default_client.close()
+
+    def set_async_client(self, client: httpx2.AsyncClient | None) -> None:
+        with self._lock:
+            self._custom_async_client = client
+        self.close_async_clients()
+
+    def close_async_clients(self) -> None:
+        """Close the default async clients, each in its event loop."""
+        with self._lock:
+            default_clients, self._async_clients = self._async_clients, {}
+        for loop, client in default_clients.items():
+            _close_in_loop(loop, client)
+
+    def reset(self) -> None:
+        """Forget the default clients without closing them.
+
+        Used in forked children, where the connections of the clients belong to the parent.
+        """
+        self._lock = threading.Lock()
+        self._client: httpx2.Client | None = None
+        self._async_clients: dict[asyncio.AbstractEventLoop, httpx2.AsyncClient] = {}
+
+
+def _close_in_loop(loop: asyncio.AbstractEventLoop, client: httpx2.AsyncClient) -> None:
+    """Close an async client in its event loop, where its connections were opened."""
+    if loop.is_closed():
+        L.debug("Event loop closed, its async HTTP client cannot be closed anymore")
+    elif loop.is_running():
+        loop.call_soon_threadsafe(loop.create_task, client.aclose())
+    elif _is_in_event_loop():
+        L.debug("Event loop not running, its async HTTP client cannot be closed from another one")
+    else:
+        loop.run_until_complete(client.aclose())
+
+
+def _is_in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _create_client(client_class: type[ClientT]) -> ClientT:
+    limits = httpx2.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    try:
+        return client_class(
+            timeout=settings.HTTP_TIMEOUT,
+            limits=limits,
+            http2=settings.HTTP2,
+            event_hooks=_get_event_hooks(client_class),
+        )
+    except ImportError as e:
+        raise ConfigError(
+            "HTTP2 requires optional dependencies that are not installed.\n"
+            "Install them with:\n"
+            "  pip install 'obi-auth[http2]'"
+        ) from e
+
+
+def _get_event_hooks(client_class: type[httpx2.Client | httpx2.AsyncClient]) -> dict:
+    """Return the hooks measuring the duration of the requests."""
+    if client_class is httpx2.AsyncClient:
+        return {"request": [_start_timer_async], "response": [_record_duration_async]}
+    return {"request": [_start_timer], "response": [_record_duration]}
+
+
+def _start_timer(request: httpx2.Request) -> None:
+    request.extensions["obi_auth_start"] = time.perf_counter()
+
+
+def _record_duration(response: httpx2.Response) -> None:
+    request = response.request
+    if (start := request.extensions.get("obi_auth_start")) is not None:
+        metrics.observe(
+            metrics.HTTP_REQUEST_DURATION,
+            time.perf_counter() - start,
+            # the last path segment names the endpoint, without any identifier
+            endpoint=request.url.path.rsplit("/", 1)[-1],
+            status=str(response.status_code),
+        )
+
+
+async def _start_timer_async(request: httpx2.Request) -> None:
+    _start_timer(request)
+
+
+async def _record_duration_async(response: httpx2.Response) -> None:
+    _record_duration(response)
+
+
+_POOL = _ClientPool()
+
+
+def _reset_after_fork() -> None:
+    _POOL.reset()
+
+
+def _close_at_exit() -> None:
+    _POOL.close_async_clients()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(_close_at_exit)
+
+
+def get_client() -> httpx2.Client:
+    """Return the shared HTTP client, creating it on first use."""
+    return _POOL.get_client()
+
+
+def get_async_client() -> httpx2.AsyncClient:
+    """Return the shared async HTTP client of the running event loop."""
+    return _POOL.get_async_client()
+
+
+async def aclose_clients() -> None:
+    """Close the default async HTTP client of the running event loop, if it was created.
+
+    Await it before the loop is closed, as the client can only close its connections in its
+    loop. The next async requests in the loop create a new client.
+    """
+    if (client := _POOL.pop_async_client(asyncio.get_running_loop())) is not None:
+        L.debug("Closing shared async HTTP client")
+        await client.aclose()
+
+
+def set_client(client: httpx2.Client | None) -> None:
+    """Use a custom HTTP client for all the requests.
+
+    The default client is closed if it was created. Pass None to go back to a default
+    client, created from the settings on next use.
+    """
+    _POOL.set_client(client)
+
+
+def set_async_client(client: httpx2.AsyncClient | None) -> None:
+    """Use a custom async HTTP client for all the async requests, in any event loop.
+
+    The default clients are closed in their event loops. Pass None to go back to the default
+    clients, one per event loop.
+    """
+    _POOL.set_async_client(client)
@@ -0,0 +1,435 @@
+"""Inter-process locking module."""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Hashable
+from pathlib import Path
+from typing import Any, Self, TypeVar
+
+from obi_auth import profiling
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # advisory locks are not available on Windows
+
+L = logging.getLogger(__name__)
+
+LOCK_FILE_MODE = 0o600  # user only read/write
+POLL_INTERVAL = 0.05
+LEASE_MAX_POLL_INTERVAL = 1.0
+
+T = TypeVar("T")
+
+
+class BaseLock(ABC):
+    """Exclusive lock acquired by polling a non-blocking attempt until a timeout.
+
+    The lock is best effort: if it cannot be acquired within ``timeout`` seconds the
+    caller proceeds without it, so a stuck process never blocks the others forever. The wait
+    also stops without the lock once ``refreshed`` is True, when the holder that was waited
+    for reported that it refreshed the token.
+    """
+
+    def __init__(self, name: object, *, timeout: float) -> None:
+        """Initialize the lock from a name used in logs and the maximum wait in seconds."""
+        self._name = name
+        self._timeout = timeout
+        self._locked = False
+        self._refreshed = False
+
+    @property
+    def locked(self) -> bool:
+        """Return True if the lock is held by this instance."""
+        return self._locked
+
+    @property
+    def refreshed(self) -> bool:
+        """Return True if the wait stopped because the previous holder refreshed the token."""
+        return self._refreshed
+
+    def acquire(self) -> bool:
+        """Wait for the lock and return True if it was acquired before the timeout."""
+        deadline = time.monotonic() + self._timeout
+        attempt = 0
+        while not self._try_acquire():
+            if self._refreshed:
+                return False
+            if time.monotonic() >= deadline:
+                self._give_up()
+                return False
+            time.sleep(self._get_poll_interval(attempt))
+            attempt += 1
+        return True
+
+    def try_acquire(self) -> bool:
+        """Acquire the lock only if it is free, without waiting."""
+        return self._try_acquire()
+
+    async def acquire_async(self) -> bool:
+        """Wait for the lock without blocking the event loop, see ``acquire``.
+
+        The attempts, which may query a database or a server, run in a worker thread.
+        """
+        deadline = time.monotonic() + self._timeout
+        attempt = 0
+        try:
+            while not await _run_in_thread(self._try_acquire):
+                if self._refreshed:
+                    return False
+                if time.monotonic() >= deadline:
+                    await _run_in_thread(self._give_up)
+                    return False
+                await asyncio.sleep(self._get_poll_interval(attempt))
+                attempt += 1
+        except BaseException:
+            await _run_in_thread(self.release)
+            raise
+        return True
+
+    @abstractmethod
+    def release(self) -> None:
+        """Release the lock if held."""
+
+    @abstractmethod
+    def _try_acquire(self) -> bool:
+        """Try to acquire the lock without waiting, and return True on success."""
+
+    def _get_poll_interval(self, attempt: int) -> float:
+        """Return the seconds to wait before the next attempt."""
+        return POLL_INTERVAL
+
+    def _record_refresh(self) -> None:  # noqa: B027
+        """Record for the waiters that the holder refreshed the token, see ``refreshed``."""
+
+    def _give_up(self) -> None:
+        self.release()
+        L.warning(
+            "Timeout after %ss waiting for %s, continuing without the lock",
+            self._timeout,
+            self._name,
+        )
+
+    def __enter__(self) -> Self:
+        """Acquire the lock."""
+        with profiling.span("lock.acquire"):
+            self.acquire()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        """Release the lock, recording that the token was refreshed if the block succeeded."""
+        if exc_type is None:
+            self._record_refresh()
+        self.release()
+
+    async def __aenter__(self) -> Self:
+        """Acquire the lock without blocking the event loop."""
+        with profiling.span("lock.acquire"):
+            await self.acquire_async()
+        return self
+
+    async def __aexit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        """Release the lock in a worker thread, see ``__exit__``."""
+        await _run_in_thread(lambda: self.__exit__(exc_type))
+
+
+async def _run_in_thread(func: Callable[[], T]) -> T:
+    """Run func in a worker thread, letting it end before propagating a cancellation.
+
+    A lock acquired by an attempt still running after the cancellation would never be released.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+class FileLock(BaseLock):
+    """Advisory exclusive lock on a file, shared by all the processes of the host."""
+
+    def __init__(self, path: Path, *, timeout: float) -> None:
+        """Initialize the lock from the lock file path and the maximum wait in seconds."""
+        super().__init__(path, timeout=timeout)
+        self._path = path
+        self._fd: int | None = None
+
+    def release(self) -> None:
+        """Release the lock if held."""
+        if self._fd is None:
+            return
+        if self._locked:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)  # ty: ignore[unresolved-attribute]
+            self._locked = False
+        os.close(self._fd)
+        self._fd = None
+
+    def _try_acquire(self) -> bool:
+        if fcntl is None:  # pragma: no cover
+            return True  # proceed without the lock
+        if self._fd is None:
+            self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, LOCK_FILE_MODE)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self._locked = True
+        return True
+
+
+class LeaseLock(BaseLock):
+    """Exclusive lock stored as a row of the ``locks`` table of a SQLite database.
+
+    The row expires after ``timeout`` seconds, so the lease of a crashed process is taken
+    over by the next waiter instead of being held forever.
+    """
+
+    def __init__(
+        self, connect: Callable[[], sqlite3.Connection], name: str, *, timeout: float
+    ) -> None:
+        """Initialize the lock from a database connection factory and the lease name."""
+        super().__init__(name, timeout=timeout)
+        self._connect = connect
+        self._owner = uuid.uuid4().hex
+
+    def release(self) -> None:
+        """Release the lock if held."""
+        if not self._locked:
+            return
+        with (connection := self._connect()):
+            connection.execute(
+                "DELETE FROM locks WHERE name = ? AND owner = ?", (self._name, self._owner)
+            )
+        self._locked = False
+
+    def _try_acquire(self) -> bool:
+        now = time.time()
+        try:
+            with (connection := self._connect()):
+                cursor = connection.execute(
+                    "INSERT INTO locks (name, owner, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name) DO UPDATE "
+                    "SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE locks.expires_at <= ?",
+                    (self._name, self._owner, now + self._timeout, now),
+                )
+        except sqlite3.OperationalError as e:
+            # the database is busy, try again at the next poll
+            L.debug("Failed to acquire lease %s: %s", self._name, e)
+            return False
+        self._locked = cursor.rowcount == 1
+        return self._locked
+
+
+class LeaseFileLock(BaseLock):
+    """Exclusive lock held by creating a lease file, for filesystems shared by many hosts.
+
+    Advisory locks are unreliable on NFS or Lustre, so the lease file is created without
+    them: a unique temporary file holding the owner and the expiry of the lease is hard
+    linked to the lease path, which fails if the lease is held, and the link count of the
+    temporary file tells whether the link was created even if the reply of the server was
+    lost. The lease expires ``ttl`` seconds after it was last renewed, so the lease of a
+    crashed process is broken by the next waiter, assuming the clocks of the hosts are
+    roughly in sync. The holder renews it in a daemon thread, for refreshes taking longer than
+    ``ttl`` such as interactive logins.
+
+    The waiters back off with jitter between their attempts, so that thousands of processes
+    do not poll the shared filesystem at the same time. When the block of the holder exits
+    without error, the holder records it in a ``.done`` file next to the lease, and the
+    processes that waited for it stop waiting without taking the lease: ``refreshed`` is True
+    and they all read the refreshed token from the cache at the same time. If the holder
+    failed, they compete for the lease to refresh the token themselves.
+    """
+
+    def __init__(self, path: Path, *, timeout: float, ttl: float) -> None:
+        """Initialize the lock from the lease file path, the maximum wait and the lease TTL."""
+        super().__init__(path, timeout=timeout)
+        self._path = path
+        self._ttl = ttl
+        self._owner = uuid.uuid4().hex
+        self._tmp_path = path.with_name(f"{path.name}.{self._owner}")
+        self._holder: str | None = None
+        self._released = threading.Event()
+        self._renewer = threading.Thread(target=self._renew, args=(self._released,), daemon=True)
+
+    @staticmethod
+    def get_done_path(path: Path) -> Path:
+        """Return the path of the file recording the last holder that refreshed the token."""
+        return path.with_name(f"{path.name}.done")
+
+    def release(self) -> None:
+        """Release the lease if held."""
+        if not self._locked:
+            return
+        self._released.set()
+        self._renewer.join()
+        # delete the lease only if still owned, it may have expired and been broken
+        if (lease := self._read(self._path)) is not None and lease[0] == self._owner:
+            self._path.unlink(missing_ok=True)
+        self._locked = False
+
+    def _try_acquire(self) -> bool:
+        if (lease := self._read(self._path)) is None:
+            if self._holder is not None and self._read_done() == self._holder:
+                L.debug("Lease %s released by its holder after a refresh", self._path)
+                self._refreshed = True
+                return False
+            self._locked = self._create()
+        elif lease[1] <= time.time():
+            self._break(lease)
+            self._locked = self._create()
+        else:
+            self._holder = lease[0]
+        if self._locked:
+            self._released = threading.Event()
+            self._renewer = threading.Thread(
+                target=self._renew, args=(self._released,), daemon=True
+            )
+            self._renewer.start()
+        return self._locked
+
+    def _get_poll_interval(self, attempt: int) -> float:
+        interval = min(LEASE_MAX_POLL_INTERVAL, POLL_INTERVAL * 2**attempt)
+        return interval * random.uniform(0.5, 1)  # noqa: S311
+
+    @staticmethod
+    def _write(path: Path, data: dict[str, Any]) -> None:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, LOCK_FILE_MODE)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+
+    def _create(self) -> bool:
+        self._write(self._tmp_path, {"owner": self._owner, "expires_at": time.time() + self._ttl})
+        try:
+            with contextlib.suppress(FileExistsError):
+                os.link(self._tmp_path, self._path)
+            return self._tmp_path.stat().st_nlink == 2
+        finally:
+            self._tmp_path.unlink()
+
+    def _renew(self, released: threading.Event) -> None:
+        while not released.wait(self._ttl / 3):
+            try:
+                if (lease := self._read(self._path)) is None or lease[0] != self._owner:
+                    L.warning("Lease %s was lost, it expired before being renewed", self._path)
+                    return
+                data = {"owner": self._owner, "expires_at": time.time() + self._ttl}
+                self._write(self._tmp_path, data)
+                self._tmp_path.replace(self._path)
+            except OSError as e:
+                L.warning("Failed to renew lease %s: %s", self._path, e)
+
+    def _record_refresh(self) -> None:
+        if not self._locked:
+            return
+        # another temporary file than the one of the renewals, which may still run
+        done_path = self.get_done_path(self._path)
+        tmp_path = done_path.with_name(f"{done_path.name}.{self._owner}")
+        try:
+            self._write(tmp_path, {"owner": self._owner})
+            tmp_path.replace(done_path)
+        except OSError as e:
+            # the waiters compete for the lease instead
+            L.warning("Failed to record the refresh of lease %s: %s", self._path, e)
+
+    def _read_done(self) -> str | None:
+        try:
+            return json.loads(self.get_done_path(self._path).read_bytes())["owner"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _break(self, lease: tuple[str, float]) -> None:
+        # rename the expired lease away, and check that it is still the one that expired
+        broken_path = self._path.with_name(f"{self._path.name}.{self._owner}.broken")
+        try:
+            self._path.rename(broken_path)
+        except FileNotFoundError:
+            return  # released, or broken by another waiter
+        if self._read(broken_path) != lease:
+            # another waiter broke it and took a new lease in between, put it back
+            with contextlib.suppress(FileExistsError):
+                os.link(broken_path, self._path)
+        else:
+            L.warning("Broke the lease %s, expired since %.1fs", self._path, time.time() - lease[1])
+        broken_path.unlink()
+
+    @staticmethod
+    def _read(path: Path) -> tuple[str, float] | None:
+        """Return the owner and expiry of a lease, expired if corrupted, or None if missing."""
+        try:
+            data = json.loads(path.read_bytes())
+            return data["owner"], data["expires_at"]
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            return "", 0.0
+
+
+_THREAD_LOCKS: dict[Hashable, threading.Lock] = {}
+_THREAD_LOCKS_LOCK = threading.Lock()
+
+
+class ThreadLock(BaseLock):
+    """Exclusive lock shared by the threads of the process, for the entries kept in memory."""
+
+    def __init__(self, name: Hashable, *, timeout: float) -> None:
+        """Initialize the lock from its name and the maximum wait in seconds."""
+        super().__init__(name, timeout=timeout)
+        with _THREAD_LOCKS_LOCK:
+            self._lock = _THREAD_LOCKS.setdefault(name, threading.Lock())
+
+    def release(self) -> None:
+        """Release the lock if held."""
+        if self._locked:
+            self._lock.release()
+            self._locked = False
+
+    def _try_acquire(self) -> bool:
+        self._locked = self._lock.acquire(blocking=False)
+        return self._locked
+
+
+class RedisLock(BaseLock):
+    """Exclusive lock stored as a key of a Redis-compatible server, shared by all its clients.
+
+    The key expires after ``timeout`` seconds, like the rows of ``LeaseLock``.
+    """
+
+    def __init__(self, client: Any, name: str, *, timeout: float) -> None:
+        """Initialize the lock from a Redis client and the key name."""
+        super().__init__(name, timeout=timeout)
+        self._client = client
+        self._owner = uuid.uuid4().hex
+
+    def release(self) -> None:
+        """Release the lock if held."""
+        if not self._locked:
+            return
+        from redis.exceptions import WatchError  # ty: ignore[unresolved-import]
+
+        # delete the key only if still owned, it may have expired and been taken over
+        with self._client.pipeline() as pipeline:
+            try:
+                pipeline.watch(self._name)
+                if pipeline.get(self._name) == self._owner.encode():
+                    pipeline.multi()
+                    pipeline.delete(self._name)
+                    pipeline.execute()
+            except WatchError:
+                L.debug("Lock %s was taken over while releasing it", self._name)
+        self._locked = False
+
+    def _try_acquire(self) -> bool:
+        expiry_ms = max(1, round(self._timeout * 1000))
+        self._locked = bool(self._client.set(self._name, self._owner, nx=True, px=expiry_ms))
+        return self._locked
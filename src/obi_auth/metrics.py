@@ -0,0 +1,235 @@
+"""Metrics of the token acquisition.
+
+The library counts the cache lookups, mints, exchanges and authentications, and measures the
+disk reads, decryptions and HTTP requests, through the recorder set with ``set_recorder``.
+Nothing is recorded by default.
+
+OpenTelemetry and Prometheus recorders are provided, requiring the ``opentelemetry`` and
+``prometheus`` extras::
+
+    from obi_auth.metrics import PrometheusMetrics, set_recorder
+
+    set_recorder(PrometheusMetrics())
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Any, Literal, Protocol, Self
+
+from obi_auth.exception import ConfigError
+
+
+@dataclass(frozen=True)
+class Metric:
+    """Definition of a counter or histogram, histograms being measured in seconds."""
+
+    name: str
+    kind: Literal["counter", "histogram"]
+    description: str
+    labels: tuple[str, ...] = ()
+
+
+CACHE_LOOKUPS = Metric(
+    "obi_auth_cache_lookups",
+    "counter",
+    "Token cache lookups, by cache (memory or disk) and result (hit or miss).",
+    ("cache", "result"),
+)
+MINTS = Metric(
+    "obi_auth_mints",
+    "counter",
+    "Auth-manager access tokens minted from a persistent token id.",
+    ("environment",),
+)
+EXCHANGES = Metric(
+    "obi_auth_exchanges",
+    "counter",
+    "Keycloak tokens exchanged for an auth-manager persistent token id.",
+    ("environment",),
+)
+AUTHENTICATIONS = Metric(
+    "obi_auth_authentications",
+    "counter",
+    "Interactive Keycloak authentications.",
+    ("auth_mode",),
+)
+STORAGE_READ_DURATION = Metric(
+    "obi_auth_storage_read_duration_seconds",
+    "histogram",
+    "Duration of the reads of a cached token.",
+    ("backend",),
+)
+DECRYPT_DURATION = Metric(
+    "obi_auth_decrypt_duration_seconds",
+    "histogram",
+    "Duration of the decryptions of a cached token.",
+)
+HTTP_REQUEST_DURATION = Metric(
+    "obi_auth_http_request_duration_seconds",
+    "histogram",
+    "Duration of the HTTP requests until the response headers, by endpoint and status.",
+    ("endpoint", "status"),
+)
+
+METRICS = (
+    CACHE_LOOKUPS,
+    MINTS,
+    EXCHANGES,
+    AUTHENTICATIONS,
+    STORAGE_READ_DURATION,
+    DECRYPT_DURATION,
+    HTTP_REQUEST_DURATION,
+)
+
+
+class MetricsRecorder(Protocol):
+    """Backend receiving the metrics."""
+
+    def increment(self, metric: Metric, labels: dict[str, str]) -> None:
+        """Increment a counter by one."""
+
+    def observe(self, metric: Metric, value: float, labels: dict[str, str]) -> None:
+        """Record a value in a histogram."""
+
+
+class NoopMetrics:
+    """Recorder discarding the metrics."""
+
+    def increment(self, metric: Metric, labels: dict[str, str]) -> None:
+        """Discard the increment."""
+
+    def observe(self, metric: Metric, value: float, labels: dict[str, str]) -> None:
+        """Discard the value."""
+
+
+class OpenTelemetryMetrics:
+    """Recorder sending the metrics to OpenTelemetry instruments."""
+
+    def __init__(self, meter: Any = None):
+        """Create the instruments, with the ``obi_auth`` meter of the global provider by default.
+
+        Raises:
+            ConfigError: If the ``opentelemetry`` extra is not installed.
+        """
+        try:
+            from opentelemetry import metrics as otel_metrics  # ty: ignore[unresolved-import]
+        except ImportError as e:
+            raise ConfigError(
+                "OpenTelemetry metrics require optional dependencies that are not installed.\n"
+                "Install them with:\n"
+                "  pip install 'obi-auth[opentelemetry]'"
+            ) from e
+
+        meter = meter or otel_metrics.get_meter("obi_auth")
+        self._instruments: dict[str, Any] = {
+            metric.name: (
+                meter.create_counter(metric.name, description=metric.description)
+                if metric.kind == "counter"
+                else meter.create_histogram(metric.name, unit="s", description=metric.description)
+            )
+            for metric in METRICS
+        }
+
+    def increment(self, metric: Metric, labels: dict[str, str]) -> None:
+        """Add one to the counter."""
+        self._instruments[metric.name].add(1, attributes=labels)
+
+    def observe(self, metric: Metric, value: float, labels: dict[str, str]) -> None:
+        """Record a value in the histogram."""
+        self._instruments[metric.name].record(value, attributes=labels)
+
+
+class PrometheusMetrics:
+    """Recorder updating Prometheus metrics.
+
+    The metrics are registered when the recorder is created, so create a single recorder per
+    registry.
+    """
+
+    def __init__(self, registry: Any = None):
+        """Register the metrics, in the default registry by default.
+
+        Raises:
+            ConfigError: If the ``prometheus`` extra is not installed.
+        """
+        try:
+            import prometheus_client  # ty: ignore[unresolved-import]
+        except ImportError as e:
+            raise ConfigError(
+                "Prometheus metrics require optional dependencies that are not installed.\n"
+                "Install them with:\n"
+                "  pip install 'obi-auth[prometheus]'"
+            ) from e
+
+        registry = registry or prometheus_client.REGISTRY
+        self._metrics: dict[str, Any] = {
+            metric.name: (
+                prometheus_client.Counter
+                if metric.kind == "counter"
+                else prometheus_client.Histogram
+            )(metric.name, metric.description, metric.labels, registry=registry)
+            for metric in METRICS
+        }
+
+    def increment(self, metric: Metric, labels: dict[str, str]) -> None:
+        """Increment the counter."""
+        self._get(metric, labels).inc()
+
+    def observe(self, metric: Metric, value: float, labels: dict[str, str]) -> None:
+        """Observe a value in the histogram."""
+        self._get(metric, labels).observe(value)
+
+    def _get(self, metric: Metric, labels: dict[str, str]) -> Any:
+        prometheus_metric = self._metrics[metric.name]
+        return prometheus_metric.labels(**labels) if labels else prometheus_metric
+
+
+_NOOP = NoopMetrics()
+_RECORDER: MetricsRecorder = _NOOP
+
+
+def set_recorder(recorder: MetricsRecorder | None) -> None:
+    """Send the metrics to a recorder, or discard them if None."""
+    global _RECORDER
+    _RECORDER = recorder or _NOOP
+
+
+def get_recorder() -> MetricsRecorder:
+    """Return the current recorder."""
+    return _RECORDER
+
+
+def increment(metric: Metric, **labels: str) -> None:
+    """Increment a counter by one."""
+    if _RECORDER is not _NOOP:
+        _RECORDER.increment(metric, labels)
+
+
+def observe(metric: Metric, value: float, **labels: str) -> None:
+    """Record a duration in seconds in a histogram."""
+    if _RECORDER is not _NOOP:
+        _RECORDER.observe(metric, value, labels)
+
+
+def timer(metric: Metric, **labels: str) -> "_Timer":
+    """Return a context manager recording its duration in a histogram."""
+    return _Timer(metric, labels)
+
+
+class _Timer:
+    """Context manager recording its duration in a histogram."""
+
+    __slots__ = ("_labels", "_metric", "_start")
+
+    def __init__(self, metric: Metric, labels: dict[str, str]):
+        self._metric = metric
+        self._labels = labels
+        self._start = 0.0
+
+    def __enter__(self) -> Self:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        # recorded even if the block raised
+        observe(self._metric, time.perf_counter() - self._start, **self._labels)
@@ -0,0 +1,139 @@
+"""Per-phase timing of the token acquisition.
+
+When the ``PROFILE`` setting is enabled (``OBI_AUTH_PROFILE=1``), each ``get_token`` call is
+traced and the duration of its phases is logged at the end of the call, for example::
+
+    get_token took 1523.4ms: {"name": "get_token", "duration_ms": 1523.4, "spans": [
+        {"name": "storage.read", "depth": 1, "start_ms": 0.3, "duration_ms": 0.2}, ...]}
+
+The log record holds the same breakdown in its ``profile`` attribute, for structured logging.
+When disabled, a span is a context variable lookup.
+"""
+
+import contextvars
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from obi_auth.config import settings
+
+L = logging.getLogger(__name__)
+
+
+@dataclass
+class _Trace:
+    name: str
+    attributes: dict[str, Any]
+    start: float = field(default_factory=time.perf_counter)
+    spans: list[dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self, duration: float) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            **self.attributes,
+            "duration_ms": _to_ms(duration),
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+        }
+
+
+@dataclass(frozen=True)
+class _Context:
+    trace: _Trace
+    depth: int
+
+
+_CURRENT: contextvars.ContextVar[_Context | None] = contextvars.ContextVar(
+    "obi_auth_profile", default=None
+)
+
+
+class _Span:
+    """Context manager recording a phase in the current trace."""
+
+    __slots__ = ("_context", "_name", "_start", "_token")
+
+    def __init__(self, name: str, context: _Context):
+        self._name = name
+        self._context = context
+
+    def __enter__(self) -> None:
+        self._token = _CURRENT.set(self._context)
+        self._start = time.perf_counter()
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        end = time.perf_counter()
+        _CURRENT.reset(self._token)
+        trace = self._context.trace
+        span = {
+            "name": self._name,
+            "depth": self._context.depth,
+            "start_ms": _to_ms(self._start - trace.start),
+            "duration_ms": _to_ms(end - self._start),
+        }
+        if exc_type is not None:
+            span["error"] = exc_type.__name__
+        # appending is atomic, spans may end in the threads of asyncio.to_thread
+        trace.spans.append(span)
+
+
+class _RootSpan:
+    """Context manager tracing a call, and logging its breakdown."""
+
+    __slots__ = ("_token", "_trace")
+
+    def __init__(self, name: str, attributes: dict[str, Any]):
+        self._trace = _Trace(name, attributes)
+
+    def __enter__(self) -> None:
+        self._token = _CURRENT.set(_Context(self._trace, depth=0))
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        _CURRENT.reset(self._token)
+        profile = self._trace.to_dict(time.perf_counter() - self._trace.start)
+        if exc_type is not None:
+            profile["error"] = exc_type.__name__
+        L.info(
+            "%s took %.1fms: %s",
+            profile["name"],
+            profile["duration_ms"],
+            json.dumps(profile, default=str),
+            extra={"profile": profile},
+        )
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def trace(name: str, **attributes: Any) -> _RootSpan | _Span | _NoopSpan:
+    """Return a context manager tracing a call if the ``PROFILE`` setting is enabled.
+
+    Inside another trace, the call is recorded as a span of that trace instead.
+    """
+    if _CURRENT.get() is not None:
+        return span(name)
+    if not settings.PROFILE:
+        return _NOOP_SPAN
+    return _RootSpan(name, attributes)
+
+
+def span(name: str) -> _Span | _NoopSpan:
+    """Return a context manager recording a phase of the current trace, if any."""
+    if (context := _CURRENT.get()) is None:
+        return _NOOP_SPAN
+    return _Span(name, _Context(context.trace, context.depth + 1))
+
+
+def _to_ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
@@ -0,0 +1,90 @@
+"""Binary format of the cached token entries.
+
+A record is a fixed header followed by the length-prefixed Fernet tokens of the entry::
+
+    magic (4s) | version (B) | type tag (B) | flags (B) | padding | ttl (q) | iat (q) | exp (q)
+    length (I) | token
+    length (I) | persistent_token_id  (auth-manager entries only)
+
+Integers are little-endian, and the flags tell whether ``iat`` and ``exp`` are set. The entries
+written as JSON by older versions are still read. The file backend writes the records to their
+own files, as the older versions fail to read anything else than JSON.
+"""
+
+import struct
+
+from pydantic import TypeAdapter
+
+from obi_auth.typedef import CachedAuthManagerTokenInfo, CachedTokenInfo
+
+MAGIC = b"OBIT"
+VERSION = 1
+
+StoredCachedTokenInfo = CachedAuthManagerTokenInfo | CachedTokenInfo
+
+_HEADER = struct.Struct("<4sBBBxqqq")
+_LENGTH = struct.Struct("<I")
+_HAS_IAT = 0b01
+_HAS_EXP = 0b10
+
+# type tag -> model and names of its length-prefixed fields
+_RECORD_TYPES: dict[int, tuple[type[StoredCachedTokenInfo], tuple[str, ...]]] = {
+    1: (CachedTokenInfo, ("token",)),
+    2: (CachedAuthManagerTokenInfo, ("token", "persistent_token_id")),
+}
+_TAGS = {model: tag for tag, (model, _) in _RECORD_TYPES.items()}
+# validating the model of the tag is faster than model_construct
+_ADAPTERS: dict[int, TypeAdapter] = {
+    tag: TypeAdapter(model) for tag, (model, _) in _RECORD_TYPES.items()
+}
+
+_STORED_CACHED_TOKEN_ADAPTER = TypeAdapter(StoredCachedTokenInfo)
+
+
+def encode_record(data: StoredCachedTokenInfo) -> bytes:
+    """Return the binary record of a cached token entry."""
+    tag = _TAGS[type(data)]
+    flags = (_HAS_IAT if data.iat is not None else 0) | (_HAS_EXP if data.exp is not None else 0)
+    parts = [_HEADER.pack(MAGIC, VERSION, tag, flags, data.ttl, data.iat or 0, data.exp or 0)]
+    for name in _RECORD_TYPES[tag][1]:
+        value = getattr(data, name)
+        parts += (_LENGTH.pack(len(value)), value)
+    return b"".join(parts)
+
+
+def decode_record(data: bytes | str) -> StoredCachedTokenInfo:
+    """Return the cached token entry of a binary record, or of a JSON one.
+
+    Raises:
+        ValueError: If the record is corrupted or of an unsupported version.
+    """
+    if isinstance(data, str) or not data.startswith(MAGIC):
+        return _STORED_CACHED_TOKEN_ADAPTER.validate_json(data)
+
+    try:
+        _, version, tag, flags, ttl, iat, exp = _HEADER.unpack_from(data)
+    except struct.error as e:
+        raise ValueError("Truncated cache record header") from e
+    if version != VERSION:
+        raise ValueError(f"Unsupported cache record version {version}")
+    if (record_type := _RECORD_TYPES.get(tag)) is None:
+        raise ValueError(f"Unknown cache record type {tag}")
+    _, names = record_type
+
+    values = {
+        "ttl": ttl,
+        "iat": iat if flags & _HAS_IAT else None,
+        "exp": exp if flags & _HAS_EXP else None,
+    }
+    offset = _HEADER.size
+    for name in names:
+        try:
+            (length,) = _LENGTH.unpack_from(data, offset)
+        except struct.error as e:
+            raise ValueError("Truncated cache record") from e
+        offset += _LENGTH.size
+        values[name] = data[offset : offset + length]
+        offset += length
+    if offset != len(data):
+        raise ValueError("Truncated cache record")
+    return _ADAPTERS[tag].validate_python(values)
@@ -0,0 +1,84 @@
+"""Background token refresh module."""
+
+import logging
+import threading
+import time
+from collections.abc import Callable, Hashable
+
+L = logging.getLogger(__name__)
+
+MAX_WAIT_SECONDS = 60.0
+
+RefreshCallback = Callable[[], float | None]
+
+
+class RefreshScheduler:
+    """Run refresh callbacks at their due time in a daemon thread.
+
+    Each callback returns the timestamp at which it should run again, or None to be
+    unscheduled. Exceptions are logged and also unschedule the callback, leaving the
+    refresh to the caller of ``get_token``.
+    """
+
+    def __init__(self):
+        """Initialize the scheduler without starting the thread."""
+        self._jobs: dict[Hashable, tuple[float, RefreshCallback]] = {}
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+
+    def schedule(self, key: Hashable, due: float, callback: RefreshCallback) -> None:
+        """Schedule ``callback`` to run at the ``due`` UTC timestamp, replacing any job for key."""
+        with self._condition:
+            self._jobs[key] = (due, callback)
+            self._stopped = False
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="obi-auth-refresh", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self, key: Hashable) -> None:
+        """Unschedule the job for key, if any."""
+        with self._condition:
+            self._jobs.pop(key, None)
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Unschedule all the jobs and stop the thread."""
+        with self._condition:
+            self._jobs.clear()
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while job := self._wait_for_next_job():
+            key, callback = job
+            try:
+                next_due = callback()
+            except Exception:
+                L.exception("Background refresh of %s failed", key)
+                next_due = None
+            with self._condition:
+                # leave the job alone if it was cancelled or replaced while running
+                if (current := self._jobs.get(key)) is None or current[1] is not callback:
+                    continue
+                if next_due is None:
+                    del self._jobs[key]
+                else:
+                    self._jobs[key] = (next_due, callback)
+
+    def _wait_for_next_job(self) -> tuple[Hashable, RefreshCallback] | None:
+        with self._condition:
+            while not self._stopped:
+                if not self._jobs:
+                    self._condition.wait()
+                    continue
+                key, (due, callback) = min(self._jobs.items(), key=lambda item: item[1][0])
+                if (delay := due - time.time()) <= 0:
+                    return key, callback
+                self._condition.wait(min(delay, MAX_WAIT_SECONDS))
+        return None
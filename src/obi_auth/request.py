@@ -1,8 +1,7 @@
 """Requests module."""
 
-import httpx2
-
 from obi_auth.config import settings
+from obi_auth.http_client import get_async_client, get_client
 from obi_auth.typedef import DeploymentEnvironment
 
 
@@ -15,15 +14,26 @@ def exchange_code_for_token(
 ):
     """Exhange authentication code for acces token response."""
     url = settings.get_keycloak_token_endpoint(override_env)
-    response = httpx2.post(
+    response = get_client().post(
+        url=url,
+        data=_code_exchange_data(code, redirect_uri, code_verifier),
+    )
+    response.raise_for_status()
+    return response
+
+
+async def exchange_code_for_token_async(
+    *,
+    code: str,
+    redirect_uri: str,
+    code_verifier: str,
+    override_env: DeploymentEnvironment | None = None,
+):
+    """Exhange authentication code for acces token response, asynchronously."""
+    url = settings.get_keycloak_token_endpoint(override_env)
+    response = await get_async_client().post(
         url=url,
-        data={
-            "grant_type": "authorization_code",
-            "code": code,
-            "client_id": settings.KEYCLOAK_CLIENT_ID,
-            "redirect_uri": redirect_uri,
-            "code_verifier": code_verifier,
-        },
+        data=_code_exchange_data(code, redirect_uri, code_verifier),
     )
     response.raise_for_status()
     return response
@@ -35,6 +45,27 @@ def user_info(
 ):
     """Request user info with a valid token."""
     url = settings.get_keycloak_user_info_endpoint(environment)
-    response = httpx2.post(url, headers={"Authorization": f"Bearer {token}"})
+    response = get_client().post(url, headers={"Authorization": f"Bearer {token}"})
+    response.raise_for_status()
+    return response
+
+
+async def user_info_async(
+    token: str,
+    environment: DeploymentEnvironment | None = None,
+):
+    """Request user info with a valid token, asynchronously."""
+    url = settings.get_keycloak_user_info_endpoint(environment)
+    response = await get_async_client().post(url, headers={"Authorization": f"Bearer {token}"})
     response.raise_for_status()
     return response
+
+
+def _code_exchange_data(code: str, redirect_uri: str, code_verifier: str) -> dict[str, str]:
+    return {
+        "grant_type": "authorization_code",
+        "code": code,
+        "client_id": settings.KEYCLOAK_CLIENT_ID,
+        "redirect_uri": redirect_uri,
+        "code_verifier": code_verifier,
+    }
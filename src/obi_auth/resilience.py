@@ -0,0 +1,269 @@
+"""Retries and circuit breaking of the requests to auth-manager.
+
+Transient failures (connection errors, 429, 502, 503 and 504) are retried with a bounded
+exponential backoff and full jitter, or after the delay of the ``Retry-After`` header, so
+that the callers failing together do not retry together. The requests that are not
+idempotent are only retried after the failures to connect, as the other failures may happen
+after the service handled them.
+
+A process-wide circuit breaker per service opens after consecutive failed calls and then
+fails fast with ``CircuitOpenError``, until a single trial call succeeds after a cool down.
+
+Retries and state changes are logged and sent to the listeners added with ``add_listener``.
+"""
+
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from enum import StrEnum, auto
+
+import httpx2
+
+from obi_auth.config import settings
+from obi_auth.exception import CircuitOpenError
+
+L = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = frozenset(
+    {
+        httpx2.codes.TOO_MANY_REQUESTS,
+        httpx2.codes.BAD_GATEWAY,
+        httpx2.codes.SERVICE_UNAVAILABLE,
+        httpx2.codes.GATEWAY_TIMEOUT,
+    }
+)
+# raised before the request is sent, so retrying it cannot repeat its effects
+CONNECT_ERRORS = (httpx2.ConnectError, httpx2.ConnectTimeout, httpx2.PoolTimeout)
+
+
+class CircuitState(StrEnum):
+    """State of a circuit breaker."""
+
+    closed = auto()
+    open = auto()
+    half_open = auto()
+
+
+@dataclass(frozen=True)
+class ResilienceEvent:
+    """Retry of a request, or state change of a circuit breaker.
+
+    ``attempt`` and ``delay`` are set for retries, ``state`` for state changes.
+    """
+
+    kind: str
+    name: str
+    attempt: int | None = None
+    delay: float | None = None
+    state: CircuitState | None = None
+
+
+Listener = Callable[[ResilienceEvent], None]
+
+_LISTENERS: list[Listener] = []
+
+
+def add_listener(listener: Listener) -> None:
+    """Call ``listener`` with each retry and circuit breaker state change."""
+    _LISTENERS.append(listener)
+
+
+def remove_listener(listener: Listener) -> None:
+    """Stop calling a listener added with ``add_listener``."""
+    _LISTENERS.remove(listener)
+
+
+def _emit(event: ResilienceEvent) -> None:
+    for listener in list(_LISTENERS):
+        try:
+            listener(event)
+        except Exception:
+            L.exception("Resilience listener failed")
+
+
+class CircuitBreaker:
+    """Fail fast while a service keeps failing.
+
+    The circuit opens after ``AUTH_MANAGER_CIRCUIT_BREAKER_THRESHOLD`` consecutive failed
+    calls. After ``AUTH_MANAGER_CIRCUIT_BREAKER_RESET_SECONDS``, a single trial call is let
+    through: the circuit closes if it succeeds, and opens again if it fails.
+    """
+
+    def __init__(self, name: str):
+        """Initialize a closed circuit breaker."""
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = CircuitState.closed
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> CircuitState:
+        """Return the current state."""
+        return self._state
+
+    def before_call(self) -> None:
+        """Check that a call can be made.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial in progress.
+        """
+        with self._lock:
+            if self._state == CircuitState.closed:
+                return
+            now = time.monotonic()
+            if now >= self._opened_at + settings.AUTH_MANAGER_CIRCUIT_BREAKER_RESET_SECONDS:
+                # let a single trial through per cool down, even if the last one never ended
+                self._opened_at = now
+                if self._state == CircuitState.open:
+                    self._set_state(CircuitState.half_open)
+                return
+        raise CircuitOpenError(f"{self.name} is unavailable, not retrying for now.")
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        with self._lock:
+            self._failures = 0
+            if self._state != CircuitState.closed:
+                self._set_state(CircuitState.closed)
+
+    def record_failure(self) -> None:
+        """Count a failed call, and open the circuit above the threshold."""
+        with self._lock:
+            self._failures += 1
+            threshold = settings.AUTH_MANAGER_CIRCUIT_BREAKER_THRESHOLD
+            if self._state == CircuitState.half_open or (threshold and self._failures >= threshold):
+                self._opened_at = time.monotonic()
+                if self._state != CircuitState.open:
+                    self._set_state(CircuitState.open)
+
+    def _set_state(self, state: CircuitState) -> None:
+        log = L.warning if state == CircuitState.open else L.info
+        log("Circuit breaker of %s is now %s", self.name, state)
+        self._state = state
+        _emit(ResilienceEvent(kind="state_change", name=self.name, state=state))
+
+
+_BREAKERS: dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker of a service."""
+    with _BREAKERS_LOCK:
+        if (breaker := _BREAKERS.get(name)) is None:
+            breaker = _BREAKERS[name] = CircuitBreaker(name)
+        return breaker
+
+
+def call_with_retry(
+    name: str, send: Callable[[], httpx2.Response], *, idempotent: bool = True
+) -> httpx2.Response:
+    """Send a request, retrying the transient failures.
+
+    Args:
+        name: Name of the service, identifying its circuit breaker.
+        send: Function sending the request.
+        idempotent: Whether the request can be repeated safely, else only the failures to
+            connect are retried.
+
+    Returns:
+        The successful response.
+
+    Raises:
+        CircuitOpenError: If the circuit breaker of the service is open.
+        httpx2.HTTPStatusError: If the last response is an error.
+        httpx2.TransportError: If the last attempt failed to connect or read.
+    """
+    breaker = get_circuit_breaker(name)
+    breaker.before_call()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            response = send()
+        except httpx2.TransportError as e:
+            retryable = idempotent or isinstance(e, CONNECT_ERRORS)
+            if not retryable or (delay := _get_retry_delay(name, attempt, None)) is None:
+                breaker.record_failure()
+                raise
+        else:
+            if (delay := _check_response(breaker, name, attempt, response, idempotent)) is None:
+                return response
+        time.sleep(delay)
+
+
+async def call_with_retry_async(
+    name: str, send: Callable[[], Awaitable[httpx2.Response]], *, idempotent: bool = True
+) -> httpx2.Response:
+    """Send a request without blocking the event loop, see ``call_with_retry``."""
+    breaker = get_circuit_breaker(name)
+    breaker.before_call()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            response = await send()
+        except httpx2.TransportError as e:
+            retryable = idempotent or isinstance(e, CONNECT_ERRORS)
+            if not retryable or (delay := _get_retry_delay(name, attempt, None)) is None:
+                breaker.record_failure()
+                raise
+        else:
+            if (delay := _check_response(breaker, name, attempt, response, idempotent)) is None:
+                return response
+        await asyncio.sleep(delay)
+
+
+def _check_response(
+    breaker: CircuitBreaker, name: str, attempt: int, response: httpx2.Response, idempotent: bool
+) -> float | None:
+    """Return the delay before retrying, or None if the response is final."""
+    if response.status_code in RETRY_STATUS_CODES:
+        if idempotent and (delay := _get_retry_delay(name, attempt, response)) is not None:
+            return delay
+        breaker.record_failure()
+    else:
+        # the other errors are answered by a healthy service
+        breaker.record_success()
+    response.raise_for_status()
+    return None
+
+
+def _get_retry_delay(name: str, attempt: int, response: httpx2.Response | None) -> float | None:
+    """Return the delay before the next attempt, or None if no more retry is allowed."""
+    if attempt > settings.AUTH_MANAGER_MAX_RETRIES:
+        return None
+    max_delay = settings.AUTH_MANAGER_RETRY_MAX_DELAY_SECONDS
+    if response is not None and (retry_after := _parse_retry_after(response)) is not None:
+        if retry_after > max_delay:
+            L.debug("%s asks to retry after %ss, giving up", name, retry_after)
+            return None
+        delay = retry_after
+    else:
+        backoff = settings.AUTH_MANAGER_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+        delay = random.uniform(0, min(backoff, max_delay))  # noqa: S311
+    L.info("Request to %s failed, retrying in %.2fs (attempt %s)", name, delay, attempt)
+    _emit(ResilienceEvent(kind="retry", name=name, attempt=attempt, delay=delay))
+    return delay
+
+
+def _parse_retry_after(response: httpx2.Response) -> float | None:
+    """Return the delay in seconds of the Retry-After header, if any."""
+    if not (value := response.headers.get("Retry-After")):
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        L.debug("Ignoring invalid Retry-After header: %s", value)
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
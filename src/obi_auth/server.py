@@ -1,11 +1,12 @@
 """This module provides a simple HTTP server that listens for a Keycloak authorization code."""
 
+import asyncio
 import contextlib
 import functools
 import json
 import logging
 import threading
-from collections.abc import Iterator
+from collections.abc import AsyncGenerator, Iterator
 from dataclasses import dataclass, field
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
@@ -18,6 +19,7 @@ from obi_auth.exception import LocalServerError
 L = logging.getLogger(__name__)
 HOST = "localhost"
 CALLBACK_PATH = "/callback"
+POLL_INTERVAL = 0.1
 
 
 @dataclass
@@ -139,16 +141,46 @@ class AuthServer:
             thread.join(timeout=1)
             server.server_close()
 
-    def wait_for_code(self, timeout: int = settings.LOCAL_SERVER_TIMEOUT) -> str:
-        """Wait for a validated authorization code, or raise on OAuth/timeout errors."""
+    @contextlib.asynccontextmanager
+    async def run_async(self) -> AsyncGenerator[Self]:
+        """Start server like ``run``, stopping it without blocking the event loop."""
+        context = self.run()
+        server = context.__enter__()
+        try:
+            yield server
+        finally:
+            await asyncio.to_thread(context.__exit__, None, None, None)
+
+    def wait_for_code(self, timeout: float | None = None) -> str:
+        """Wait for a validated authorization code, or raise on OAuth/timeout errors.
+
+        The timeout defaults to the ``LOCAL_SERVER_TIMEOUT`` setting.
+        """
+        if timeout is None:
+            timeout = settings.LOCAL_SERVER_TIMEOUT
         if self.auth_state.event.wait(timeout):
-            self.auth_state.event.clear()
-            if self.auth_state.error is not None:
-                detail = self.auth_state.error_description or self.auth_state.error
-                raise LocalServerError(f"Authorization failed: {detail}")
-            if self.auth_state.code is None:
-                raise LocalServerError("Authorization code was not set")
-            code = self.auth_state.code
-            self.auth_state.code = None
-            return code
+            return self._consume_code()
         raise LocalServerError("Timeout waiting for authorization code")
+
+    async def wait_for_code_async(self, timeout: float | None = None) -> str:
+        """Wait for a validated authorization code without blocking the event loop."""
+        if timeout is None:
+            timeout = settings.LOCAL_SERVER_TIMEOUT
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.auth_state.event.is_set():
+            if loop.time() >= deadline:
+                raise LocalServerError("Timeout waiting for authorization code")
+            await asyncio.sleep(POLL_INTERVAL)
+        return self._consume_code()
+
+    def _consume_code(self) -> str:
+        self.auth_state.event.clear()
+        if self.auth_state.error is not None:
+            detail = self.auth_state.error_description or self.auth_state.error
+            raise LocalServerError(f"Authorization failed: {detail}")
+        if self.auth_state.code is None:
+            raise LocalServerError("Authorization code was not set")
+        code = self.auth_state.code
+        self.auth_state.code = None
+        return code
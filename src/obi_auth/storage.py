@@ -1,14 +1,39 @@
-"""Storage module."""
+"""Storage module.
 
-from pathlib import Path
+The cached tokens are stored by one of the backends of ``StorageBackend``, selected with the
+``STORAGE_BACKEND`` setting:
+
+- ``file``: one file per token in the config dir. On filesystems shared by many hosts, set
+  ``LOCK_MODE`` to ``lease`` to guard the refreshes with lease files instead of advisory locks.
+  The binary records are written to ``.bin`` files, and the ``.json`` files of the older
+  versions are only read while no record was written, so that they are never overwritten.
+- ``sqlite``: a single SQLite database in the config dir.
+- ``memory``: the memory of the process, without any disk access.
+- ``keyring``: the keyring of the user, requires the ``keyring`` extra.
+- ``redis``: a Redis-compatible server shared by many hosts, requires the ``redis`` extra.
 
-from pydantic import TypeAdapter
+The hosts sharing a cache read the tokens of each other only with the same ``ENCRYPTION_KEY``
+setting, the entries encrypted with another key being ignored.
+"""
 
-from obi_auth.typedef import (
-    CachedAuthManagerTokenInfo,
-    CachedTokenInfo,
-    DeploymentEnvironment,
-)
+import base64
+import functools
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, Protocol, Self
+
+from obi_auth import metrics, profiling
+from obi_auth.config import settings
+from obi_auth.exception import ConfigError
+from obi_auth.lock import BaseLock, FileLock, LeaseFileLock, LeaseLock, RedisLock, ThreadLock
+from obi_auth.record import StoredCachedTokenInfo, decode_record, encode_record
+from obi_auth.typedef import DeploymentEnvironment, LockMode, StorageBackend
 
 FILE_MODE = 0o600  # user only read/write
 DIRECTORY_MODE = 0o700
@@ -17,44 +42,693 @@ ENV_TO_FILE_NAME = {
     DeploymentEnvironment.production: "token-production.json",
 }
 
-StoredCachedTokenInfo = CachedAuthManagerTokenInfo | CachedTokenInfo
-_STORED_CACHED_TOKEN_ADAPTER = TypeAdapter(StoredCachedTokenInfo)
+SQLITE_FILE_NAME = "tokens.sqlite3"
+SQLITE_BUSY_TIMEOUT = 5.0
+# max entries per query of the batch reads, below the default limit of 999 parameters
+SQLITE_MAX_BATCH_SIZE = 400
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    environment TEXT NOT NULL,
+    key TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (environment, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS locks (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+KEYRING_SERVICE = "obi-auth"
+_KEYRING_UPDATED_AT = struct.Struct("<d")
 
 
-class Storage:
-    """Storage class."""
+class TokenStorage(Protocol):
+    """Storage of a single cached token entry.
+
+    The storage classes are created with the config dir, the environment and the key of the
+    entry, and provide batch reads of many entries of the same config dir.
+    """
 
     def __init__(
         self, config_dir: Path, environment: DeploymentEnvironment, key: str | None = None
     ) -> None:
-        """Initialize storage file from config dir and environment flag."""
+        """Initialize the storage of the entry of environment and key in config dir."""
+
+    @classmethod
+    def scan(cls, config_dir: Path) -> list[Self]:
+        """Return the storage of all the entries of config dir."""
+
+    @classmethod
+    def read_many(cls, storages: Sequence[Self]) -> list[StoredCachedTokenInfo | None]:
+        """Read the token info of many entries, None for the entries not stored."""
+
+    @property
+    def name(self) -> str:
+        """Return the name identifying the entry in logs and reports."""
+
+    def write(self, data: StoredCachedTokenInfo) -> None:
+        """Write token info."""
+
+    def read(self) -> StoredCachedTokenInfo | None:
+        """Read token info, or None if not stored."""
+
+    def clear(self) -> None:
+        """Delete token info."""
+
+    def exists(self) -> bool:
+        """Return True if token info is stored."""
+
+    def updated_at(self) -> float | None:
+        """Return the UTC timestamp of the last write, or None if not stored."""
+
+    def purge(self) -> None:
+        """Delete token info and any other trace of the entry, once it is no longer used."""
+
+    def lock(self, timeout: float) -> BaseLock:
+        """Return an inter-process lock guarding the refresh of the entry."""
+
+
+def scan(config_dir: Path, backend: StorageBackend) -> list[TokenStorage]:
+    """Return the storage of all the entries stored in config dir by the backend."""
+    return list(STORAGE_CLASSES[backend].scan(config_dir))
+
+
+def read_many(storages: Sequence[TokenStorage]) -> list[StoredCachedTokenInfo | None]:
+    """Read the token info of many entries of the same backend and config dir."""
+    if not storages:
+        return []
+    return type(storages[0]).read_many(storages)
+
+
+class _PerEntryBatch:
+    """Batch reads of the backends without batch queries, one entry at a time."""
+
+    @classmethod
+    def read_many(cls, storages: Sequence[TokenStorage]) -> list[StoredCachedTokenInfo | None]:
+        """Read the token info of many entries."""
+        return [storage.read() for storage in storages]
+
+
+class Storage(_PerEntryBatch):
+    """Storage class.
+
+    Tokens are written to a temporary file renamed over the token file, so that concurrent
+    readers see either the previous or the new token, never a partially written file. The
+    JSON file written by the older versions is read until the token file is written.
+    """
+
+    def __init__(
+        self,
+        config_dir: Path,
+        environment: DeploymentEnvironment,
+        key: str | None = None,
+        *,
+        fsync: bool | None = None,
+        lock_mode: LockMode | None = None,
+    ) -> None:
+        """Initialize storage file from config dir and environment flag.
+
+        Args:
+            config_dir: Directory of the token files.
+            environment: Deployment environment of the token.
+            key: Key of the token in the environment.
+            fsync: Flush the writes to disk before renaming, to survive a power loss. Defaults
+                to the ``STORAGE_FSYNC`` setting.
+            lock_mode: Lock guarding the refresh of the token, a lease file on shared
+                filesystems. Defaults to the ``LOCK_MODE`` setting.
+        """
         config_dir.mkdir(exist_ok=True, parents=True)
         config_dir.chmod(mode=DIRECTORY_MODE)
-        filename = f"token_{environment}_{key}.json" if key else f"token_{environment}.json"
-        self._file_path = config_dir / filename
+        stem = f"token_{environment}_{key}" if key else f"token_{environment}"
+        self._file_path = config_dir / f"{stem}.bin"
+        # still used by the older versions sharing the config dir, which only read JSON
+        self._legacy_path = config_dir / f"{stem}.json"
+        self._fsync = settings.STORAGE_FSYNC if fsync is None else fsync
+        self._lock_mode = settings.LOCK_MODE if lock_mode is None else lock_mode
+
+    @classmethod
+    def scan(cls, config_dir: Path) -> list[Self]:
+        """Return the storage of all the token files in config dir."""
+        storages = []
+        stems = {path.stem for path in config_dir.glob("token_*.bin")}
+        stems.update(path.stem for path in config_dir.glob("token_*.json"))
+        for stem in sorted(stems):
+            environment, _, key = stem.removeprefix("token_").partition("_")
+            try:
+                storages.append(cls(config_dir, DeploymentEnvironment(environment), key or None))
+            except ValueError:
+                continue  # not a token file
+        return storages
+
+    @property
+    def name(self) -> str:
+        """Return the file name, of the legacy JSON file if only it exists."""
+        if not self._file_path.exists() and self._legacy_path.exists():
+            return self._legacy_path.name
+        return self._file_path.name
 
-    def write(self, data: StoredCachedTokenInfo):
-        """Write token info to file."""
-        self._ensure_file_mode()
-        self._file_path.write_text(data.model_dump_json())
+    def write(self, data: StoredCachedTokenInfo) -> None:
+        """Write token info to file, atomically."""
+        _write_atomic(self._file_path, encode_record(data), fsync=self._fsync)
 
     def read(self) -> StoredCachedTokenInfo | None:
         """Read token info from file."""
-        if not self.exists():
+        with (
+            profiling.span("storage.read"),
+            metrics.timer(metrics.STORAGE_READ_DURATION, backend=StorageBackend.file),
+        ):
+            for path in (self._file_path, self._legacy_path):
+                try:
+                    data = path.read_bytes()
+                except FileNotFoundError:
+                    continue
+                return _decode(data)
             return None
-        data = self._file_path.read_bytes()
-        return _STORED_CACHED_TOKEN_ADAPTER.validate_json(data)
 
     def clear(self) -> None:
-        """Delete file."""
+        """Delete file, and the legacy JSON file."""
         self._file_path.unlink(missing_ok=True)
+        self._legacy_path.unlink(missing_ok=True)
 
     def exists(self) -> bool:
-        """Return True if file does not exist."""
-        return self._file_path.exists()
-
-    def _ensure_file_mode(self) -> None:
-        if self.exists():
-            self._file_path.chmod(mode=FILE_MODE)
-        else:
-            self._file_path.touch(mode=FILE_MODE)
+        """Return True if file, or the legacy JSON file, exists."""
+        return self._file_path.exists() or self._legacy_path.exists()
+
+    def updated_at(self) -> float | None:
+        """Return the modification time of the file read."""
+        for path in (self._file_path, self._legacy_path):
+            try:
+                return path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+        return None
+
+    def purge(self) -> None:
+        """Delete file and lock file.
+
+        The lock file should be held while purging, a process still waiting on the deleted
+        lock file could otherwise refresh at the same time as one using a new lock file.
+        """
+        self.clear()
+        self._lock_path.unlink(missing_ok=True)
+        if self._lock_mode == LockMode.lease:
+            LeaseFileLock.get_done_path(self._lock_path).unlink(missing_ok=True)
+
+    def lock(self, timeout: float) -> FileLock | LeaseFileLock:
+        """Return an inter-process lock guarding the refresh of this token file."""
+        if self._lock_mode == LockMode.lease:
+            return LeaseFileLock(self._lock_path, timeout=timeout, ttl=settings.LEASE_TTL_SECONDS)
+        return FileLock(self._lock_path, timeout=timeout)
+
+    @property
+    def _lock_path(self) -> Path:
+        suffix = "lease" if self._lock_mode == LockMode.lease else "lock"
+        return self._file_path.with_name(f"{self._file_path.name}.{suffix}")
+
+
+class SqliteStorage:
+    """Storage of all the tokens in a single SQLite database, one indexed row per entry.
+
+    The database is in WAL mode, so readers never block on a writer, and each write is a
+    single transaction.
+    """
+
+    def __init__(
+        self, config_dir: Path, environment: DeploymentEnvironment, key: str | None = None
+    ) -> None:
+        """Initialize storage entry from config dir, environment flag and key."""
+        config_dir.mkdir(exist_ok=True, parents=True)
+        config_dir.chmod(mode=DIRECTORY_MODE)
+        self._db_path = config_dir / SQLITE_FILE_NAME
+        self._environment = str(environment)
+        self._key = key or ""
+
+    @classmethod
+    def scan(cls, config_dir: Path) -> list[Self]:
+        """Return the storage of all the entries of the database in config dir."""
+        if not (db_path := config_dir / SQLITE_FILE_NAME).exists():
+            return []
+        rows = _connect(db_path).execute("SELECT environment, key FROM tokens").fetchall()
+        return [
+            cls(config_dir, DeploymentEnvironment(environment), key or None)
+            for environment, key in rows
+        ]
+
+    @property
+    def name(self) -> str:
+        """Return the environment and key of the entry."""
+        return f"{self._environment}/{self._key}"
+
+    def write(self, data: StoredCachedTokenInfo) -> None:
+        """Write token info to the database."""
+        with (connection := _connect(self._db_path)):
+            connection.execute(
+                "INSERT INTO tokens (environment, key, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (environment, key) "
+                "DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (self._environment, self._key, encode_record(data), time.time()),
+            )
+
+    def read(self) -> StoredCachedTokenInfo | None:
+        """Read token info from the database."""
+        with (
+            profiling.span("storage.read"),
+            metrics.timer(metrics.STORAGE_READ_DURATION, backend=StorageBackend.sqlite),
+        ):
+            row = (
+                _connect(self._db_path)
+                .execute(
+                    "SELECT data FROM tokens WHERE environment = ? AND key = ?",
+                    (self._environment, self._key),
+                )
+                .fetchone()
+            )
+            if row is None:
+                return None
+            return _decode(row[0])
+
+    def clear(self) -> None:
+        """Delete entry."""
+        with (connection := _connect(self._db_path)):
+            connection.execute(
+                "DELETE FROM tokens WHERE environment = ? AND key = ?",
+                (self._environment, self._key),
+            )
+
+    def exists(self) -> bool:
+        """Return True if the entry exists."""
+        row = (
+            _connect(self._db_path)
+            .execute(
+                "SELECT 1 FROM tokens WHERE environment = ? AND key = ?",
+                (self._environment, self._key),
+            )
+            .fetchone()
+        )
+        return row is not None
+
+    def updated_at(self) -> float | None:
+        """Return the time of the last write of the entry."""
+        row = (
+            _connect(self._db_path)
+            .execute(
+                "SELECT updated_at FROM tokens WHERE environment = ? AND key = ?",
+                (self._environment, self._key),
+            )
+            .fetchone()
+        )
+        return None if row is None else row[0]
+
+    def purge(self) -> None:
+        """Delete entry, its lease is deleted when released."""
+        self.clear()
+
+    def lock(self, timeout: float) -> LeaseLock:
+        """Return an inter-process lock guarding the refresh of this entry."""
+        return LeaseLock(
+            functools.partial(_connect, self._db_path),
+            name=f"{self._environment}/{self._key}",
+            timeout=timeout,
+        )
+
+    @classmethod
+    def read_many(cls, storages: Sequence[Self]) -> list[StoredCachedTokenInfo | None]:
+        """Read the token info of many entries of the database, with a query per batch."""
+        rows: dict[tuple[str, str], str | bytes] = {}
+        for start in range(0, len(storages), SQLITE_MAX_BATCH_SIZE):
+            batch = storages[start : start + SQLITE_MAX_BATCH_SIZE]
+            values = ", ".join(["(?, ?)"] * len(batch))
+            query = f"SELECT environment, key, data FROM tokens WHERE (environment, key) IN (VALUES {values})"  # noqa: E501, S608
+            cursor = _connect(batch[0]._db_path).execute(
+                query,
+                [value for storage in batch for value in (storage._environment, storage._key)],
+            )
+            rows.update(((environment, key), data) for environment, key, data in cursor)
+        return [
+            None
+            if (data := rows.get((storage._environment, storage._key))) is None
+            else _decode(data)
+            for storage in storages
+        ]
+
+
+# entries of the memory backend by config dir, environment and key, with their write time
+_MEMORY_ENTRIES: dict[tuple[str, str, str], tuple[StoredCachedTokenInfo, float]] = {}
+
+
+class MemoryStorage(_PerEntryBatch):
+    """Storage of the tokens in the memory of the process, without any disk access.
+
+    Suited to ephemeral containers: the tokens are not shared with the other processes, and
+    are lost when the process exits.
+    """
+
+    def __init__(
+        self, config_dir: Path, environment: DeploymentEnvironment, key: str | None = None
+    ) -> None:
+        """Initialize storage entry, config dir only separates the entries of different dirs."""
+        self._id = (str(config_dir), str(environment), key or "")
+
+    @classmethod
+    def scan(cls, config_dir: Path) -> list[Self]:
+        """Return the storage of all the entries of config dir."""
+        return [
+            cls(config_dir, DeploymentEnvironment(environment), key or None)
+            for dir_name, environment, key in sorted(list(_MEMORY_ENTRIES))
+            if dir_name == str(config_dir)
+        ]
+
+    @property
+    def name(self) -> str:
+        """Return the environment and key of the entry."""
+        return f"{self._id[1]}/{self._id[2]}"
+
+    def write(self, data: StoredCachedTokenInfo) -> None:
+        """Write token info."""
+        _MEMORY_ENTRIES[self._id] = (data, time.time())
+
+    def read(self) -> StoredCachedTokenInfo | None:
+        """Read token info."""
+        with (
+            profiling.span("storage.read"),
+            metrics.timer(metrics.STORAGE_READ_DURATION, backend=StorageBackend.memory),
+        ):
+            entry = _MEMORY_ENTRIES.get(self._id)
+            return None if entry is None else entry[0]
+
+    def clear(self) -> None:
+        """Delete entry."""
+        _MEMORY_ENTRIES.pop(self._id, None)
+
+    def exists(self) -> bool:
+        """Return True if the entry exists."""
+        return self._id in _MEMORY_ENTRIES
+
+    def updated_at(self) -> float | None:
+        """Return the time of the last write of the entry."""
+        entry = _MEMORY_ENTRIES.get(self._id)
+        return None if entry is None else entry[1]
+
+    def purge(self) -> None:
+        """Delete entry."""
+        self.clear()
+
+    def lock(self, timeout: float) -> ThreadLock:
+        """Return a lock guarding the refresh of this entry by the threads of the process."""
+        return ThreadLock(self._id, timeout=timeout)
+
+
+class KeyringStorage(_PerEntryBatch):
+    """Storage of the tokens in the keyring of the user, such as the macOS Keychain.
+
+    Each entry is a password of the ``obi-auth`` service. Keyrings cannot list their passwords,
+    so the entries are not scanned, and never evicted. The lock files are kept in config dir.
+    """
+
+    def __init__(
+        self, config_dir: Path, environment: DeploymentEnvironment, key: str | None = None
+    ) -> None:
+        """Initialize storage entry from config dir, environment flag and key.
+
+        Raises:
+            ConfigError: If the ``keyring`` extra is not installed.
+        """
+        self._keyring = _import_keyring()
+        config_dir.mkdir(exist_ok=True, parents=True)
+        config_dir.chmod(mode=DIRECTORY_MODE)
+        self._username = f"{environment}/{key or ''}"
+        self._lock_path = config_dir / f"keyring_{environment}_{key or ''}.lock"
+
+    @classmethod
+    def scan(cls, config_dir: Path) -> list[Self]:
+        """Return no entry, keyrings cannot be listed."""
+        return []
+
+    @property
+    def name(self) -> str:
+        """Return the keyring user name of the entry."""
+        return self._username
+
+    def write(self, data: StoredCachedTokenInfo) -> None:
+        """Write token info, with the time of the write."""
+        value = _KEYRING_UPDATED_AT.pack(time.time()) + encode_record(data)
+        self._keyring.set_password(
+            KEYRING_SERVICE, self._username, base64.b64encode(value).decode("ascii")
+        )
+
+    def read(self) -> StoredCachedTokenInfo | None:
+        """Read token info."""
+        with (
+            profiling.span("storage.read"),
+            metrics.timer(metrics.STORAGE_READ_DURATION, backend=StorageBackend.keyring),
+        ):
+            if (value := self._read()) is None:
+                return None
+            return _decode(value[_KEYRING_UPDATED_AT.size :])
+
+    def clear(self) -> None:
+        """Delete entry."""
+        try:
+            self._keyring.delete_password(KEYRING_SERVICE, self._username)
+        except self._keyring.errors.PasswordDeleteError:
+            pass  # not stored
+
+    def exists(self) -> bool:
+        """Return True if the entry exists."""
+        return self._keyring.get_password(KEYRING_SERVICE, self._username) is not None
+
+    def updated_at(self) -> float | None:
+        """Return the time of the last write of the entry."""
+        if (value := self._read()) is None:
+            return None
+        return _KEYRING_UPDATED_AT.unpack_from(value)[0]
+
+    def purge(self) -> None:
+        """Delete entry and lock file."""
+        self.clear()
+        self._lock_path.unlink(missing_ok=True)
+
+    def lock(self, timeout: float) -> FileLock:
+        """Return an inter-process lock guarding the refresh of this entry."""
+        return FileLock(self._lock_path, timeout=timeout)
+
+    def _read(self) -> bytes | None:
+        value = self._keyring.get_password(KEYRING_SERVICE, self._username)
+        return None if value is None else base64.b64decode(value)
+
+
+class RedisStorage:
+    """Storage of the tokens in a Redis-compatible server, shared by all the hosts using it.
+
+    Each entry is a hash of the record and of its write time, at
+    ``<REDIS_KEY_PREFIX>:token:<environment>:<key>``. The server is set by the ``REDIS_URL``
+    setting, and config dir is not used. The hosts share the tokens if they have the same
+    ``ENCRYPTION_KEY`` setting.
+    """
+
+    def __init__(
+        self,
+        config_dir: Path,
+        environment: DeploymentEnvironment,
+        key: str | None = None,
+        *,
+        client: Any = None,
+    ) -> None:
+        """Initialize storage entry from environment flag and key.
+
+        Args:
+            config_dir: Not used, the entries are stored by the server.
+            environment: Deployment environment of the token.
+            key: Key of the token in the environment.
+            client: Redis client, defaults to a client of the ``REDIS_URL`` setting.
+
+        Raises:
+            ConfigError: If the ``redis`` extra is not installed.
+        """
+        self._client = client or _get_redis_client(settings.REDIS_URL)
+        self._prefix = settings.REDIS_KEY_PREFIX
+        self._environment = str(environment)
+        self._key = key or ""
+
+    @classmethod
+    def scan(cls, config_dir: Path) -> list[Self]:
+        """Return the storage of all the entries of the server."""
+        client = _get_redis_client(settings.REDIS_URL)
+        prefix = f"{settings.REDIS_KEY_PREFIX}:token:"
+        storages = []
+        for redis_key in sorted(client.scan_iter(match=f"{prefix}*")):
+            environment, _, key = redis_key.decode().removeprefix(prefix).partition(":")
+            try:
+                storages.append(
+                    cls(config_dir, DeploymentEnvironment(environment), key or None, client=client)
+                )
+            except ValueError:
+                continue  # not a token entry
+        return storages
+
+    @property
+    def name(self) -> str:
+        """Return the environment and key of the entry."""
+        return f"{self._environment}/{self._key}"
+
+    def write(self, data: StoredCachedTokenInfo) -> None:
+        """Write token info to the server."""
+        self._client.hset(self._redis_key, mapping=self._mapping(data))
+
+    def read(self) -> StoredCachedTokenInfo | None:
+        """Read token info from the server."""
+        with (
+            profiling.span("storage.read"),
+            metrics.timer(metrics.STORAGE_READ_DURATION, backend=StorageBackend.redis),
+        ):
+            data = self._client.hget(self._redis_key, "data")
+            return None if data is None else _decode(data)
+
+    def clear(self) -> None:
+        """Delete entry."""
+        self._client.delete(self._redis_key)
+
+    def exists(self) -> bool:
+        """Return True if the entry exists."""
+        return bool(self._client.exists(self._redis_key))
+
+    def updated_at(self) -> float | None:
+        """Return the time of the last write of the entry."""
+        updated_at = self._client.hget(self._redis_key, "updated_at")
+        return None if updated_at is None else float(updated_at)
+
+    def purge(self) -> None:
+        """Delete entry, its lock key expires by itself."""
+        self.clear()
+
+    def lock(self, timeout: float) -> RedisLock:
+        """Return a lock guarding the refresh of this entry by all the clients of the server."""
+        return RedisLock(
+            self._client,
+            f"{self._prefix}:lock:{self._environment}:{self._key}",
+            timeout=timeout,
+        )
+
+    @classmethod
+    def read_many(cls, storages: Sequence[Self]) -> list[StoredCachedTokenInfo | None]:
+        """Read the token info of many entries, in a single round trip."""
+        if not storages:
+            return []
+        pipeline = storages[0]._client.pipeline(transaction=False)
+        for storage in storages:
+            pipeline.hget(storage._redis_key, "data")
+        return [None if data is None else _decode(data) for data in pipeline.execute()]
+
+    @property
+    def _redis_key(self) -> str:
+        return f"{self._prefix}:token:{self._environment}:{self._key}"
+
+    @staticmethod
+    def _mapping(data: StoredCachedTokenInfo) -> dict[str, bytes | float]:
+        return {"data": encode_record(data), "updated_at": time.time()}
+
+
+STORAGE_CLASSES: dict[StorageBackend, type[TokenStorage]] = {
+    StorageBackend.file: Storage,
+    StorageBackend.sqlite: SqliteStorage,
+    StorageBackend.memory: MemoryStorage,
+    StorageBackend.keyring: KeyringStorage,
+    StorageBackend.redis: RedisStorage,
+}
+
+
+def _import_keyring() -> Any:
+    try:
+        import keyring  # ty: ignore[unresolved-import]
+        import keyring.errors  # ty: ignore[unresolved-import]
+    except ImportError as e:
+        raise ConfigError(
+            "The keyring storage backend requires optional dependencies that are not installed.\n"
+            "Install them with:\n"
+            "  pip install 'obi-auth[keyring]'"
+        ) from e
+    return keyring
+
+
+@functools.cache
+def _get_redis_client(url: str) -> Any:
+    """Return the client of a Redis server, shared by the threads of the process."""
+    try:
+        import redis  # ty: ignore[unresolved-import]
+    except ImportError as e:
+        raise ConfigError(
+            "The redis storage backend requires optional dependencies that are not installed.\n"
+            "Install them with:\n"
+            "  pip install 'obi-auth[redis]'"
+        ) from e
+    return redis.Redis.from_url(url)
+
+
+class _Connections(threading.local):
+    """Connections of the current thread, sqlite3 connections cannot be shared by threads."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.by_path: dict[Path, sqlite3.Connection] = {}
+
+
+_CONNECTIONS = _Connections()
+
+
+def scan_temp_files(config_dir: Path) -> list[Path]:
+    """Return the temporary files of the token files of config dir, see ``_write_atomic``.
+
+    They are left behind by the writes of the processes that crashed before the rename.
+    """
+    return sorted(config_dir.glob(".token_*.tmp"))
+
+
+def _write_atomic(path: Path, data: bytes, *, fsync: bool) -> None:
+    """Write data to a temporary file in the same directory, and rename it to path."""
+    # mkstemp creates the file with mode 0600 (FILE_MODE), it is never readable by others
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    if fsync and os.name == "posix":
+        # persist the rename as well
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _decode(data: str | bytes) -> StoredCachedTokenInfo:
+    with profiling.span("storage.decode"):
+        return decode_record(data)
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    """Return the connection of the current thread to the database, opening it if needed."""
+    if _CONNECTIONS.pid != os.getpid():
+        # connections must not be used across a fork
+        _CONNECTIONS.pid, _CONNECTIONS.by_path = os.getpid(), {}
+    if (connection := _CONNECTIONS.by_path.get(db_path)) is None:
+        connection = _CONNECTIONS.by_path[db_path] = _open_database(db_path)
+    return connection
+
+
+def _open_database(db_path: Path) -> sqlite3.Connection:
+    # create the file before sqlite does, so that it is never readable by others
+    db_path.touch(mode=FILE_MODE)
+    connection = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SQLITE_SCHEMA)
+    return connection
@@ -1,7 +1,8 @@
 """This module provides typedefs for the obi_auth service."""
 
+import warnings
 from enum import StrEnum, auto
-from typing import Annotated, Literal
+from typing import Annotated, Literal, NamedTuple
 
 from pydantic import BaseModel, Field
 
@@ -20,18 +21,30 @@ class KeycloakRealm(StrEnum):
 
 
 class CachedTokenInfo(BaseModel):
-    """Encrypted Keycloak token stored on disk."""
+    """Encrypted Keycloak token stored on disk.
+
+    ``iat`` and ``exp`` are the plaintext creation and effective expiry timestamps of the
+    token, used to detect expired entries without decrypting them. They are None in the
+    entries written by older versions.
+    """
 
     token: bytes
     ttl: int
+    iat: int | None = None
+    exp: int | None = None
 
 
 class CachedAuthManagerTokenInfo(BaseModel):
-    """Encrypted auth-manager token and persistent id stored on disk."""
+    """Encrypted auth-manager token and persistent id stored on disk.
+
+    ``iat`` and ``exp`` are the same as in ``CachedTokenInfo``.
+    """
 
     token: bytes
     ttl: int
     persistent_token_id: bytes
+    iat: int | None = None
+    exp: int | None = None
 
 
 class AuthMode(StrEnum):
@@ -44,6 +57,23 @@ class AuthMode(StrEnum):
     persistent_token = auto()
 
 
+class StorageBackend(StrEnum):
+    """Engine storing the cached tokens."""
+
+    file = auto()
+    sqlite = auto()
+    memory = auto()
+    keyring = auto()
+    redis = auto()
+
+
+class LockMode(StrEnum):
+    """Lock guarding the refresh of a token file."""
+
+    flock = auto()
+    lease = auto()
+
+
 class TokenProvider(StrEnum):
     """Issuer of the access token returned by ``get_token``."""
 
@@ -66,6 +96,15 @@ class AuthManagerTokenInfo(BaseModel):
     persistent_token_id: str
 
 
+class TokenCacheKey(NamedTuple):
+    """Identity of a token in the in-process memory cache."""
+
+    environment: DeploymentEnvironment
+    auth_mode: AuthMode
+    token_provider: TokenProvider
+    persistent_token_id: str | None = None
+
+
 TokenInfo = Annotated[
     KeycloakTokenInfo | AuthManagerTokenInfo,
     Field(discriminator="token_provider"),
@@ -84,5 +123,14 @@ class AuthDeviceInfo(BaseModel):
 
     @property
     def max_retries(self) -> int:
-        """Return max retries from expiration time and polling interval."""
+        """Return max retries from expiration time and polling interval.
+
+        Deprecated: the polling stops when the device code expires, not after a number of retries.
+        """
+        warnings.warn(
+            "AuthDeviceInfo.max_retries is deprecated and not used anymore, the device code "
+            "token is polled until expires_in",
+            DeprecationWarning,
+            stacklevel=2,
+        )
         return self.expires_in // self.interval
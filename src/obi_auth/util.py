@@ -1,6 +1,7 @@
 """Utilities."""
 
 import base64
+import functools
 import getpass
 import hashlib
 import platform
@@ -21,17 +22,27 @@ def get_machine_salt():
     return hashlib.sha256(raw.encode()).digest()
 
 
-def derive_fernet_key() -> bytes:
-    """Create Fernet key from unique machine salt."""
-    hkdf = HKDF(
-        algorithm=hashes.SHA256(),
-        length=32,
-        backend=default_backend(),
-        salt=None,  # Optional: use one if you want context separation
-        info=b"machine-specific-fernet-key",  # Application-specific context
-    )
-    key = hkdf.derive(get_machine_salt())
-    return base64.urlsafe_b64encode(key)  # Fernet requires base64 encoding
+@functools.cache
+def derive_fernet_key(secret: str | None = None) -> bytes:
+    """Create Fernet key, once per process.
+
+    Args:
+        secret: Secret shared by the hosts reading the same cached tokens. Defaults to the
+            unique machine salt, so that only this host and user can read them.
+    """
+    # imported here, as the config imports this module
+    from obi_auth import profiling
+
+    with profiling.span("derive_fernet_key"):
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            backend=default_backend(),
+            salt=None,  # Optional: use one if you want context separation
+            info=b"machine-specific-fernet-key",  # Application-specific context
+        )
+        key = hkdf.derive(secret.encode() if secret else get_machine_salt())
+        return base64.urlsafe_b64encode(key)  # Fernet requires base64 encoding
 
 
 def get_config_dir() -> Path:
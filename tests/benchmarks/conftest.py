@@ -0,0 +1,30 @@
+import time
+
+import jwt
+import pytest
+
+from obi_auth import client
+from obi_auth.config import settings
+
+
+def make_token(name="token", expires_in=3600):
+    now = int(time.time())
+    return jwt.encode(
+        {"name": name, "iat": now, "exp": now + expires_in}, key=None, algorithm="none"
+    )
+
+
+@pytest.fixture
+def token():
+    return make_token()
+
+
+@pytest.fixture(autouse=True)
+def config_dir(tmp_path, monkeypatch):
+    """Run offline in an empty config dir, without agent or background refresh."""
+    monkeypatch.setattr(settings, "config_dir", tmp_path)
+    monkeypatch.setattr(settings, "AGENT_SOCKET", tmp_path / "agent.sock")
+    monkeypatch.setattr(settings, "BACKGROUND_REFRESH", False)
+    client._MEMORY_TOKEN_CACHE.clear()
+    yield tmp_path
+    client._MEMORY_TOKEN_CACHE.clear()
@@ -0,0 +1,85 @@
+from unittest.mock import Mock
+
+import pytest
+
+from obi_auth import cache, record, storage
+from obi_auth.typedef import AuthManagerTokenInfo, DeploymentEnvironment, KeycloakTokenInfo
+
+STORAGE_CLASSES = [storage.Storage, storage.SqliteStorage, storage.MemoryStorage]
+
+
+@pytest.fixture(params=STORAGE_CLASSES, ids=["file", "sqlite", "memory"])
+def token_storage(request, config_dir):
+    return request.param(config_dir, DeploymentEnvironment.staging, "bench")
+
+
+@pytest.fixture
+def cached_token_info(token):
+    token_storage = Mock()
+    cache.TokenCache().set(KeycloakTokenInfo(access_token=token), token_storage)
+    return token_storage.write.call_args.args[0]
+
+
+@pytest.mark.benchmark(group="storage")
+def test_storage_write(benchmark, token_storage, cached_token_info):
+    benchmark(token_storage.write, cached_token_info)
+
+
+@pytest.mark.benchmark(group="storage")
+def test_storage_read(benchmark, token_storage, cached_token_info):
+    token_storage.write(cached_token_info)
+    assert benchmark(token_storage.read) == cached_token_info
+
+
+@pytest.fixture
+def encoders():
+    return {
+        "json": (lambda data: data.model_dump_json().encode(), record.decode_record),
+        "binary": (record.encode_record, record.decode_record),
+    }
+
+
+@pytest.mark.benchmark(group="record_encode")
+@pytest.mark.parametrize("record_format", ["json", "binary"])
+def test_record_encode(benchmark, encoders, cached_token_info, record_format):
+    encode, _ = encoders[record_format]
+    benchmark(encode, cached_token_info)
+
+
+@pytest.mark.benchmark(group="record_decode")
+@pytest.mark.parametrize("record_format", ["json", "binary"])
+def test_record_decode(benchmark, encoders, cached_token_info, record_format):
+    encode, decode = encoders[record_format]
+    assert benchmark(decode, encode(cached_token_info)) == cached_token_info
+
+
+@pytest.mark.benchmark(group="token_cache")
+def test_token_cache_set(benchmark, token_storage, token):
+    benchmark(cache.TokenCache().set, KeycloakTokenInfo(access_token=token), token_storage)
+
+
+@pytest.mark.benchmark(group="token_cache")
+def test_token_cache_get(benchmark, token_storage, token):
+    token_cache = cache.TokenCache()
+    token_cache.set(KeycloakTokenInfo(access_token=token), token_storage)
+    assert benchmark(token_cache.get, token_storage).access_token == token
+
+
+@pytest.mark.benchmark(group="auth_manager_token_cache")
+def test_auth_manager_token_cache_set(benchmark, token_storage, token):
+    token_info = AuthManagerTokenInfo(access_token=token, persistent_token_id="pers-id")  # noqa: S106
+    benchmark(cache.AuthManagerTokenCache().set, token_info, token_storage)
+
+
+@pytest.mark.benchmark(group="auth_manager_token_cache")
+def test_auth_manager_token_cache_get(benchmark, token_storage, token):
+    token_cache = cache.AuthManagerTokenCache()
+    token_info = AuthManagerTokenInfo(access_token=token, persistent_token_id="pers-id")  # noqa: S106
+    token_cache.set(token_info, token_storage)
+    assert benchmark(token_cache.get, token_storage) == token_info
+
+
+@pytest.mark.benchmark(group="auth_manager_token_cache")
+def test_get_token_times(benchmark, token):
+    _, time_to_live = benchmark(cache._get_token_times, token)
+    assert time_to_live > 0
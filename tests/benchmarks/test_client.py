@@ -0,0 +1,71 @@
+import subprocess
+import sys
+
+import pytest
+
+from obi_auth import client
+from obi_auth.typedef import (
+    AuthManagerTokenInfo,
+    AuthMode,
+    DeploymentEnvironment,
+    KeycloakTokenInfo,
+    TokenCacheKey,
+    TokenProvider,
+)
+from obi_auth.util import derive_fernet_key
+
+KEY = TokenCacheKey(DeploymentEnvironment.staging, AuthMode.pkce, TokenProvider.keycloak)
+PERSISTENT_KEY = TokenCacheKey(
+    DeploymentEnvironment.staging,
+    AuthMode.persistent_token,
+    TokenProvider.auth_manager,
+    "pers-id",
+)
+
+
+@pytest.mark.benchmark(group="get_token")
+def test_get_token_memory_hit(benchmark, token):
+    client._MEMORY_TOKEN_CACHE.set(KEY, token)
+    assert benchmark(client.get_token) == token
+
+
+@pytest.mark.benchmark(group="get_token")
+def test_get_token_disk_hit(benchmark, token):
+    client._TOKEN_CACHE.set(KeycloakTokenInfo(access_token=token), client._get_storage(KEY))
+
+    def clear_memory_cache():
+        client._MEMORY_TOKEN_CACHE.clear()
+
+    res = benchmark.pedantic(client.get_token, setup=clear_memory_cache, rounds=200)
+    assert res == token
+
+
+@pytest.mark.benchmark(group="get_token")
+def test_get_token_persistent_disk_hit(benchmark, token):
+    token_info = AuthManagerTokenInfo(access_token=token, persistent_token_id="pers-id")  # noqa: S106
+    client._AUTH_MANAGER_TOKEN_CACHE.set(token_info, client._get_storage(PERSISTENT_KEY))
+
+    def clear_memory_cache():
+        client._MEMORY_TOKEN_CACHE.clear()
+
+    res = benchmark.pedantic(
+        client.get_token,
+        kwargs={"auth_mode": AuthMode.persistent_token, "persistent_token_id": "pers-id"},
+        setup=clear_memory_cache,
+        rounds=200,
+    )
+    assert res == token
+
+
+@pytest.mark.benchmark(group="crypto")
+def test_derive_fernet_key(benchmark):
+    # bypass the process-wide cache to measure the key derivation itself
+    assert len(benchmark(derive_fernet_key.__wrapped__)) == 44
+
+
+@pytest.mark.benchmark(group="import")
+def test_cold_import(benchmark):
+    def import_obi_auth():
+        subprocess.run([sys.executable, "-c", "import obi_auth"], check=True)  # noqa: S603
+
+    benchmark.pedantic(import_obi_auth, rounds=10)
@@ -0,0 +1,75 @@
+"""Simulation of the ranks of an HPC job sharing a config dir, with each lock mode.
+
+The ranks run on several simulated hosts sharing the encryption key. All of them start at the
+same time without a valid cached token, a single one mints it and the others wait for it, so
+the measured time is the mint latency plus the wait of the ranks.
+"""
+
+import multiprocessing
+import shutil
+import time
+from unittest.mock import patch
+
+import pytest
+from pydantic import SecretStr
+
+from obi_auth import client, util
+from obi_auth.config import settings
+from obi_auth.typedef import AuthManagerTokenInfo, AuthMode, LockMode
+from tests.benchmarks.conftest import make_token
+
+MINT_LATENCY_SECONDS = 0.1
+N_RANKS = 64
+N_HOSTS = 4
+
+
+@pytest.mark.benchmark(group="lease")
+@pytest.mark.parametrize("lock_mode", [LockMode.flock, LockMode.lease])
+def test_ranks_sharing_config_dir(benchmark, config_dir, monkeypatch, lock_mode):
+    monkeypatch.setattr(settings, "config_dir", config_dir / "config")
+    monkeypatch.setattr(settings, "LOCK_MODE", lock_mode)
+    monkeypatch.setattr(settings, "CACHE_EVICTION_INTERVAL_SECONDS", 0)
+    monkeypatch.setattr(settings, "ENCRYPTION_KEY", SecretStr("job-secret"))
+    mints_file = config_dir / "mints.log"
+    token = make_token()
+
+    def counting_mint(persistent_token_id, **kwargs):
+        with mints_file.open("a") as f:
+            f.write(f"{persistent_token_id}\n")
+        time.sleep(MINT_LATENCY_SECONDS)
+        return AuthManagerTokenInfo(access_token=token, persistent_token_id=persistent_token_id)
+
+    context = multiprocessing.get_context("fork")
+
+    def rank(start, host):
+        # the key is derived from the machine of the rank, unless a secret is shared
+        util.get_machine_salt = lambda: host.encode()
+        util.derive_fernet_key.cache_clear()
+        vars(client._AUTH_MANAGER_TOKEN_CACHE).pop("_cipher", None)
+        start.wait()
+        client.get_token(
+            auth_mode=AuthMode.persistent_token,
+            persistent_token_id="pers-id",  # noqa: S106
+        )
+
+    def setup():
+        shutil.rmtree(settings.config_dir, ignore_errors=True)
+        mints_file.unlink(missing_ok=True)
+        start = context.Event()
+        processes = [
+            context.Process(target=rank, args=(start, f"host-{i % N_HOSTS}"))
+            for i in range(N_RANKS)
+        ]
+        for process in processes:
+            process.start()
+        return (start, processes), {}
+
+    def run(start, processes):
+        start.set()
+        for process in processes:
+            process.join(timeout=60)
+        assert [process.exitcode for process in processes] == [0] * N_RANKS
+        assert mints_file.read_text().splitlines() == ["pers-id"]
+
+    with patch("obi_auth.client.auth_manager_mint_access_token", side_effect=counting_mint):
+        benchmark.pedantic(run, setup=setup, rounds=3)
@@ -0,0 +1,71 @@
+"""Load tests of the token flows against the local emulator, with emulated network latency."""
+
+import concurrent.futures
+import shutil
+from unittest.mock import patch
+
+import httpx2
+import pytest
+
+from obi_auth import client
+from obi_auth.config import settings
+from obi_auth.typedef import AuthMode, TokenProvider
+from tests.emulator import AuthEmulator, Faults
+
+LATENCY_SECONDS = 0.01
+N_TOKENS = 100
+N_THREADS = 32
+
+
+@pytest.fixture
+def emulator(config_dir, monkeypatch):
+    emulator = AuthEmulator(faults=Faults(latency=LATENCY_SECONDS))
+    with emulator.run():
+        monkeypatch.setattr(settings, "DOMAIN_URL", emulator.url)
+        yield emulator
+
+
+@pytest.fixture
+def clear_caches(config_dir):
+    def clear():
+        client._MEMORY_TOKEN_CACHE.clear()
+        shutil.rmtree(config_dir, ignore_errors=True)
+
+    return clear
+
+
+@pytest.mark.benchmark(group="load")
+def test_mint_throughput(benchmark, emulator, clear_caches):
+    token_ids = [f"pers-id-{i}" for i in range(N_TOKENS)]
+
+    res = benchmark.pedantic(client.get_tokens, args=(token_ids,), setup=clear_caches, rounds=5)
+
+    assert all(isinstance(token, str) for token in res.values())
+
+
+@pytest.mark.benchmark(group="load")
+def test_concurrent_get_token(benchmark, emulator, clear_caches):
+    def get_token(i):
+        return client.get_token(
+            auth_mode=AuthMode.persistent_token, persistent_token_id=f"pers-id-{i}"
+        )
+
+    def get_tokens():
+        with concurrent.futures.ThreadPoolExecutor(N_THREADS) as executor:
+            return list(executor.map(get_token, range(N_TOKENS)))
+
+    assert len(set(benchmark.pedantic(get_tokens, setup=clear_caches, rounds=5))) == N_TOKENS
+
+
+@pytest.mark.benchmark(group="load")
+def test_pkce_exchange_latency(benchmark, emulator, clear_caches):
+    def login(url):
+        httpx2.get(url, follow_redirects=True)
+
+    def get_token():
+        return client.get_token(auth_mode=AuthMode.pkce, token_provider=TokenProvider.auth_manager)
+
+    with patch("obi_auth.flows.pkce.webbrowser.open", side_effect=login):
+        token = benchmark.pedantic(get_token, setup=clear_caches, rounds=10)
+
+    assert emulator.verify_token(token)["iss"] == "auth-manager"
@@ -0,0 +1,352 @@
+"""Local stand-in for Keycloak and auth-manager.
+
+The emulator implements the endpoints used by obi_auth, so that the flows can be tested end
+to end and load tested without a live deployment:
+
+- Keycloak: ``token``, ``auth``, ``auth/device``, ``userinfo`` and ``certs``
+- auth-manager: ``token-exchange`` and ``access-token``
+
+It issues RS256 JWTs with a configurable lifetime, and can inject latency and errors.
+Point obi_auth at it with the ``OBI_AUTH_DOMAIN_URL`` setting, for example::
+
+    python -m tests.emulator --port 8080 --latency 0.05 --error-rate 0.1
+    OBI_AUTH_DOMAIN_URL=http://127.0.0.1:8080 obi-auth get-token
+"""
+
+import argparse
+import base64
+import contextlib
+import functools
+import hashlib
+import json
+import random
+import secrets
+import threading
+import time
+import uuid
+from collections import Counter
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Self
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+HOST = "127.0.0.1"
+KEY_ID = "emulator"
+KEYCLOAK_PREFIX = "/auth/realms/{realm}/protocol/openid-connect"
+AUTH_MANAGER_PREFIX = "/api/auth-manager/v1"
+
+
+@dataclass
+class Faults:
+    """Latency and errors injected in the responses.
+
+    Attributes:
+        latency: Seconds to wait before answering each request.
+        error_rate: Probability of answering a request with ``error_status``.
+        error_status: Status code of the injected errors.
+        paths: Only inject in the requests whose path ends with one of these, all if empty.
+    """
+
+    latency: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = HTTPStatus.SERVICE_UNAVAILABLE
+    paths: tuple[str, ...] = ()
+
+    def applies_to(self, path: str) -> bool:
+        return not self.paths or path.endswith(self.paths)
+
+
+@dataclass
+class _DeviceCode:
+    user_code: str
+    pending_polls: int
+
+
+@dataclass
+class _State:
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # authorization code -> PKCE code challenge
+    codes: dict[str, str] = field(default_factory=dict)
+    device_codes: dict[str, _DeviceCode] = field(default_factory=dict)
+    # persistent token id -> user
+    persistent_tokens: dict[str, str] = field(default_factory=dict)
+    requests: Counter[str] = field(default_factory=Counter)
+
+
+class AuthEmulator:
+    """Keycloak and auth-manager emulator served from a background thread."""
+
+    def __init__(
+        self,
+        *,
+        realm: str = "SBO",
+        user: str = "emulated-user",
+        token_lifetime: int = 3600,
+        device_pending_polls: int = 0,
+        device_interval: int = 1,
+        faults: Faults | None = None,
+    ):
+        """Initialize the emulator.
+
+        Args:
+            realm: Keycloak realm served.
+            user: Subject of the issued tokens.
+            token_lifetime: Lifetime in seconds of the issued access tokens.
+            device_pending_polls: Number of ``authorization_pending`` answers to a device
+                code before the user is considered logged in.
+            device_interval: Polling interval in seconds returned for the device codes.
+            faults: Latency and errors to inject.
+        """
+        self.realm = realm
+        self.user = user
+        self.token_lifetime = token_lifetime
+        self.device_pending_polls = device_pending_polls
+        self.device_interval = device_interval
+        self.faults = faults or Faults()
+        self.port: int | None = None
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._state = _State()
+
+    @property
+    def url(self) -> str:
+        """Return the domain url, to set as ``DOMAIN_URL``."""
+        return f"http://{HOST}:{self.port}"
+
+    @property
+    def requests(self) -> Counter[str]:
+        """Return the number of requests per endpoint path."""
+        return self._state.requests
+
+    @contextlib.contextmanager
+    def run(self, port: int = 0) -> Iterator[Self]:
+        """Serve the requests in a background thread, on an OS-assigned port by default."""
+        server = ThreadingHTTPServer((HOST, port), functools.partial(_Handler, emulator=self))
+        server.daemon_threads = True
+        self.port = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join(timeout=1)
+
+    def issue_token(self, *, issuer: str = "keycloak", lifetime: int | None = None) -> str:
+        """Return a signed access token."""
+        now = int(time.time())
+        payload = {
+            "iss": f"{self.url}/auth/realms/{self.realm}" if issuer == "keycloak" else issuer,
+            "sub": self.user,
+            "iat": now,
+            "exp": now + (self.token_lifetime if lifetime is None else lifetime),
+            "jti": str(uuid.uuid4()),
+        }
+        return jwt.encode(payload, self._private_key, algorithm="RS256", headers={"kid": KEY_ID})
+
+    def verify_token(self, token: str) -> dict:
+        """Return the claims of a token issued by this emulator, or raise jwt.InvalidTokenError."""
+        return jwt.decode(token, self._private_key.public_key(), algorithms=["RS256"])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler routing to the emulated endpoints."""
+
+    # keep the connections of the shared HTTP client alive
+    protocol_version = "HTTP/1.1"
+
+    def __init__(self, *args, emulator: AuthEmulator, **kwargs) -> None:
+        self.emulator = emulator
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:  # noqa: N802
+        self._dispatch("POST")
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def _dispatch(self, method: str) -> None:
+        url = urlparse(self.path)
+        emulator = self.emulator
+        form = self._read_form()
+        with emulator._state.lock:
+            emulator._state.requests[url.path] += 1
+
+        faults = emulator.faults
+        if faults.applies_to(url.path):
+            if faults.latency:
+                time.sleep(faults.latency)
+            if random.random() < faults.error_rate:  # noqa: S311
+                self._respond(faults.error_status, {"error": "injected"})
+                return
+
+        keycloak = KEYCLOAK_PREFIX.format(realm=emulator.realm)
+        routes = {
+            ("POST", f"{keycloak}/token"): self._token,
+            ("GET", f"{keycloak}/auth"): self._authorize,
+            ("POST", f"{keycloak}/auth/device"): self._device_authorize,
+            ("GET", f"{keycloak}/userinfo"): self._user_info,
+            ("POST", f"{keycloak}/userinfo"): self._user_info,
+            ("GET", f"{keycloak}/certs"): self._certs,
+            ("POST", f"{AUTH_MANAGER_PREFIX}/token-exchange"): self._token_exchange,
+            ("POST", f"{AUTH_MANAGER_PREFIX}/access-token"): self._access_token,
+        }
+        if (route := routes.get((method, url.path))) is None:
+            self._respond(HTTPStatus.NOT_FOUND, {"error": "not_found"})
+            return
+        route({**{k: v[0] for k, v in parse_qs(url.query).items()}, **form})
+
+    def _token(self, params: dict[str, str]) -> None:
+        state = self.emulator._state
+        match params.get("grant_type"):
+            case "authorization_code":
+                with state.lock:
+                    code_challenge = state.codes.pop(params.get("code", ""), None)
+                if code_challenge is None or code_challenge != _s256(
+                    params.get("code_verifier", "")
+                ):
+                    self._respond(HTTPStatus.BAD_REQUEST, {"error": "invalid_grant"})
+                    return
+            case "urn:ietf:params:oauth:grant-type:device_code":
+                with state.lock:
+                    device_code = state.device_codes.get(params.get("device_code", ""))
+                    if device_code is not None and device_code.pending_polls > 0:
+                        device_code.pending_polls -= 1
+                        self._respond(HTTPStatus.BAD_REQUEST, {"error": "authorization_pending"})
+                        return
+                    state.device_codes.pop(params.get("device_code", ""), None)
+                if device_code is None:
+                    self._respond(HTTPStatus.BAD_REQUEST, {"error": "expired_token"})
+                    return
+            case _:
+                self._respond(HTTPStatus.BAD_REQUEST, {"error": "unsupported_grant_type"})
+                return
+        self._respond(
+            HTTPStatus.OK,
+            {
+                "access_token": self.emulator.issue_token(),
+                "token_type": "Bearer",
+                "expires_in": self.emulator.token_lifetime,
+            },
+        )
+
+    def _authorize(self, params: dict[str, str]) -> None:
+        """Log the user in immediately, and redirect with an authorization code."""
+        code = secrets.token_urlsafe(16)
+        with self.emulator._state.lock:
+            self.emulator._state.codes[code] = params.get("code_challenge", "")
+        query = urlencode({"code": code, "state": params.get("state", "")})
+        self.send_response(HTTPStatus.FOUND)
+        self.send_header("Location", f"{params['redirect_uri']}?{query}")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _device_authorize(self, params: dict[str, str]) -> None:
+        emulator = self.emulator
+        device_code = secrets.token_urlsafe(16)
+        user_code = secrets.token_hex(4).upper()
+        with emulator._state.lock:
+            emulator._state.device_codes[device_code] = _DeviceCode(
+                user_code=user_code, pending_polls=emulator.device_pending_polls
+            )
+        verification_uri = f"{emulator.url}/device"
+        self._respond(
+            HTTPStatus.OK,
+            {
+                "device_code": device_code,
+                "user_code": user_code,
+                "verification_uri": verification_uri,
+                "verification_uri_complete": f"{verification_uri}?user_code={user_code}",
+                "expires_in": 600,
+                "interval": emulator.device_interval,
+            },
+        )
+
+    def _user_info(self, params: dict[str, str]) -> None:
+        if (claims := self._authenticate()) is not None:
+            self._respond(HTTPStatus.OK, {"sub": claims["sub"], "name": claims["sub"]})
+
+    def _certs(self, params: dict[str, str]) -> None:
+        jwk = json.loads(
+            jwt.algorithms.RSAAlgorithm.to_jwk(self.emulator._private_key.public_key())
+        )
+        self._respond(HTTPStatus.OK, {"keys": [{**jwk, "kid": KEY_ID, "alg": "RS256"}]})
+
+    def _token_exchange(self, params: dict[str, str]) -> None:
+        if (claims := self._authenticate()) is None:
+            return
+        persistent_token_id = str(uuid.uuid4())
+        with self.emulator._state.lock:
+            self.emulator._state.persistent_tokens[persistent_token_id] = claims["sub"]
+        self._respond(HTTPStatus.OK, {"data": {"id": persistent_token_id}})
+
+    def _access_token(self, params: dict[str, str]) -> None:
+        # unknown ids are accepted, as persistent tokens are often created beforehand
+        if not self.headers.get("id"):
+            self._respond(HTTPStatus.UNAUTHORIZED, {"error": "missing persistent token id"})
+            return
+        token = self.emulator.issue_token(issuer="auth-manager")
+        self._respond(HTTPStatus.OK, {"data": {"access_token": token}})
+
+    def _authenticate(self) -> dict | None:
+        """Return the claims of the bearer token, or answer 401."""
+        authorization = self.headers.get("Authorization", "")
+        try:
+            return self.emulator.verify_token(authorization.removeprefix("Bearer "))
+        except jwt.InvalidTokenError:
+            self._respond(HTTPStatus.UNAUTHORIZED, {"error": "invalid_token"})
+            return None
+
+    def _read_form(self) -> dict[str, str]:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        return {k: v[0] for k, v in parse_qs(body).items()}
+
+    def _respond(self, status: int, payload: dict[str, Any]) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _s256(code_verifier: str) -> str:
+    digest = hashlib.sha256(code_verifier.encode()).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def main() -> None:
+    """Run the emulator until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--token-lifetime", type=int, default=3600)
+    parser.add_argument("--device-pending-polls", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=HTTPStatus.SERVICE_UNAVAILABLE)
+    args = parser.parse_args()
+
+    emulator = AuthEmulator(
+        token_lifetime=args.token_lifetime,
+        device_pending_polls=args.device_pending_polls,
+        faults=Faults(
+            latency=args.latency, error_rate=args.error_rate, error_status=args.error_status
+        ),
+    )
+    with emulator.run(port=args.port):
+        print(f"Emulator listening on {emulator.url}, set OBI_AUTH_DOMAIN_URL to use it")
+        with contextlib.suppress(KeyboardInterrupt):
+            threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,55 @@
+import fakeredis
+import keyring
 import pytest
+from keyring.backend import KeyringBackend
+from keyring.errors import PasswordDeleteError
 
+from obi_auth import storage
 from obi_auth.config import Settings
 
 
+class MemoryKeyring(KeyringBackend):
+    """Keyring keeping the passwords in memory."""
+
+    priority = 1
+
+    def __init__(self):
+        super().__init__()
+        self.passwords = {}
+
+    def get_password(self, service, username):
+        return self.passwords.get((service, username))
+
+    def set_password(self, service, username, password):
+        # like the real backends, which only store strings
+        if not isinstance(password, str):
+            raise TypeError(f"password must be a str, not {type(password).__name__}")
+        self.passwords[service, username] = password
+
+    def delete_password(self, service, username):
+        if self.passwords.pop((service, username), None) is None:
+            raise PasswordDeleteError(username)
+
+
 @pytest.fixture
 def settings(monkeypatch):
     monkeypatch.setenv("KEYCLOAK_ENV", "staging")
     monkeypatch.setenv("KEYCLOAK_REALM", "SBO")
     return Settings()
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """Return a local stand-in of a Redis server, used by the redis storage backend."""
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(storage, "_get_redis_client", lambda url: client)
+    return client
+
+
+@pytest.fixture
+def memory_keyring():
+    """Set an in-memory keyring, used by the keyring storage backend."""
+    previous = keyring.get_keyring()
+    keyring.set_keyring(backend := MemoryKeyring())
+    yield backend
+    keyring.set_keyring(previous)
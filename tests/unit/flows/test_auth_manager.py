@@ -1,3 +1,6 @@
+import asyncio
+
+import httpx2
 import pytest
 
 from obi_auth.config import settings
@@ -76,3 +79,79 @@ def test_auth_manager_exchange_token__mint_raises(httpx2_mock):
             KeycloakTokenInfo(access_token="public-token"),  # noqa: S106
             environment="staging",
         )
+
+
+def test_auth_manager_mint_access_token_async(httpx2_mock):
+    httpx2_mock.post(
+        settings.get_auth_manager_access_token_endpoint(override_env="staging")
+    ).respond(json={"data": {"access_token": "minted-token"}})
+    res = asyncio.run(
+        test_module.auth_manager_mint_access_token_async("persistent-id", environment="staging")
+    )
+    assert res == AuthManagerTokenInfo(
+        access_token="minted-token",  # noqa: S106
+        persistent_token_id="persistent-id",  # noqa: S106
+    )
+    assert httpx2_mock.calls[0].request.headers["id"] == "persistent-id"
+
+
+def test_auth_manager_exchange_token_async(httpx2_mock):
+    httpx2_mock.post(
+        settings.get_auth_manager_token_exchange_endpoint(override_env="staging")
+    ).respond(json={"data": {"id": "exchanged-id"}})
+    httpx2_mock.post(
+        settings.get_auth_manager_access_token_endpoint(override_env="staging")
+    ).respond(json={"data": {"access_token": "minted-token"}})
+
+    res = asyncio.run(
+        test_module.auth_manager_exchange_token_async(
+            KeycloakTokenInfo(access_token="public-token"),  # noqa: S106
+            environment="staging",
+        )
+    )
+    assert res == AuthManagerTokenInfo(
+        access_token="minted-token",  # noqa: S106
+        persistent_token_id="exchanged-id",  # noqa: S106
+    )
+    requests = [call.request for call in httpx2_mock.calls]
+    assert requests[0].headers["Authorization"] == "Bearer public-token"
+    assert requests[1].headers["id"] == "exchanged-id"
+
+
+def test_auth_manager_exchange_token_async__raises(httpx2_mock):
+    httpx2_mock.post(
+        settings.get_auth_manager_token_exchange_endpoint(override_env="staging")
+    ).respond(json={"data": {}})
+    with pytest.raises(AuthFlowError, match="AuthManager unexpected payload"):
+        asyncio.run(
+            test_module.auth_manager_exchange_token_async(
+                KeycloakTokenInfo(access_token="public-token"),  # noqa: S106
+                environment="staging",
+            )
+        )
+
+
+def test_auth_manager_mint_access_token__retried(httpx2_mock, monkeypatch):
+    monkeypatch.setattr("obi_auth.resilience._BREAKERS", {})
+    monkeypatch.setattr("obi_auth.resilience.time.sleep", lambda delay: None)
+    route = httpx2_mock.post(
+        settings.get_auth_manager_access_token_endpoint(override_env="staging")
+    ).respond(503)
+
+    with pytest.raises(httpx2.HTTPStatusError):
+        test_module.auth_manager_mint_access_token("persistent-id", environment="staging")
+    assert route.call_count == settings.AUTH_MANAGER_MAX_RETRIES + 1
+
+
+def test_auth_manager_exchange_token__not_retried(httpx2_mock, monkeypatch):
+    monkeypatch.setattr("obi_auth.resilience._BREAKERS", {})
+    route = httpx2_mock.post(
+        settings.get_auth_manager_token_exchange_endpoint(override_env="staging")
+    ).respond(504)
+
+    with pytest.raises(httpx2.HTTPStatusError):
+        test_module.auth_manager_exchange_token(
+            KeycloakTokenInfo(access_token="public-token"),  # noqa: S106
+            environment="staging",
+        )
+    assert route.call_count == 1
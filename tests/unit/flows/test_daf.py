@@ -1,7 +1,12 @@
-from unittest.mock import patch
+import asyncio
+import logging
+import threading
+from unittest.mock import AsyncMock, call, patch
 
+import httpx2
 import pytest
 
+from obi_auth.config import settings
 from obi_auth.exception import AuthFlowError
 from obi_auth.flows import daf as test_module
 from obi_auth.typedef import AuthDeviceInfo, DeploymentEnvironment, KeycloakTokenInfo
@@ -21,6 +26,32 @@ def device_info():
     )
 
 
+class FakeClock:
+    """Monotonic clock advancing only while waiting."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.delays = []
+
+    def monotonic(self):
+        return self.now
+
+    def wait(self, delay):
+        self.delays.append(delay)
+        self.now += delay
+        return False
+
+    async def sleep(self, delay):
+        self.wait(delay)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(test_module.time, "monotonic", clock.monotonic)
+    return clock
+
+
 @patch("obi_auth.flows.daf._poll_device_code_token")
 @patch("obi_auth.flows.daf._display_auth_prompt")
 @patch("obi_auth.flows.daf._get_device_url_code")
@@ -36,7 +67,7 @@ def test_daf_authenticate_success(
 
     assert result == KeycloakTokenInfo(access_token="test_token")  # noqa: S106
     mock_display_prompt.assert_called_once_with(device_info)
-    mock_poll.assert_called_once_with(device_info, DeploymentEnvironment.staging)
+    mock_poll.assert_called_once_with(device_info, DeploymentEnvironment.staging, cancel_event=None)
     mock_print.assert_called_with("\r   ✓ Authentication completed successfully!", flush=True)
 
 
@@ -51,14 +82,52 @@ def test_daf_authenticate_failure(
     mock_get_device_url.return_value = device_info
     mock_poll.return_value = None
 
-    with pytest.raises(AuthFlowError, match="Polling using device code reached max retries."):
+    with pytest.raises(AuthFlowError, match="Device code expired"):
         test_module.daf_authenticate(environment=DeploymentEnvironment.staging)
 
     mock_display_prompt.assert_called_once_with(device_info)
-    mock_poll.assert_called_once_with(device_info, DeploymentEnvironment.staging)
+    mock_poll.assert_called_once_with(device_info, DeploymentEnvironment.staging, cancel_event=None)
     mock_print.assert_called_with("\r   ✗ Authentication failed - timeout reached", flush=True)
 
 
+def _mock_expired_device_code(httpx2_mock, device_info):
+    device_info.expires_in = 600
+    httpx2_mock.post(
+        settings.get_keycloak_device_auth_endpoint(DeploymentEnvironment.staging)
+    ).respond(json=device_info.model_dump(mode="json"))
+    return httpx2_mock.post(
+        settings.get_keycloak_token_endpoint(DeploymentEnvironment.staging)
+    ).respond(400, json={"error": "expired_token"})
+
+
+@patch("obi_auth.flows.daf._display_auth_prompt")
+@patch("builtins.print")
+def test_daf_authenticate_expired_token(mock_print, mock_display_prompt, httpx2_mock, device_info):
+    token_route = _mock_expired_device_code(httpx2_mock, device_info)
+
+    # stops polling when keycloak reports the expiry, before the expires_in deadline
+    with pytest.raises(AuthFlowError, match="Device code expired"):
+        test_module.daf_authenticate(environment=DeploymentEnvironment.staging)
+    assert token_route.call_count == 1
+
+
+@patch("obi_auth.flows.daf._display_auth_prompt")
+@patch("builtins.print")
+def test_daf_authenticate_async_expired_token(
+    mock_print, mock_display_prompt, httpx2_mock, device_info
+):
+    token_route = _mock_expired_device_code(httpx2_mock, device_info)
+
+    with pytest.raises(AuthFlowError, match="Device code expired"):
+        asyncio.run(test_module.daf_authenticate_async(environment=DeploymentEnvironment.staging))
+    assert token_route.call_count == 1
+
+
+def test_device_info_max_retries(device_info):
+    with pytest.warns(DeprecationWarning, match="max_retries is deprecated"):
+        assert device_info.max_retries == 2
+
+
 def test_device_code_token(httpx2_mock, device_info):
     httpx2_mock.post().respond(json={"access_token": "foo"})
 
@@ -71,47 +140,79 @@ def test_device_code_token(httpx2_mock, device_info):
     assert res is None
 
 
+def test_device_code_token_slow_down(httpx2_mock, device_info):
+    httpx2_mock.post().respond(400, json={"error": "slow_down"})
+    with pytest.raises(test_module._SlowDown):
+        test_module._get_device_code_token(device_info, None)
+
+    httpx2_mock.reset()
+    httpx2_mock.post().respond(400, json={"error": "expired_token"})
+    with pytest.raises(test_module._Expired):
+        test_module._get_device_code_token(device_info, None)
+
+    httpx2_mock.reset()
+    httpx2_mock.post().respond(400, json={"error": "access_denied"})
+    with pytest.raises(httpx2.HTTPStatusError):
+        test_module._get_device_code_token(device_info, None)
+
+
 @patch("obi_auth.flows.daf._get_device_code_token")
-def test_poll_device_code_token(mock_code_token_method, device_info):
+def test_poll_device_code_token(mock_code_token_method, device_info, clock):
     """Test _poll_device_code_token returns None when no token is available."""
     mock_code_token_method.return_value = None
 
     device_info.expires_in = 1
-    result = test_module._poll_device_code_token(device_info, None)
+    cancel_event = threading.Event()
+    with patch.object(cancel_event, "wait", side_effect=clock.wait):
+        result = test_module._poll_device_code_token(device_info, None, cancel_event=cancel_event)
     assert result is None
+    assert clock.delays == [1]
+    assert mock_code_token_method.call_count == 2
 
 
 @patch("obi_auth.flows.daf._get_device_code_token")
-def test_poll_device_code_token_success(mock_code_token_method, device_info):
+def test_poll_device_code_token_success(mock_code_token_method, device_info, caplog):
     """Test _poll_device_code_token returns token on success."""
     mock_code_token_method.return_value = "test_token"
 
-    result = test_module._poll_device_code_token(device_info, DeploymentEnvironment.staging)
+    with caplog.at_level(logging.INFO, logger=test_module.__name__):
+        result = test_module._poll_device_code_token(device_info, DeploymentEnvironment.staging)
 
     assert result == "test_token"
     mock_code_token_method.assert_called_once_with(device_info, DeploymentEnvironment.staging)
+    assert "Device authentication completed after 1 polls" in caplog.text
 
 
 @patch("obi_auth.flows.daf._get_device_code_token")
-def test_poll_device_code_token_timeout(mock_code_token_method, device_info):
-    """Test _poll_device_code_token returns None on timeout."""
-    mock_code_token_method.return_value = None
+def test_poll_device_code_token_timeout(mock_code_token_method, device_info, clock, caplog):
+    """Test _poll_device_code_token stops polling when the device code expires."""
+    mock_code_token_method.side_effect = test_module._SlowDown
+    device_info.expires_in = 20
+
+    cancel_event = threading.Event()
+    with (
+        patch.object(cancel_event, "wait", side_effect=clock.wait),
+        caplog.at_level(logging.INFO, logger=test_module.__name__),
+    ):
+        result = test_module._poll_device_code_token(device_info, None, cancel_event=cancel_event)
 
-    # Create a new device_info with max_retries=1
-    timeout_device_info = AuthDeviceInfo.model_validate(
-        {
-            "user_code": "user_code",
-            "verification_uri": "foo",
-            "verification_uri_complete": "foo",
-            "device_code": "bar",
-            "expires_in": 2,
-            "interval": 1,
-            "max_retries": 1,
-        }
-    )
-
-    result = test_module._poll_device_code_token(timeout_device_info, DeploymentEnvironment.staging)
     assert result is None
+    # the interval grows on each slow_down, and the last poll happens when the code expires
+    assert clock.delays == [6, 11, 3]
+    assert mock_code_token_method.call_count == 4
+    assert "Device authentication expired after 4 polls in 20.0s" in caplog.text
+
+
+@patch("obi_auth.flows.daf._get_device_code_token")
+def test_poll_device_code_token_cancelled(mock_code_token_method, device_info):
+    mock_code_token_method.return_value = None
+    device_info.expires_in = 60
+    cancel_event = threading.Event()
+
+    threading.Timer(0.1, cancel_event.set).start()
+    with pytest.raises(AuthFlowError, match="Device authentication was cancelled."):
+        test_module._poll_device_code_token(device_info, None, cancel_event=cancel_event)
+    assert mock_code_token_method.call_count == 1
 
 
 @patch("obi_auth.flows.daf.is_running_in_notebook")
@@ -159,9 +260,10 @@ def test_display_notebook_auth_prompt_fallback(mock_terminal, mock_console, devi
     mock_terminal.assert_called_once_with(device_info)
 
 
-@patch("obi_auth.flows.daf.httpx2.post")
-def test_get_device_url_code(mock_post, device_info):
+@patch("obi_auth.flows.daf.get_client")
+def test_get_device_url_code(mock_get_client, device_info):
     """Test _get_device_url_code function."""
+    mock_post = mock_get_client.return_value.post
     mock_response = mock_post.return_value
     mock_response.json.return_value = device_info.model_dump(mode="json")
 
@@ -179,3 +281,77 @@ def test_display_terminal_auth_prompt(mock_print, device_info):
     # Verify print was called for each part of the message
     # title + 3 steps + url + verification_uri_complete = 6 calls
     assert mock_print.call_count == 6
+
+
+@patch("obi_auth.flows.daf._display_auth_prompt")
+@patch("builtins.print")
+def test_daf_authenticate_async_success(mock_print, mock_display_prompt, httpx2_mock, device_info):
+    httpx2_mock.post(
+        settings.get_keycloak_device_auth_endpoint(DeploymentEnvironment.staging)
+    ).respond(json=device_info.model_dump(mode="json"))
+    httpx2_mock.post(settings.get_keycloak_token_endpoint(DeploymentEnvironment.staging)).respond(
+        json={"access_token": "test_token"}
+    )
+
+    result = asyncio.run(
+        test_module.daf_authenticate_async(environment=DeploymentEnvironment.staging)
+    )
+
+    assert result == KeycloakTokenInfo(access_token="test_token")  # noqa: S106
+    mock_display_prompt.assert_called_once_with(device_info)
+    mock_print.assert_called_with("\r   ✓ Authentication completed successfully!", flush=True)
+
+
+@patch("obi_auth.flows.daf._poll_device_code_token_async", new_callable=AsyncMock)
+@patch("obi_auth.flows.daf._display_auth_prompt")
+@patch("obi_auth.flows.daf._get_device_url_code_async", new_callable=AsyncMock)
+@patch("builtins.print")
+def test_daf_authenticate_async_failure(
+    mock_print, mock_get_device_url, mock_display_prompt, mock_poll, device_info
+):
+    mock_get_device_url.return_value = device_info
+    mock_poll.return_value = None
+
+    with pytest.raises(AuthFlowError, match="Device code expired"):
+        asyncio.run(test_module.daf_authenticate_async(environment=DeploymentEnvironment.staging))
+
+    mock_poll.assert_awaited_once_with(device_info, DeploymentEnvironment.staging)
+    mock_print.assert_called_with("\r   ✗ Authentication failed - timeout reached", flush=True)
+
+
+def test_device_code_token_async(httpx2_mock, device_info):
+    httpx2_mock.post().respond(json={"access_token": "foo"})
+    assert asyncio.run(test_module._get_device_code_token_async(device_info, None)) == "foo"
+
+    httpx2_mock.reset()
+    httpx2_mock.post().respond(400, json={"error": "authorization_pending"})
+    assert asyncio.run(test_module._get_device_code_token_async(device_info, None)) is None
+
+
+@patch("obi_auth.flows.daf._get_device_code_token_async", new_callable=AsyncMock)
+def test_poll_device_code_token_async_timeout(mock_code_token_method, device_info, clock):
+    mock_code_token_method.side_effect = [None, test_module._SlowDown, None]
+    device_info.expires_in = 7
+
+    with patch("obi_auth.flows.daf.asyncio.sleep", side_effect=clock.sleep) as mock_sleep:
+        result = asyncio.run(test_module._poll_device_code_token_async(device_info, None))
+
+    assert result is None
+    assert mock_code_token_method.await_count == 3
+    assert mock_sleep.call_args_list == [call(1), call(6)]
+
+
+@patch("obi_auth.flows.daf._get_device_code_token_async", new_callable=AsyncMock)
+def test_poll_device_code_token_async_cancelled(mock_code_token_method, device_info):
+    mock_code_token_method.return_value = None
+    device_info.expires_in = 60
+
+    async def run():
+        task = asyncio.create_task(test_module._poll_device_code_token_async(device_info, None))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(run())
+    assert mock_code_token_method.await_count == 1
@@ -1,6 +1,8 @@
-from unittest.mock import Mock, patch
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
 
 from obi_auth.flows import pkce as test_module
+from obi_auth.typedef import KeycloakTokenInfo
 
 
 def test_build_auth_url():
@@ -51,3 +53,18 @@ def test_authorize(mocked_webbrowser, mock_generate_state):
     mocked_webbrowser.open.assert_called_once()
     opened_url = mocked_webbrowser.open.call_args.args[0]
     assert "state=generated-state" in opened_url
+
+
+@patch("obi_auth.flows.pkce._generate_state", return_value="generated-state")
+@patch("obi_auth.flows.pkce.webbrowser")
+def test_pkce_authenticate_async(mocked_webbrowser, mock_generate_state, httpx2_mock):
+    httpx2_mock.post().respond(json={"access_token": "mock-token"})
+    mock_server = Mock()
+    mock_server.redirect_uri = "http://localhost:8000/callback"
+    mock_server.wait_for_code_async = AsyncMock(return_value="mock-code")
+
+    res = asyncio.run(test_module.pkce_authenticate_async(server=mock_server))
+    assert res == KeycloakTokenInfo(access_token="mock-token")  # noqa: S106
+    mock_server.expect_state.assert_called_once_with("generated-state")
+    mocked_webbrowser.open.assert_called_once()
+    assert httpx2_mock.calls[0].request.content.startswith(b"grant_type=authorization_code")
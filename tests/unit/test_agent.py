@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import socket
+from unittest.mock import patch
+
+import pytest
+
+from obi_auth import agent as test_module
+from obi_auth import client
+from obi_auth.config import settings
+from obi_auth.exception import ClientError, LocalServerError
+from obi_auth.typedef import AuthMode, DeploymentEnvironment, TokenCacheKey, TokenProvider
+
+KEY = TokenCacheKey(
+    DeploymentEnvironment.staging,
+    AuthMode.persistent_token,
+    TokenProvider.auth_manager,
+    "pers-id",
+)
+
+
+@pytest.fixture
+def socket_path(tmp_path, monkeypatch):
+    path = tmp_path / "agent.sock"
+    monkeypatch.setattr(settings, "AGENT_SOCKET", path)
+    return path
+
+
+@pytest.fixture
+def memory_cache():
+    client._MEMORY_TOKEN_CACHE.clear()
+    yield client._MEMORY_TOKEN_CACHE
+    client._MEMORY_TOKEN_CACHE.clear()
+
+
+@pytest.fixture
+def running_agent(socket_path, memory_cache):
+    with test_module.TokenAgent().run() as agent:
+        yield agent
+
+
+@pytest.fixture
+def acquire_token():
+    with patch("obi_auth.client._acquire_token") as mock_acquire:
+        mock_acquire.return_value = "agent-token"
+        yield mock_acquire
+
+
+def test_get_socket_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "AGENT_SOCKET", None)
+    monkeypatch.setattr(settings, "config_dir", tmp_path)
+    assert test_module.get_socket_path() == tmp_path / "agent.sock"
+
+    monkeypatch.setattr(settings, "AGENT_SOCKET", tmp_path / "other.sock")
+    assert test_module.get_socket_path() == tmp_path / "other.sock"
+
+
+def test_request_token(running_agent, acquire_token, memory_cache):
+    assert running_agent.socket_path.stat().st_mode & 0o777 == 0o600
+
+    assert test_module.request_token(KEY, force_refresh=False) == "agent-token"
+    acquire_token.assert_called_once_with(KEY, force_refresh=False)
+
+    # the agent keeps the token in its memory cache
+    with patch.object(memory_cache, "get", return_value="cached-token"):
+        assert test_module.request_token(KEY, force_refresh=False) == "cached-token"
+    acquire_token.assert_called_once()
+
+    assert test_module.request_token(KEY, force_refresh=True) == "agent-token"
+    acquire_token.assert_called_with(KEY, force_refresh=True)
+
+
+def test_request_token_errors(running_agent, acquire_token):
+    acquire_token.side_effect = ClientError("Local server failed to authenticate.")
+    with pytest.raises(ClientError, match="Local server failed to authenticate."):
+        test_module.request_token(KEY, force_refresh=False)
+
+    acquire_token.side_effect = RuntimeError("boom")
+    with pytest.raises(ClientError, match="Authentication process failed."):
+        test_module.request_token(KEY, force_refresh=False)
+
+
+@patch("obi_auth.client._pkce_authenticate")
+def test_request_token_login_required(mock_pkce, running_agent, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "config_dir", tmp_path / "config")
+    key = TokenCacheKey(DeploymentEnvironment.staging, AuthMode.pkce, TokenProvider.keycloak, None)
+
+    # the client runs the login itself
+    assert test_module.request_token(key, force_refresh=False) is None
+    assert asyncio.run(test_module.request_token_async(key, force_refresh=True)) is None
+    mock_pkce.assert_not_called()
+
+
+def test_request_token_invalid_request(running_agent):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(running_agent.socket_path))
+        sock.sendall(b'{"environment": "staging"}\n')
+        with sock.makefile("rb") as reader:
+            response = json.loads(reader.readline())
+    assert response == {"error": "Authentication process failed."}
+
+
+def test_request_token_without_agent(socket_path):
+    assert test_module.request_token(KEY, force_refresh=False) is None
+
+    # left by a stopped agent
+    socket_path.touch()
+    assert test_module.request_token(KEY, force_refresh=False) is None
+
+
+def test_request_token_async(running_agent, acquire_token):
+    assert asyncio.run(test_module.request_token_async(KEY, force_refresh=False)) == "agent-token"
+
+    acquire_token.side_effect = ClientError("Authentication process failed.")
+    with pytest.raises(ClientError, match="Authentication process failed."):
+        asyncio.run(test_module.request_token_async(KEY, force_refresh=True))
+
+
+def test_request_token_async_without_agent(socket_path):
+    assert asyncio.run(test_module.request_token_async(KEY, force_refresh=False)) is None
+
+    socket_path.touch()
+    assert asyncio.run(test_module.request_token_async(KEY, force_refresh=False)) is None
+
+
+def test_decode_response():
+    assert test_module._decode_response(b"") is None
+    assert test_module._decode_response(b'{"access_token": "foo"}\n') == "foo"
+    assert test_module._decode_response(b'{"login_required": true}\n') is None
+
+
+def test_agent_already_listening(running_agent, socket_path):
+    assert socket_path.exists()
+    with pytest.raises(LocalServerError, match="An agent is already listening"):
+        with test_module.TokenAgent(socket_path).run():
+            pass
+
+
+def test_agent_removes_socket(socket_path):
+    with test_module.TokenAgent().run():
+        assert socket_path.exists()
+    assert not socket_path.exists()
+
+
+def test_agent_removes_stale_socket(socket_path, acquire_token, memory_cache):
+    socket_path.touch()
+    with test_module.TokenAgent().run():
+        assert test_module.request_token(KEY, force_refresh=False) == "agent-token"
+
+
+@patch("os.chmod")
+def test_agent_socket_created_private(mock_chmod, socket_path):
+    umask = os.umask(0o022)
+    try:
+        with test_module.TokenAgent().run():
+            assert socket_path.stat().st_mode & 0o077 == 0
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(umask)
+
+
+def test_agent_listen_failure(tmp_path):
+    socket_path = tmp_path / ("x" * 120)
+    with pytest.raises(LocalServerError, match="Failed to listen on"):
+        with test_module.TokenAgent(socket_path).run():
+            pass
+
+
+@patch("socketserver.ThreadingUnixStreamServer.serve_forever")
+def test_agent_serve_forever(mock_serve, socket_path):
+    test_module.TokenAgent().serve_forever()
+    mock_serve.assert_called_once()
+    assert not socket_path.exists()
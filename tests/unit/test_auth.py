@@ -0,0 +1,141 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock, call, patch
+
+import httpx2
+import jwt
+import pytest
+
+from obi_auth import auth as test_module
+from obi_auth.typedef import AuthMode, DeploymentEnvironment, TokenProvider
+
+URL = "https://example.com/api"
+
+
+def _make_token(name, expires_in=3600):
+    now = int(time.time())
+    return jwt.encode(
+        {"name": name, "iat": now, "exp": now + expires_in}, key=None, algorithm="none"
+    )
+
+
+@pytest.fixture
+def tokens():
+    return _make_token("old"), _make_token("new")
+
+
+@pytest.fixture
+def api(httpx2_mock, tokens):
+    old, new = tokens
+    rejected = httpx2_mock.get(URL, headers={"Authorization": f"Bearer {old}"}).respond(401)
+    accepted = httpx2_mock.get(URL, headers={"Authorization": f"Bearer {new}"}).respond(200)
+    return rejected, accepted
+
+
+@patch("obi_auth.auth.get_token")
+def test_token_auth(mock_get_token, httpx2_mock):
+    token = _make_token("token")
+    mock_get_token.return_value = token
+    route = httpx2_mock.get(URL).respond(200)
+
+    auth = test_module.TokenAuth(environment="production", persistent_token_id="id")  # noqa: S106
+    with httpx2.Client(auth=auth) as client:
+        assert client.get(URL).status_code == 200
+        assert client.get(URL).status_code == 200
+
+    # the token is reused until it expires
+    mock_get_token.assert_called_once_with(
+        environment="production",
+        auth_mode=AuthMode.pkce,
+        token_provider=TokenProvider.keycloak,
+        force_refresh=False,
+        persistent_token_id="id",  # noqa: S106
+    )
+    assert [c.request.headers["Authorization"] for c in route.calls] == [f"Bearer {token}"] * 2
+
+
+@patch("obi_auth.auth.get_token")
+def test_token_auth_expired(mock_get_token, httpx2_mock, tokens):
+    old, new = tokens
+    mock_get_token.side_effect = [_make_token("expired", expires_in=0), new]
+    httpx2_mock.get(URL).respond(200)
+
+    auth = test_module.TokenAuth()
+    with httpx2.Client(auth=auth) as client:
+        client.get(URL)
+        client.get(URL)
+
+    assert mock_get_token.call_count == 2
+    assert auth._token == new
+
+
+def test_token_auth_expiry(monkeypatch):
+    monkeypatch.setattr(test_module.settings, "EPSILON_TOKEN_TTL_SECONDS", 60)
+    monkeypatch.setattr(test_module.settings, "TOKEN_TTL_JITTER_SECONDS", 300)
+    token = _make_token("token")
+    expires_at = test_module.get_token_info(token)["exp"] - 60
+
+    # without any jitter
+    for _ in range(3):
+        auth = test_module.TokenAuth()
+        auth._set_token(token)
+        assert auth._expires_at == expires_at
+
+
+@patch("obi_auth.auth.get_token")
+def test_token_auth_unauthorized(mock_get_token, api, tokens):
+    old, new = tokens
+    rejected, accepted = api
+    mock_get_token.side_effect = [old, new]
+
+    auth = test_module.TokenAuth()
+    with httpx2.Client(auth=auth) as client:
+        assert client.get(URL).status_code == 200
+
+    assert rejected.call_count == 1
+    assert accepted.call_count == 1
+    assert mock_get_token.call_args_list[1] == call(
+        environment=DeploymentEnvironment.staging,
+        auth_mode=AuthMode.pkce,
+        token_provider=TokenProvider.keycloak,
+        force_refresh=True,
+        persistent_token_id=None,
+    )
+
+
+@patch("obi_auth.auth.get_token")
+def test_token_auth_unauthorized_once(mock_get_token, httpx2_mock, tokens):
+    old, _ = tokens
+    mock_get_token.return_value = old
+    route = httpx2_mock.get(URL).respond(401)
+
+    with httpx2.Client(auth=test_module.TokenAuth()) as client:
+        assert client.get(URL).status_code == 401
+
+    # retried only once
+    assert route.call_count == 2
+
+
+@patch("obi_auth.auth.get_token_async", new_callable=AsyncMock)
+def test_token_auth_async(mock_get_token, api, tokens):
+    old, new = tokens
+    rejected, accepted = api
+    mock_get_token.side_effect = [old, new]
+
+    auth = test_module.TokenAuth()
+
+    async def run():
+        async with httpx2.AsyncClient(auth=auth) as client:
+            return [(await client.get(URL)).status_code for _ in range(2)]
+
+    assert asyncio.run(run()) == [200, 200]
+    assert rejected.call_count == 1
+    assert accepted.call_count == 2
+    assert mock_get_token.await_count == 2
+    assert mock_get_token.await_args.kwargs["force_refresh"] is True
+
+
+def test_token_auth_authorize():
+    request = Mock(headers={})
+    assert test_module.TokenAuth._authorize(request, "foo") is request
+    assert request.headers == {"Authorization": "Bearer foo"}
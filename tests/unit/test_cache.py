@@ -3,13 +3,20 @@ from unittest.mock import Mock
 import jwt
 import pytest
 from cryptography.fernet import Fernet
+from pydantic import SecretStr
 
 from obi_auth import cache as test_module
+from obi_auth import util
+from obi_auth.config import settings
+from obi_auth.storage import STORAGE_CLASSES, SqliteStorage
 from obi_auth.typedef import (
     AuthManagerTokenInfo,
     CachedAuthManagerTokenInfo,
     CachedTokenInfo,
+    DeploymentEnvironment,
     KeycloakTokenInfo,
+    StorageBackend,
+    TokenCacheKey,
 )
 from obi_auth.util import derive_fernet_key
 
@@ -39,6 +46,11 @@ def token(token_decoded):
     return jwt.encode(token_decoded, key=None, algorithm="none")
 
 
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(test_module.settings, "TOKEN_TTL_JITTER_SECONDS", 0)
+
+
 @pytest.fixture
 def token_expired(token_decoded):
     data = token_decoded.copy()
@@ -163,9 +175,26 @@ def test_auth_manager_token_cache__invalid_persistent_id(token):
     (cached_token_info,), _ = storage.write.call_args
     cached_token_info.persistent_token_id = b"invalid"
 
+    # left to the hosts that can decrypt it
     storage.read.return_value = cached_token_info
     assert cache.get(storage) is None
-    storage.clear.assert_called_once()
+    storage.clear.assert_not_called()
+
+
+def test_auth_manager_token_cache__get_many(token, tmp_path):
+    storages = [
+        SqliteStorage(tmp_path, DeploymentEnvironment.staging, key) for key in ("a", "b", "c")
+    ]
+    cache = test_module.AuthManagerTokenCache()
+    token_info = AuthManagerTokenInfo(
+        access_token=token,
+        persistent_token_id="persistent-id",  # noqa: S106
+    )
+    cache.set(token_info, storages[0])
+    cache.set(token_info, storages[2])
+
+    assert cache.get_many(storages) == [token_info, None, token_info]
+    assert cache.get_many([]) == []
 
 
 def test_auth_manager_token_cache__set_without_access_token():
@@ -175,3 +204,227 @@ def test_auth_manager_token_cache__set_without_access_token():
             AuthManagerTokenInfo(access_token=None, persistent_token_id="id"),  # noqa: S106
             Mock(),
         )
+
+
+def _make_token_info(cache_class, token):
+    if cache_class is test_module.TokenCache:
+        return KeycloakTokenInfo(access_token=token)
+    return AuthManagerTokenInfo(access_token=token, persistent_token_id="id")  # noqa: S106
+
+
+@pytest.fixture
+def set_host(monkeypatch):
+    """Return a function deriving the keys of the caches created next from a host name."""
+
+    def set_host(name):
+        monkeypatch.setattr(util, "get_machine_salt", lambda: name.encode())
+        util.derive_fernet_key.cache_clear()
+
+    yield set_host
+    util.derive_fernet_key.cache_clear()
+
+
+@pytest.mark.parametrize("cache_class", [test_module.TokenCache, test_module.AuthManagerTokenCache])
+@pytest.mark.parametrize("backend", [StorageBackend.sqlite, StorageBackend.redis])
+def test_token_cache__other_key(request, token, tmp_path, set_host, caplog, cache_class, backend):
+    if backend == StorageBackend.redis:
+        request.getfixturevalue("redis_client")
+    token_info = _make_token_info(cache_class, token)
+    storage = STORAGE_CLASSES[backend](tmp_path, DeploymentEnvironment.staging, "key")
+    set_host("host-a")
+    host_a_cache = cache_class()
+    host_a_cache.set(token_info, storage)
+
+    set_host("host-b")
+    assert cache_class().get(storage) is None
+    assert "encrypted with another key" in caplog.text
+
+    # the entry is left to the host that can read it
+    assert host_a_cache.get(storage) == token_info
+
+
+@pytest.mark.parametrize("cache_class", [test_module.TokenCache, test_module.AuthManagerTokenCache])
+def test_token_cache__shared_key(token, tmp_path, set_host, monkeypatch, cache_class):
+    token_info = _make_token_info(cache_class, token)
+    storage = SqliteStorage(tmp_path, DeploymentEnvironment.staging, "key")
+    monkeypatch.setattr(settings, "ENCRYPTION_KEY", SecretStr("shared-secret"))
+    set_host("host-a")
+    cache_class().set(token_info, storage)
+
+    set_host("host-b")
+    assert cache_class().get(storage) == token_info
+
+
+def test_memory_token_cache(token, token_expired):
+    cache = test_module.MemoryTokenCache()
+    key = TokenCacheKey("staging", "pkce", "keycloak")
+    other_key = TokenCacheKey("staging", "persistent_token", "auth_manager", "persistent-id")
+
+    assert cache.get(key) is None
+
+    cache.set(key, token)
+    assert cache.get(key) == token
+    assert cache.get(other_key) is None
+
+    # expired tokens are dropped on read
+    cache.set(other_key, token_expired)
+    assert cache.get(other_key) is None
+    assert other_key not in cache._entries
+
+    cache.clear(key)
+    assert cache.get(key) is None
+
+    cache.set(key, token)
+    cache.set(other_key, token)
+    cache.clear()
+    assert cache._entries == {}
+
+    # clearing a missing key is a no-op
+    cache.clear(key)
+
+
+def test_memory_token_cache__was_read(token):
+    cache = test_module.MemoryTokenCache()
+    key = TokenCacheKey("staging", "pkce", "keycloak")
+    assert cache.was_read(key) is False
+
+    cache.set(key, token)
+    assert cache.was_read(key) is False
+    cache.get(key)
+    assert cache.was_read(key) is True
+
+    # a new token is unread until it is hit
+    cache.set(key, token)
+    assert cache.was_read(key) is False
+
+    cache.get(key)
+    cache.clear(key)
+    assert cache.was_read(key) is False
+    cache.set(key, token)
+    cache.get(key)
+    cache.clear()
+    assert cache.was_read(key) is False
+
+
+def test_memory_token_cache__effective_ttl(token, issued_at, expires_at, no_jitter, monkeypatch):
+    cache = test_module.MemoryTokenCache()
+    key = TokenCacheKey("staging", "pkce", "keycloak")
+    cache.set(key, token)
+
+    epsilon = test_module.settings.EPSILON_TOKEN_TTL_SECONDS
+    monkeypatch.setattr(test_module, "_now", lambda: expires_at - epsilon - 1)
+    assert cache.get(key) == token
+
+    monkeypatch.setattr(test_module, "_now", lambda: expires_at - epsilon)
+    assert cache.get(key) is None
+
+
+def test_token_cache__metadata(token, issued_at, expires_at, no_jitter):
+    storage = Mock()
+    cache = test_module.TokenCache()
+    cache.set(KeycloakTokenInfo(access_token=token), storage)
+
+    (cached_token_info,), _ = storage.write.call_args
+    epsilon = test_module.settings.EPSILON_TOKEN_TTL_SECONDS
+    assert cached_token_info.iat == issued_at
+    assert cached_token_info.exp == expires_at - epsilon
+    assert cache.get_expiry_time(cached_token_info) == cached_token_info.exp
+
+
+def test_token_cache__expired_metadata_skips_decryption(token, monkeypatch):
+    storage = Mock()
+    cache = test_module.TokenCache()
+    cache.set(KeycloakTokenInfo(access_token=token), storage)
+    (cached_token_info,), _ = storage.write.call_args
+    storage.read.return_value = cached_token_info.model_copy(update={"exp": 0})
+
+    decrypt = Mock()
+    monkeypatch.setattr(cache, "_decrypt_access_token", decrypt)
+    assert cache.get(storage) is None
+    decrypt.assert_not_called()
+    storage.clear.assert_called_once()
+
+
+def test_token_cache__without_metadata(token, issued_at):
+    # entries written by older versions have no iat and exp
+    storage = Mock()
+    cache = test_module.TokenCache()
+    cache.set(KeycloakTokenInfo(access_token=token), storage)
+    (cached_token_info,), _ = storage.write.call_args
+    old_cached_token_info = CachedTokenInfo(
+        token=cached_token_info.token, ttl=cached_token_info.ttl
+    )
+    storage.read.return_value = old_cached_token_info
+
+    assert cache.get(storage) == KeycloakTokenInfo(access_token=token)
+    assert cache.get_expiry_time(old_cached_token_info) == cached_token_info.exp
+
+
+def test_auth_manager_token_cache__expired_metadata_skips_decryption(token, monkeypatch):
+    storage = Mock()
+    cache = test_module.AuthManagerTokenCache()
+    cache.set(
+        AuthManagerTokenInfo(
+            access_token=token,
+            persistent_token_id="persistent-id",  # noqa: S106
+        ),
+        storage,
+    )
+    (cached_token_info,), _ = storage.write.call_args
+    assert cached_token_info.exp is not None
+    storage.read.return_value = cached_token_info.model_copy(update={"exp": 0})
+
+    decrypt = Mock()
+    monkeypatch.setattr(cache, "_decrypt_access_token", decrypt)
+    assert cache.get(storage) == AuthManagerTokenInfo(
+        access_token=None,
+        persistent_token_id="persistent-id",  # noqa: S106
+    )
+    decrypt.assert_not_called()
+    storage.clear.assert_not_called()
+
+
+def test_token_cache__expired_without_metadata(token_expired):
+    storage = Mock()
+    cache = test_module.TokenCache()
+    cache.set(KeycloakTokenInfo(access_token=token_expired), storage)
+    (cached_token_info,), _ = storage.write.call_args
+    storage.read.return_value = cached_token_info.model_copy(update={"iat": None, "exp": None})
+
+    assert cache.get(storage) is None
+    storage.clear.assert_called_once()
+
+
+def test_auth_manager_token_cache__expired_without_metadata(token_expired):
+    storage = Mock()
+    cache = test_module.AuthManagerTokenCache()
+    cache.set(
+        AuthManagerTokenInfo(
+            access_token=token_expired,
+            persistent_token_id="persistent-id",  # noqa: S106
+        ),
+        storage,
+    )
+    (cached_token_info,), _ = storage.write.call_args
+    storage.read.return_value = cached_token_info.model_copy(update={"iat": None, "exp": None})
+
+    assert cache.get(storage) == AuthManagerTokenInfo(
+        access_token=None,
+        persistent_token_id="persistent-id",  # noqa: S106
+    )
+    storage.clear.assert_not_called()
+
+
+def test_get_token_times__jitter(token, issued_at, expires_at, monkeypatch):
+    epsilon = test_module.settings.EPSILON_TOKEN_TTL_SECONDS
+    monkeypatch.setattr(test_module.settings, "TOKEN_TTL_JITTER_SECONDS", 30)
+
+    ttls = set()
+    for _ in range(100):
+        creation_time, time_to_live = test_module._get_token_times(token)
+        assert creation_time == issued_at
+        ttls.add(time_to_live)
+
+    full_ttl = expires_at - issued_at - epsilon
+    assert all(full_ttl - 30 <= ttl <= full_ttl for ttl in ttls)
+    assert len(ttls) > 1
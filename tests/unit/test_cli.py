@@ -298,3 +298,41 @@ def test_get_token_piped_to_decode_token_with_jq(tmp_path):
     assert decode_token.returncode == 0, stderr
     assert jq.returncode == 0, stderr
     assert stdout == "piped-user\n"
+
+
+@patch("obi_auth.prune_cache")
+def test_prune_cache(mock_prune, cli_runner):
+    from obi_auth.eviction import EvictionReport
+
+    mock_prune.return_value = EvictionReport(
+        expired=["token_staging_a.json"],
+        over_capacity=["token_staging_b.json"],
+        kept=3,
+        temp_files=[".token_staging_c.json.x1y2z3.tmp"],
+    )
+
+    result = cli_runner.invoke(main, ["prune-cache", "--max-entries", "3"])
+    assert result.exit_code == 0
+    assert result.output == (
+        "expired: token_staging_a.json\n"
+        "over capacity: token_staging_b.json\n"
+        "stale temporary file: .token_staging_c.json.x1y2z3.tmp\n"
+        "Evicted 2 entries, 3 kept.\n"
+    )
+    mock_prune.assert_called_with(max_entries=3, dry_run=False)
+
+    result = cli_runner.invoke(main, ["prune-cache", "--dry-run"])
+    assert result.exit_code == 0
+    assert result.output.endswith("Would evict 2 entries, 3 kept.\n")
+    mock_prune.assert_called_with(max_entries=None, dry_run=True)
+
+
+@patch("obi_auth.agent.TokenAgent")
+def test_agent(mock_agent, cli_runner, tmp_path):
+    mock_agent.return_value.socket_path = tmp_path / "agent.sock"
+    mock_agent.return_value.serve_forever.side_effect = KeyboardInterrupt
+
+    result = cli_runner.invoke(main, ["agent", "--socket", str(tmp_path / "agent.sock")])
+    assert result.exit_code == 0
+    assert f"Agent listening on {tmp_path / 'agent.sock'}" in result.output
+    mock_agent.assert_called_once_with(tmp_path / "agent.sock")
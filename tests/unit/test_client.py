@@ -1,11 +1,62 @@
-from unittest.mock import Mock, patch
+import asyncio
+import multiprocessing
+import threading
+import time
+from unittest.mock import ANY, Mock, patch
 
+import httpx2
 import jwt
 import pytest
 
 from obi_auth import client as test_module
 from obi_auth import exception
-from obi_auth.typedef import AuthManagerTokenInfo, AuthMode, KeycloakTokenInfo, TokenProvider
+from obi_auth.cache import MemoryTokenCache, _now
+from obi_auth.config import settings
+from obi_auth.lock import ThreadLock
+from obi_auth.storage import (
+    _MEMORY_ENTRIES,
+    STORAGE_CLASSES,
+    KeyringStorage,
+    MemoryStorage,
+    RedisStorage,
+    SqliteStorage,
+    Storage,
+)
+from obi_auth.typedef import (
+    AuthManagerTokenInfo,
+    AuthMode,
+    KeycloakTokenInfo,
+    LockMode,
+    StorageBackend,
+    TokenCacheKey,
+    TokenProvider,
+)
+
+
+@pytest.fixture(autouse=True)
+def memory_cache():
+    """Disable the in-memory tier so tests exercise the disk caches and flows."""
+    with patch("obi_auth.client._MEMORY_TOKEN_CACHE") as mock_cache:
+        mock_cache.get.return_value = None
+        yield mock_cache
+
+
+@pytest.fixture(autouse=True)
+def prune_cache():
+    """Do not prune the cache opportunistically, eviction is tested separately."""
+    with patch("obi_auth.client.maybe_prune_cache") as mock_prune:
+        yield mock_prune
+
+
+@pytest.fixture(autouse=True)
+def agent_socket(tmp_path, monkeypatch):
+    """Do not talk to an agent running on this host."""
+    monkeypatch.setattr(settings, "AGENT_SOCKET", tmp_path / "agent.sock")
+
+
+@pytest.fixture
+def jwt_token():
+    return jwt.encode({"iat": _now(), "exp": _now() + 3600}, key=None, algorithm="none")
 
 
 @patch("obi_auth.client._get_auth_method")
@@ -23,6 +74,25 @@ def test_get_token(mock_cache, mock_method):
     assert test_module.get_token() == "mock-token"
 
 
+@patch("obi_auth.client._get_async_auth_method")
+@patch("obi_auth.client._get_auth_method")
+@patch("obi_auth.client._TOKEN_CACHE")
+def test_get_token_prunes_cache(mock_cache, mock_method, mock_async_method, prune_cache):
+    mock_cache.get.return_value = None
+    token_info = KeycloakTokenInfo(access_token="mock-token")  # noqa: S106
+    mock_method.return_value = lambda *args, **kwargs: token_info
+
+    assert test_module.get_token() == "mock-token"
+    prune_cache.assert_called_once_with()
+
+    async def authenticate(*args, **kwargs):
+        return token_info
+
+    mock_async_method.return_value = authenticate
+    assert asyncio.run(test_module.get_token_async()) == "mock-token"
+    assert prune_cache.call_count == 2
+
+
 @patch(
     "obi_auth.client.auth_manager_exchange_token",
     return_value=AuthManagerTokenInfo(
@@ -105,10 +175,11 @@ def test_get_token_auth_manager_raises(mock_cache, mock_method, mock_auth_manage
         test_module.get_token(token_provider=TokenProvider.auth_manager)
 
 
-@patch("obi_auth.client.Storage")
+@patch("obi_auth.client._get_storage")
 @patch("obi_auth.client._get_auth_method")
 @patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
 def test_get_token_auth_manager_force_refresh(mock_cache, mock_method, mock_storage):
+    mock_storage.return_value.lock.return_value = ThreadLock("token", timeout=1)
     mock_method.return_value = lambda *args, **kwargs: KeycloakTokenInfo(
         access_token="fresh-token"  # noqa: S106
     )
@@ -230,7 +301,7 @@ def test_get_token_persistent_token_raises(mock_cache, mock_mint):
         )
 
 
-@patch("obi_auth.client.Storage")
+@patch("obi_auth.client._get_storage")
 @patch(
     "obi_auth.client.auth_manager_mint_access_token",
     return_value=AuthManagerTokenInfo(
@@ -240,6 +311,7 @@ def test_get_token_persistent_token_raises(mock_cache, mock_mint):
 )
 @patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
 def test_get_token_persistent_token_force_refresh(mock_cache, mock_mint, mock_storage):
+    mock_storage.return_value.lock.return_value = ThreadLock("token", timeout=1)
     mock_cache.get.return_value = AuthManagerTokenInfo(
         access_token="cached-token",  # noqa: S106
         persistent_token_id="pers-id",  # noqa: S106
@@ -255,7 +327,7 @@ def test_get_token_persistent_token_force_refresh(mock_cache, mock_mint, mock_st
     mock_cache.get.assert_not_called()
     mock_storage.return_value.clear.assert_called_once_with()
     mock_mint.assert_called_once()
-    assert mock_storage.call_args.kwargs["key"] == "pers-id"
+    assert mock_storage.call_args.args[0].persistent_token_id == "pers-id"  # noqa: S105
 
 
 @patch(
@@ -344,10 +416,11 @@ def test_get_token_persistent_token_remint_failure_retries_mint(mock_cache, mock
     assert mock_mint.call_count == 2
 
 
-@patch("obi_auth.client.Storage")
+@patch("obi_auth.client._get_storage")
 @patch("obi_auth.client._get_auth_method")
 @patch("obi_auth.client._TOKEN_CACHE")
 def test_get_token_force_refresh(mock_cache, mock_method, mock_storage):
+    mock_storage.return_value.lock.return_value = ThreadLock("token", timeout=1)
     mock_cache.get.return_value = KeycloakTokenInfo(access_token="cached-token")  # noqa: S106
     fresh_token = KeycloakTokenInfo(access_token="fresh-token")  # noqa: S106
     mock_method.return_value = lambda *args, **kwargs: fresh_token
@@ -360,6 +433,420 @@ def test_get_token_force_refresh(mock_cache, mock_method, mock_storage):
     mock_cache.set.assert_called_once_with(fresh_token, mock_storage.return_value)
 
 
+@patch("obi_auth.client._get_storage")
+@patch("obi_auth.client._get_auth_method")
+@patch("obi_auth.client._TOKEN_CACHE")
+def test_get_token_force_refresh_refreshed_while_waiting(mock_cache, mock_method, mock_storage):
+    # another process refreshed the token while this one waited for the lease
+    mock_storage.return_value.lock.return_value.__enter__.return_value.refreshed = True
+    mock_cache.get.return_value = KeycloakTokenInfo(access_token="refreshed-token")  # noqa: S106
+
+    assert test_module.get_token(force_refresh=True) == "refreshed-token"
+    mock_method.assert_not_called()
+
+
+@patch("obi_auth.client._get_auth_method")
+@patch("obi_auth.client._TOKEN_CACHE")
+def test_get_token_memory_cache(mock_cache, mock_method, jwt_token):
+    mock_cache.get.return_value = None
+    mock_method.return_value = Mock(return_value=KeycloakTokenInfo(access_token=jwt_token))
+
+    with patch("obi_auth.client._MEMORY_TOKEN_CACHE", MemoryTokenCache()):
+        assert test_module.get_token() == jwt_token
+        assert test_module.get_token() == jwt_token
+
+    mock_method.return_value.assert_called_once()
+
+
+@patch("obi_auth.client._get_auth_method")
+@patch("obi_auth.client._TOKEN_CACHE")
+def test_get_token_memory_cache_force_refresh(mock_cache, mock_method, jwt_token):
+    mock_cache.get.return_value = None
+    mock_method.return_value = Mock(return_value=KeycloakTokenInfo(access_token=jwt_token))
+
+    with patch("obi_auth.client._MEMORY_TOKEN_CACHE", MemoryTokenCache()):
+        test_module.get_token()
+        test_module.get_token(force_refresh=True)
+
+    assert mock_method.return_value.call_count == 2
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_memory_cache_keyed_by_persistent_token_id(mock_cache, mock_mint, jwt_token):
+    mock_cache.get.return_value = None
+    mock_mint.side_effect = lambda persistent_token_id, **kwargs: AuthManagerTokenInfo(
+        access_token=jwt_token, persistent_token_id=persistent_token_id
+    )
+
+    with patch("obi_auth.client._MEMORY_TOKEN_CACHE", MemoryTokenCache()) as memory_cache:
+        for persistent_token_id in ("id-1", "id-2", "id-1", "id-2"):
+            test_module.get_token(
+                auth_mode=AuthMode.persistent_token,
+                token_provider=TokenProvider.keycloak,
+                persistent_token_id=persistent_token_id,
+            )
+
+    assert mock_mint.call_count == 2
+    assert {key.persistent_token_id for key in memory_cache._entries} == {"id-1", "id-2"}
+    assert {key.token_provider for key in memory_cache._entries} == {TokenProvider.auth_manager}
+
+
+def test_single_flight():
+    single_flight = test_module._SingleFlight()
+    assert single_flight.do("key", lambda: "result") == "result"
+    assert single_flight._calls == {}
+
+    with pytest.raises(ValueError, match="boom"):
+        single_flight.do("key", Mock(side_effect=ValueError("boom")))
+    assert single_flight._calls == {}
+
+
+def _run_concurrently(func, n_threads):
+    barrier = threading.Barrier(n_threads)
+    results, errors = [], []
+
+    def target():
+        barrier.wait()
+        try:
+            results.append(func())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target) for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_concurrent_callers_mint_once(mock_cache, mock_mint):
+    n_threads = 32
+    mock_cache.get.return_value = None
+
+    def slow_mint(persistent_token_id, **kwargs):
+        time.sleep(0.3)
+        return AuthManagerTokenInfo(
+            access_token="minted-token",  # noqa: S106
+            persistent_token_id=persistent_token_id,
+        )
+
+    mock_mint.side_effect = slow_mint
+
+    results, errors = _run_concurrently(
+        lambda: test_module.get_token(
+            auth_mode=AuthMode.persistent_token,
+            persistent_token_id="pers-id",  # noqa: S106
+        ),
+        n_threads,
+    )
+
+    assert errors == []
+    assert results == ["minted-token"] * n_threads
+    mock_mint.assert_called_once()
+    mock_cache.set.assert_called_once()
+    assert test_module._SINGLE_FLIGHT._calls == {}
+
+
+@patch("obi_auth.client._get_auth_method")
+@patch("obi_auth.client._TOKEN_CACHE")
+def test_get_token_concurrent_callers_share_error(mock_cache, mock_method):
+    n_threads = 8
+    mock_cache.get.return_value = None
+
+    def failing_login(**kwargs):
+        time.sleep(0.3)
+        raise exception.ClientError("Authentication process failed.")
+
+    mock_method.return_value = Mock(side_effect=failing_login)
+
+    results, errors = _run_concurrently(test_module.get_token, n_threads)
+
+    assert results == []
+    assert len(errors) == n_threads
+    assert all(isinstance(error, exception.ClientError) for error in errors)
+    mock_method.return_value.assert_called_once()
+
+
+@patch("obi_auth.client._get_auth_method")
+@patch("obi_auth.client._TOKEN_CACHE")
+def test_get_token_cached_while_waiting_for_lock(mock_cache, mock_method):
+    mock_cache.get.side_effect = [
+        None,
+        KeycloakTokenInfo(access_token="other-process-token"),  # noqa: S106
+    ]
+
+    assert test_module.get_token() == "other-process-token"
+    mock_method.assert_not_called()
+    mock_cache.set.assert_not_called()
+
+
+@patch("obi_auth.client._get_auth_method")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_auth_manager_cached_while_waiting_for_lock(mock_cache, mock_method):
+    mock_cache.get.side_effect = [
+        None,
+        AuthManagerTokenInfo(
+            access_token="other-process-token",  # noqa: S106
+            persistent_token_id="id-1",  # noqa: S106
+        ),
+    ]
+
+    result = test_module.get_token(token_provider=TokenProvider.auth_manager)
+
+    assert result == "other-process-token"
+    mock_method.assert_not_called()
+    mock_cache.set.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    ("backend", "lock_mode"),
+    [
+        (StorageBackend.file, LockMode.flock),
+        (StorageBackend.file, LockMode.lease),
+        (StorageBackend.sqlite, LockMode.flock),
+    ],
+)
+def test_get_token_processes_sharing_config_dir_mint_once(
+    tmp_path, monkeypatch, jwt_token, backend, lock_mode
+):
+    """Benchmark the number of mints issued by a fleet of processes sharing a config dir."""
+    n_processes = 16
+    mints_file = tmp_path / "mints.log"
+    results_dir = tmp_path / "results"
+    results_dir.mkdir()
+    monkeypatch.setattr(settings, "config_dir", tmp_path / "config")
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", backend)
+    monkeypatch.setattr(settings, "LOCK_MODE", lock_mode)
+
+    def counting_mint(persistent_token_id, **kwargs):
+        with mints_file.open("a") as f:
+            f.write(f"{persistent_token_id}\n")
+        time.sleep(0.5)
+        return AuthManagerTokenInfo(access_token=jwt_token, persistent_token_id=persistent_token_id)
+
+    context = multiprocessing.get_context("fork")
+    start = context.Event()
+
+    def worker(index):
+        start.wait()
+        token = test_module.get_token(
+            auth_mode=AuthMode.persistent_token,
+            persistent_token_id="pers-id",  # noqa: S106
+        )
+        (results_dir / str(index)).write_text(token)
+
+    with patch("obi_auth.client.auth_manager_mint_access_token", side_effect=counting_mint):
+        processes = [context.Process(target=worker, args=(i,)) for i in range(n_processes)]
+        for process in processes:
+            process.start()
+        start.set()
+        for process in processes:
+            process.join(timeout=30)
+
+    assert [process.exitcode for process in processes] == [0] * n_processes
+    assert mints_file.read_text().splitlines() == ["pers-id"]
+    assert {path.read_text() for path in results_dir.iterdir()} == {jwt_token}
+
+
+def _make_token(iat, exp):
+    return jwt.encode({"iat": iat, "exp": exp}, key=None, algorithm="none")
+
+
+@patch("obi_auth.client._get_auth_method")
+def test_get_token_min_ttl(mock_method, memory_cache):
+    now = _now()
+    short_lived = _make_token(iat=now - 3000, exp=now + 100)
+    fresh = _make_token(iat=now, exp=now + 3600)
+    memory_cache.get.return_value = short_lived
+    mock_method.return_value = lambda **kwargs: KeycloakTokenInfo(access_token=fresh)
+
+    # valid long enough
+    assert test_module.get_token(min_ttl=60) == short_lived
+    mock_method.assert_not_called()
+
+    # refreshed when expiring sooner than min_ttl
+    with patch("obi_auth.client._TOKEN_CACHE"):
+        assert test_module.get_token(min_ttl=600) == fresh
+    memory_cache.clear.assert_called_once()
+
+    # cannot be satisfied by a new token
+    mock_method.return_value = lambda **kwargs: KeycloakTokenInfo(access_token=short_lived)
+    with patch("obi_auth.client._TOKEN_CACHE"):
+        with pytest.raises(exception.ClientError, match="does not remain valid for 600 seconds"):
+            test_module.get_token(min_ttl=600)
+
+
+@patch("obi_auth.client._get_async_auth_method")
+def test_get_token_async_min_ttl(mock_method, memory_cache):
+    now = _now()
+    short_lived = _make_token(iat=now - 3000, exp=now + 100)
+    fresh = _make_token(iat=now, exp=now + 3600)
+    memory_cache.get.return_value = short_lived
+    mock_method.return_value = _async_return(KeycloakTokenInfo(access_token=fresh))
+
+    assert asyncio.run(test_module.get_token_async(min_ttl=60)) == short_lived
+    mock_method.assert_not_called()
+
+    with patch("obi_auth.client._TOKEN_CACHE"):
+        assert asyncio.run(test_module.get_token_async(min_ttl=600)) == fresh
+    memory_cache.clear.assert_called_once()
+
+
+@patch("obi_auth.client._REFRESH_SCHEDULER")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_schedules_background_refresh(mock_cache, mock_scheduler, monkeypatch):
+    monkeypatch.setattr(settings, "BACKGROUND_REFRESH", True)
+    monkeypatch.setattr(settings, "BACKGROUND_REFRESH_MARGIN_SECONDS", 300)
+    token = _make_token(iat=1000, exp=4600)
+    mock_cache.get.return_value = AuthManagerTokenInfo(
+        access_token=token,
+        persistent_token_id="pers-id",  # noqa: S106
+    )
+
+    test_module.get_token(
+        auth_mode=AuthMode.persistent_token,
+        persistent_token_id="pers-id",  # noqa: S106
+    )
+
+    key = TokenCacheKey("staging", "persistent_token", "auth_manager", "pers-id")
+    mock_scheduler.schedule.assert_called_once()
+    assert mock_scheduler.schedule.call_args.args == (key,)
+    assert mock_scheduler.schedule.call_args.kwargs["due"] == 4300
+    assert mock_scheduler.schedule.call_args.kwargs["callback"].args == (key,)
+
+
+@patch("obi_auth.client._REFRESH_SCHEDULER")
+@patch("obi_auth.client._TOKEN_CACHE")
+def test_get_token_keycloak_not_refreshed_in_background(mock_cache, mock_scheduler, monkeypatch):
+    monkeypatch.setattr(settings, "BACKGROUND_REFRESH", True)
+    mock_cache.get.return_value = KeycloakTokenInfo(access_token="cached-token")  # noqa: S106
+
+    test_module.get_token()
+
+    mock_scheduler.schedule.assert_not_called()
+
+
+@patch("obi_auth.client._REFRESH_SCHEDULER")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_background_refresh_disabled(mock_cache, mock_scheduler):
+    mock_cache.get.return_value = AuthManagerTokenInfo(
+        access_token="cached-token",  # noqa: S106
+        persistent_token_id="id-1",  # noqa: S106
+    )
+
+    test_module.get_token(token_provider=TokenProvider.auth_manager)
+
+    mock_scheduler.schedule.assert_not_called()
+
+
+def test_get_refresh_time(monkeypatch):
+    monkeypatch.setattr(settings, "BACKGROUND_REFRESH_MARGIN_SECONDS", 300)
+    assert test_module._get_refresh_time(_make_token(iat=1000, exp=4600)) == 4300
+    # short-lived tokens are refreshed at half-life
+    assert test_module._get_refresh_time(_make_token(iat=1000, exp=1400)) == 1200
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_refresh_in_background(mock_cache, mock_mint, memory_cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "config_dir", tmp_path)
+    key = TokenCacheKey("staging", "pkce", "auth_manager")
+    expired = AuthManagerTokenInfo(access_token=None, persistent_token_id="id-1")  # noqa: S106
+    now = _now()
+    fresh_token = _make_token(iat=now, exp=now + 3600)
+    mock_cache.get.return_value = expired
+    mock_mint.return_value = AuthManagerTokenInfo(
+        access_token=fresh_token,
+        persistent_token_id="id-1",  # noqa: S106
+    )
+
+    assert test_module._refresh_in_background(key) == now + 3600 - 300
+
+    mock_mint.assert_called_once_with("id-1", environment="staging")
+    mock_cache.set.assert_called_once_with(mock_mint.return_value, ANY)
+    memory_cache.set.assert_called_once_with(key, fresh_token)
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_refresh_in_background_near_expiry(mock_cache, mock_mint, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "config_dir", tmp_path)
+    key = TokenCacheKey("staging", "persistent_token", "auth_manager", "id-1")
+    mock_cache.get.return_value = AuthManagerTokenInfo(
+        access_token=_make_token(iat=_now() - 3500, exp=_now() + 100),
+        persistent_token_id="id-1",  # noqa: S106
+    )
+    mock_mint.return_value = AuthManagerTokenInfo(
+        access_token=_make_token(iat=_now(), exp=_now() + 3600),
+        persistent_token_id="id-1",  # noqa: S106
+    )
+
+    test_module._refresh_in_background(key)
+
+    mock_mint.assert_called_once()
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_refresh_in_background_already_refreshed(
+    mock_cache, mock_mint, memory_cache, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(settings, "config_dir", tmp_path)
+    key = TokenCacheKey("staging", "persistent_token", "auth_manager", "id-1")
+    now = _now()
+    token = _make_token(iat=now, exp=now + 3600)
+    mock_cache.get.return_value = AuthManagerTokenInfo(
+        access_token=token,
+        persistent_token_id="id-1",  # noqa: S106
+    )
+
+    assert test_module._refresh_in_background(key) == now + 3600 - 300
+
+    mock_mint.assert_not_called()
+    memory_cache.set.assert_called_once_with(key, token)
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_refresh_in_background_unused(mock_cache, mock_mint, memory_cache):
+    memory_cache.was_read.return_value = False
+    key = TokenCacheKey("staging", "persistent_token", "auth_manager", "id-1")
+
+    assert test_module._refresh_in_background(key) is None
+
+    memory_cache.was_read.assert_called_once_with(key)
+    mock_cache.get.assert_not_called()
+    mock_mint.assert_not_called()
+
+
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_refresh_in_background_nothing_cached(mock_cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "config_dir", tmp_path)
+    mock_cache.get.return_value = None
+    key = TokenCacheKey("staging", "pkce", "auth_manager")
+
+    assert test_module._refresh_in_background(key) is None
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_refresh_in_background_mint_returns_none(mock_cache, mock_mint, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "config_dir", tmp_path)
+    mock_cache.get.return_value = AuthManagerTokenInfo(
+        access_token=None,
+        persistent_token_id="id-1",  # noqa: S106
+    )
+    mock_mint.return_value = mock_cache.get.return_value
+    key = TokenCacheKey("staging", "pkce", "auth_manager")
+
+    with pytest.raises(exception.ClientError, match="Authentication process failed."):
+        test_module._refresh_in_background(key)
+
+
 def test_get_auth_method():
     res = test_module._get_auth_method(AuthMode.pkce)
     assert res is test_module._pkce_authenticate
@@ -368,8 +855,17 @@ def test_get_auth_method():
     assert res is test_module._daf_authenticate
 
 
+def test_get_auth_method_not_interactive():
+    token = test_module._INTERACTIVE.set(False)
+    try:
+        with pytest.raises(exception.LoginRequiredError, match="A pkce login is required"):
+            test_module._get_auth_method(AuthMode.pkce)
+    finally:
+        test_module._INTERACTIVE.reset(token)
+
+
 @patch("obi_auth.flows.pkce.webbrowser")
-@patch("obi_auth.client.AuthServer")
+@patch("obi_auth.server.AuthServer")
 def test_pkce_authenticate(mock_server, mock_web, httpx2_mock):
     httpx2_mock.post().respond(json={"access_token": "mock-token"})
 
@@ -396,7 +892,7 @@ def test_pkce_authenticate(mock_server, mock_web, httpx2_mock):
         test_module._pkce_authenticate(environment=None)
 
 
-@patch("obi_auth.client.daf_authenticate")
+@patch("obi_auth.flows.daf.daf_authenticate")
 def test_daf_authenticate(auth_method):
     auth_method.side_effect = exception.AuthFlowError()
     with pytest.raises(exception.ClientError, match="Authentication process failed."):
@@ -421,3 +917,522 @@ def test_get_user_info(httpx2_mock, settings):
 
     res = test_module.get_user_info(token=None, environment="staging")
     assert res == mock_json_response
+
+
+def _async_return(value):
+    async def func(*args, **kwargs):
+        return value
+
+    return func
+
+
+@patch("obi_auth.client._get_async_auth_method")
+@patch("obi_auth.client._TOKEN_CACHE")
+def test_get_token_async(mock_cache, mock_method):
+    mock_cache.get.return_value = KeycloakTokenInfo(access_token="foo")  # noqa: S106
+    assert asyncio.run(test_module.get_token_async()) == "foo"
+
+    mock_cache.get.return_value = None
+    mock_method.return_value = _async_return(KeycloakTokenInfo(access_token="mock-token"))  # noqa: S106
+
+    assert asyncio.run(test_module.get_token_async()) == "mock-token"
+    mock_cache.set.assert_called_once()
+
+
+@patch("obi_auth.client._get_storage")
+@patch("obi_auth.client._get_async_auth_method")
+@patch("obi_auth.client._TOKEN_CACHE")
+def test_get_token_async_force_refresh(mock_cache, mock_method, mock_storage, memory_cache):
+    mock_storage.return_value.lock.return_value = ThreadLock("token", timeout=1)
+    mock_cache.get.return_value = KeycloakTokenInfo(access_token="old-token")  # noqa: S106
+    mock_method.return_value = _async_return(KeycloakTokenInfo(access_token="new-token"))  # noqa: S106
+
+    assert asyncio.run(test_module.get_token_async(force_refresh=True)) == "new-token"
+    mock_storage.return_value.clear.assert_called_once()
+    memory_cache.clear.assert_called_once()
+
+
+def test_get_token_async_memory_cache(memory_cache):
+    memory_cache.get.return_value = "memory-token"
+    assert asyncio.run(test_module.get_token_async()) == "memory-token"
+
+
+@patch("obi_auth.client._get_async_auth_method")
+@patch("obi_auth.client._TOKEN_CACHE")
+def test_get_token_async_cached_while_waiting_for_lock(mock_cache, mock_method):
+    mock_cache.get.side_effect = [None, KeycloakTokenInfo(access_token="other-process-token")]  # noqa: S106
+
+    assert asyncio.run(test_module.get_token_async()) == "other-process-token"
+    mock_method.assert_not_called()
+    mock_cache.set.assert_not_called()
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token_async")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_async_concurrent_callers_mint_once(mock_cache, mock_mint):
+    mock_cache.get.return_value = None
+    calls = []
+
+    async def mint(persistent_token_id, *, environment):
+        calls.append(persistent_token_id)
+        await asyncio.sleep(0.05)
+        return AuthManagerTokenInfo(
+            access_token="minted-token",  # noqa: S106
+            persistent_token_id=persistent_token_id,
+        )
+
+    mock_mint.side_effect = mint
+
+    async def run():
+        return await asyncio.gather(
+            *(
+                test_module.get_token_async(
+                    auth_mode=AuthMode.persistent_token,
+                    persistent_token_id="pers-id",  # noqa: S106
+                )
+                for _ in range(16)
+            )
+        )
+
+    assert asyncio.run(run()) == ["minted-token"] * 16
+    assert calls == ["pers-id"]
+
+
+@patch(
+    "obi_auth.client.auth_manager_exchange_token_async",
+    return_value=AuthManagerTokenInfo(
+        access_token="auth-manager-token",  # noqa: S106
+        persistent_token_id="id-1",  # noqa: S106
+    ),
+)
+@patch("obi_auth.client._get_async_auth_method")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_async_auth_manager(mock_cache, mock_method, mock_exchange):
+    mock_cache.get.return_value = None
+    keycloak_token = KeycloakTokenInfo(access_token="keycloak-token")  # noqa: S106
+    mock_method.return_value = _async_return(keycloak_token)
+
+    res = asyncio.run(test_module.get_token_async(token_provider=TokenProvider.auth_manager))
+    assert res == "auth-manager-token"
+    mock_exchange.assert_awaited_once()
+    assert mock_exchange.call_args.args[0] == keycloak_token
+    mock_cache.set.assert_called_once()
+
+
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_async_auth_manager_uses_cached_access_token(mock_cache):
+    mock_cache.get.return_value = AuthManagerTokenInfo(
+        access_token="cached-token",  # noqa: S106
+        persistent_token_id="id-1",  # noqa: S106
+    )
+    res = asyncio.run(test_module.get_token_async(token_provider=TokenProvider.auth_manager))
+    assert res == "cached-token"
+
+
+@patch("obi_auth.client._get_async_auth_method")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_async_auth_manager_cached_while_waiting_for_lock(mock_cache, mock_method):
+    mock_cache.get.side_effect = [
+        None,
+        AuthManagerTokenInfo(
+            access_token="other-process-token",  # noqa: S106
+            persistent_token_id="id-1",  # noqa: S106
+        ),
+    ]
+
+    res = asyncio.run(test_module.get_token_async(token_provider=TokenProvider.auth_manager))
+    assert res == "other-process-token"
+    mock_method.assert_not_called()
+
+
+@patch(
+    "obi_auth.client.auth_manager_mint_access_token_async",
+    return_value=AuthManagerTokenInfo(
+        access_token="minted-token",  # noqa: S106
+        persistent_token_id="id-1",  # noqa: S106
+    ),
+)
+@patch("obi_auth.client._get_async_auth_method")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_async_auth_manager_refresh_from_persistent_id(
+    mock_cache, mock_method, mock_mint
+):
+    mock_cache.get.return_value = AuthManagerTokenInfo(
+        access_token=None,
+        persistent_token_id="id-1",  # noqa: S106
+    )
+
+    res = asyncio.run(test_module.get_token_async(token_provider=TokenProvider.auth_manager))
+    assert res == "minted-token"
+    assert mock_mint.call_args.args[0] == "id-1"
+    mock_method.assert_not_called()
+    mock_cache.set.assert_called_once()
+
+
+@patch("obi_auth.client._get_storage")
+@patch("obi_auth.client.auth_manager_mint_access_token_async")
+@patch(
+    "obi_auth.client.auth_manager_exchange_token_async",
+    return_value=AuthManagerTokenInfo(
+        access_token="exchanged-token",  # noqa: S106
+        persistent_token_id="id-2",  # noqa: S106
+    ),
+)
+@patch("obi_auth.client._get_async_auth_method")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_async_auth_manager_refresh_failure_falls_back_to_exchange(
+    mock_cache, mock_method, mock_exchange, mock_mint, mock_storage
+):
+    mock_cache.get.return_value = AuthManagerTokenInfo(
+        access_token=None,
+        persistent_token_id="id-1",  # noqa: S106
+    )
+    mock_mint.side_effect = exception.AuthFlowError()
+    mock_method.return_value = _async_return(KeycloakTokenInfo(access_token="keycloak-token"))  # noqa: S106
+
+    res = asyncio.run(test_module.get_token_async(token_provider=TokenProvider.auth_manager))
+    assert res == "exchanged-token"
+    mock_storage.return_value.clear.assert_called_once()
+    mock_exchange.assert_awaited_once()
+
+
+@patch("obi_auth.client._get_storage")
+@patch(
+    "obi_auth.client.auth_manager_mint_access_token_async",
+    return_value=AuthManagerTokenInfo(
+        access_token="minted-token",  # noqa: S106
+        persistent_token_id="pers-id",  # noqa: S106
+    ),
+)
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_async_persistent_token_force_refresh(mock_cache, mock_mint, mock_storage):
+    mock_storage.return_value.lock.return_value = ThreadLock("token", timeout=1)
+    res = asyncio.run(
+        test_module.get_token_async(
+            auth_mode=AuthMode.persistent_token,
+            persistent_token_id="pers-id",  # noqa: S106
+            force_refresh=True,
+        )
+    )
+    assert res == "minted-token"
+    assert mock_storage.call_args.args[0].persistent_token_id == "pers-id"  # noqa: S105
+    mock_storage.return_value.clear.assert_called_once()
+    mock_cache.get.assert_not_called()
+    assert mock_mint.call_args.args[0] == "pers-id"
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token_async")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_async_persistent_token_raises(mock_cache, mock_mint):
+    mock_cache.get.return_value = None
+    mock_mint.side_effect = exception.AuthFlowError()
+
+    with pytest.raises(exception.ClientError, match="Authentication process failed."):
+        asyncio.run(
+            test_module.get_token_async(
+                auth_mode=AuthMode.persistent_token,
+                persistent_token_id="pers-id",  # noqa: S106
+            )
+        )
+
+
+@patch(
+    "obi_auth.client.auth_manager_mint_access_token_async",
+    return_value=AuthManagerTokenInfo(access_token=None, persistent_token_id="pers-id"),  # noqa: S106
+)
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_token_async_persistent_token_mint_returns_none(mock_cache, mock_mint):
+    mock_cache.get.return_value = None
+
+    with pytest.raises(exception.ClientError, match="Authentication process failed."):
+        asyncio.run(
+            test_module.get_token_async(
+                auth_mode=AuthMode.persistent_token,
+                persistent_token_id="pers-id",  # noqa: S106
+            )
+        )
+    mock_cache.set.assert_not_called()
+
+
+def test_get_async_auth_method():
+    res = test_module._get_async_auth_method(AuthMode.pkce)
+    assert res is test_module._pkce_authenticate_async
+
+    res = test_module._get_async_auth_method(AuthMode.daf)
+    assert res is test_module._daf_authenticate_async
+
+
+@patch("obi_auth.flows.pkce.webbrowser")
+@patch("obi_auth.server.AuthServer")
+def test_pkce_authenticate_async(mock_server, mock_web, httpx2_mock):
+    httpx2_mock.post().respond(json={"access_token": "mock-token"})
+
+    mock_local = Mock()
+    mock_local.redirect_uri = "mock-redirect-uri"
+    mock_local.wait_for_code_async = _async_return("mock-code")
+    mock_server.return_value.run_async.return_value.__aenter__.return_value = mock_local
+
+    res = asyncio.run(test_module._pkce_authenticate_async(environment=None))
+    assert res == KeycloakTokenInfo(access_token="mock-token")  # noqa: S106
+
+    mock_server.side_effect = exception.AuthFlowError()
+    with pytest.raises(exception.ClientError, match="Authentication process failed."):
+        asyncio.run(test_module._pkce_authenticate_async(environment=None))
+
+    mock_server.side_effect = exception.ConfigError()
+    with pytest.raises(
+        exception.ClientError, match="There is a mistake with configuration settings."
+    ):
+        asyncio.run(test_module._pkce_authenticate_async(environment=None))
+
+    mock_server.side_effect = exception.LocalServerError()
+    with pytest.raises(exception.ClientError, match="Local server failed to authenticate."):
+        asyncio.run(test_module._pkce_authenticate_async(environment=None))
+
+
+@patch("obi_auth.flows.daf.daf_authenticate_async")
+def test_daf_authenticate_async(auth_method):
+    auth_method.side_effect = exception.AuthFlowError()
+    with pytest.raises(exception.ClientError, match="Authentication process failed."):
+        asyncio.run(test_module._daf_authenticate_async(environment=None))
+
+
+def test_get_user_info_async(httpx2_mock, settings):
+    mock_json_response = {"foo": "bar", "bar": "foo"}
+
+    httpx2_mock.post(settings.get_keycloak_user_info_endpoint(override_env="staging")).respond(
+        json=mock_json_response
+    )
+
+    res = asyncio.run(test_module.get_user_info_async(token=None, environment="staging"))
+    assert res == mock_json_response
+
+
+@pytest.fixture
+def config_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "config_dir", tmp_path)
+    return tmp_path
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_tokens(mock_cache, mock_mint, memory_cache, config_dir):
+    memory_cache.get.side_effect = lambda key: (
+        "memory-token" if key.persistent_token_id == "id-1" else None  # noqa: S105
+    )
+
+    def cached(storage):
+        if storage._file_path.name == "token_staging_id-2.bin":
+            return AuthManagerTokenInfo(access_token="disk-token", persistent_token_id="id-2")  # noqa: S106
+        return None
+
+    mock_cache.get.side_effect = cached
+    mock_cache.get_many.side_effect = lambda storages: [cached(storage) for storage in storages]
+    mock_mint.side_effect = lambda token_id, environment: AuthManagerTokenInfo(
+        access_token=f"minted-{token_id}", persistent_token_id=token_id
+    )
+
+    res = test_module.get_tokens(["id-3", "id-1", "id-2", "id-4", "id-3"])
+
+    assert res == {
+        "id-3": "minted-id-3",
+        "id-1": "memory-token",
+        "id-2": "disk-token",
+        "id-4": "minted-id-4",
+    }
+    assert list(res) == ["id-3", "id-1", "id-2", "id-4"]
+    assert sorted(call.args[0] for call in mock_mint.call_args_list) == ["id-3", "id-4"]
+    memory_cache.set.assert_any_call(ANY, "disk-token")
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_tokens_all_cached(mock_cache, mock_mint, memory_cache):
+    memory_cache.get.return_value = "memory-token"
+
+    assert test_module.get_tokens(["id-1", "id-2"]) == {
+        "id-1": "memory-token",
+        "id-2": "memory-token",
+    }
+    mock_mint.assert_not_called()
+    mock_cache.get_many.assert_not_called()
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_tokens_errors_do_not_fail_the_batch(mock_cache, mock_mint, config_dir):
+    mock_cache.get.return_value = None
+    mock_cache.get_many.side_effect = lambda storages: [None] * len(storages)
+    http_error = httpx2.HTTPStatusError("boom", request=Mock(), response=Mock())
+
+    def mint(token_id, environment):
+        if token_id == "bad-flow":  # noqa: S105
+            raise exception.AuthFlowError()
+        if token_id == "bad-http":  # noqa: S105
+            raise http_error
+        return AuthManagerTokenInfo(access_token=f"minted-{token_id}", persistent_token_id=token_id)
+
+    mock_mint.side_effect = mint
+
+    res = test_module.get_tokens(["ok", "bad-flow", "bad-http", ""])
+
+    assert res["ok"] == "minted-ok"
+    assert isinstance(res["bad-flow"], exception.ClientError)
+    assert isinstance(res["bad-flow"].__cause__, exception.AuthFlowError)
+    assert isinstance(res["bad-http"], exception.ClientError)
+    assert res["bad-http"].__cause__ is http_error
+    assert isinstance(res[""], exception.ClientError)
+    assert "persistent_token_id is required" in str(res[""])
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_tokens_bounded_parallelism(mock_cache, mock_mint, config_dir):
+    mock_cache.get.return_value = None
+    mock_cache.get_many.side_effect = lambda storages: [None] * len(storages)
+    lock = threading.Lock()
+    running = []
+    max_running = 0
+
+    def mint(token_id, environment):
+        nonlocal max_running
+        with lock:
+            running.append(token_id)
+            max_running = max(max_running, len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(token_id)
+        return AuthManagerTokenInfo(access_token=f"minted-{token_id}", persistent_token_id=token_id)
+
+    mock_mint.side_effect = mint
+    token_ids = [f"id-{i}" for i in range(8)]
+
+    res = test_module.get_tokens(token_ids, max_workers=3)
+
+    assert res == {token_id: f"minted-{token_id}" for token_id in token_ids}
+    assert 1 < max_running <= 3
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+@patch("obi_auth.client._AUTH_MANAGER_TOKEN_CACHE")
+def test_get_tokens_force_refresh(mock_cache, mock_mint, memory_cache, config_dir):
+    memory_cache.get.return_value = "memory-token"
+    mock_mint.return_value = AuthManagerTokenInfo(
+        access_token="minted-token",  # noqa: S106
+        persistent_token_id="id-1",  # noqa: S106
+    )
+
+    assert test_module.get_tokens(["id-1"], force_refresh=True) == {"id-1": "minted-token"}
+    memory_cache.clear.assert_called_once()
+    mock_mint.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    ("backend", "expected_class"),
+    [
+        (StorageBackend.file, Storage),
+        (StorageBackend.sqlite, SqliteStorage),
+        (StorageBackend.memory, MemoryStorage),
+        (StorageBackend.keyring, KeyringStorage),
+        (StorageBackend.redis, RedisStorage),
+    ],
+)
+def test_get_storage(backend, expected_class, config_dir, monkeypatch, redis_client):
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", backend)
+    key = TokenCacheKey("staging", AuthMode.pkce, TokenProvider.keycloak)
+    assert isinstance(test_module._get_storage(key), expected_class)
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+def test_get_token_memory_backend(mock_mint, tmp_path, monkeypatch, jwt_token):
+    config_dir = tmp_path / "config"
+    monkeypatch.setattr(settings, "config_dir", config_dir)
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", StorageBackend.memory)
+    monkeypatch.setattr(settings, "CACHE_EVICTION_INTERVAL_SECONDS", 1)
+    mock_mint.return_value = AuthManagerTokenInfo(
+        access_token=jwt_token,
+        persistent_token_id="pers-id",  # noqa: S106
+    )
+
+    kwargs = {"auth_mode": AuthMode.persistent_token, "persistent_token_id": "pers-id"}
+    assert test_module.get_token(**kwargs) == jwt_token
+    test_module._MEMORY_TOKEN_CACHE.clear()
+    assert test_module.get_token(**kwargs) == jwt_token
+
+    mock_mint.assert_called_once()
+    # nothing is written to disk, not even the eviction marker
+    assert not config_dir.exists()
+    _MEMORY_ENTRIES.clear()
+
+
+@pytest.mark.parametrize("backend", [StorageBackend.sqlite, StorageBackend.redis])
+@patch("obi_auth.client.auth_manager_mint_access_token")
+def test_get_tokens_batch_read(
+    mock_mint, backend, config_dir, monkeypatch, jwt_token, redis_client
+):
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", backend)
+    mock_mint.side_effect = lambda token_id, environment: AuthManagerTokenInfo(
+        access_token=jwt_token, persistent_token_id=token_id
+    )
+    token_ids = [f"id-{i}" for i in range(5)]
+    test_module.get_tokens(token_ids[:3])
+    test_module._MEMORY_TOKEN_CACHE.clear()
+
+    with patch.object(
+        STORAGE_CLASSES[backend], "read_many", wraps=STORAGE_CLASSES[backend].read_many
+    ) as read_many:
+        assert test_module.get_tokens(token_ids) == dict.fromkeys(token_ids, jwt_token)
+
+    # a single batch read of the entries
+    assert len(read_many.call_args.args[0]) == 5
+    read_many.assert_called_once()
+    assert sorted(call.args[0] for call in mock_mint.call_args_list) == token_ids
+
+
+@patch("obi_auth.client.auth_manager_mint_access_token")
+def test_get_token_sqlite_backend(mock_mint, config_dir, monkeypatch, jwt_token):
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", StorageBackend.sqlite)
+    mock_mint.return_value = AuthManagerTokenInfo(
+        access_token=jwt_token,
+        persistent_token_id="pers-id",  # noqa: S106
+    )
+
+    for _ in range(2):
+        token = test_module.get_token(
+            auth_mode=AuthMode.persistent_token,
+            persistent_token_id="pers-id",  # noqa: S106
+        )
+        assert token == jwt_token
+
+    mock_mint.assert_called_once()
+    # a single database, and no json or lock file per token
+    assert {path.name for path in config_dir.iterdir()} <= {
+        "tokens.sqlite3",
+        "tokens.sqlite3-wal",
+        "tokens.sqlite3-shm",
+    }
+
+
+@patch("obi_auth.client._acquire_token")
+@patch("obi_auth.client.request_token")
+def test_get_token_from_agent(mock_request, mock_acquire, memory_cache):
+    mock_request.return_value = "agent-token"
+
+    assert test_module.get_token(force_refresh=True) == "agent-token"
+
+    key = TokenCacheKey("staging", "pkce", "keycloak")
+    mock_request.assert_called_once_with(key, force_refresh=True)
+    memory_cache.set.assert_called_once_with(key, "agent-token")
+    mock_acquire.assert_not_called()
+
+
+@patch("obi_auth.client._acquire_token_async")
+@patch("obi_auth.client.request_token_async")
+def test_get_token_async_from_agent(mock_request, mock_acquire, memory_cache):
+    mock_request.side_effect = _async_return("agent-token")
+
+    assert asyncio.run(test_module.get_token_async()) == "agent-token"
+
+    key = TokenCacheKey("staging", "pkce", "keycloak")
+    memory_cache.set.assert_called_once_with(key, "agent-token")
+    mock_acquire.assert_not_called()
@@ -1,6 +1,6 @@
 import pytest
 
-from obi_auth import exception
+from obi_auth import config, exception
 
 PROD_OBI_URL = "https://cell-a.openbraininstitute.org"
 STAGING_OBI_URL = "https://staging.cell-a.openbraininstitute.org"
@@ -20,6 +20,15 @@ def test_get_keycloak_url(settings):
         settings.get_keycloak_url(override_env="foo")
 
 
+def test_domain_url(monkeypatch):
+    monkeypatch.setenv("OBI_AUTH_DOMAIN_URL", "http://127.0.0.1:8080/")
+    settings = config.Settings()
+
+    assert settings.get_keycloak_url() == "http://127.0.0.1:8080/auth/realms/SBO"
+    res = settings.get_auth_manager_access_token_endpoint(override_env="production")
+    assert res == "http://127.0.0.1:8080/api/auth-manager/v1/access-token"
+
+
 def test_get_keycloak_token_endpoint(settings):
     res = settings.get_keycloak_token_endpoint()
     assert (
@@ -118,3 +127,40 @@ def test_get_auth_manager_token_exchange_endpoint(settings):
 
     res = settings.get_auth_manager_token_exchange_endpoint(override_env="production")
     assert res == f"{PROD_OBI_URL}/api/auth-manager/v1/token-exchange"
+
+
+def test_lazy_settings(monkeypatch):
+    monkeypatch.setenv("OBI_AUTH_KEYCLOAK_ENV", "production")
+    lazy_settings = config._LazySettings()
+    assert lazy_settings._settings is None
+
+    assert lazy_settings.KEYCLOAK_ENV == "production"
+    loaded = lazy_settings._settings
+    assert isinstance(loaded, config.Settings)
+    assert repr(lazy_settings) == repr(loaded)
+
+    # loaded only once
+    monkeypatch.setenv("OBI_AUTH_KEYCLOAK_ENV", "staging")
+    assert lazy_settings.KEYCLOAK_ENV == "production"
+    assert lazy_settings._settings is loaded
+
+    lazy_settings.LOCAL_SERVER_TIMEOUT = 5
+    assert loaded.LOCAL_SERVER_TIMEOUT == 5
+    del lazy_settings.LOCAL_SERVER_TIMEOUT
+    assert "LOCAL_SERVER_TIMEOUT" not in vars(loaded)
+
+
+def test_lazy_settings_loaded_while_waiting():
+    lazy_settings = config._LazySettings()
+    loaded = config.Settings()
+
+    class Lock:
+        # another thread loads the settings while this one waits for the lock
+        def __enter__(self):
+            object.__setattr__(lazy_settings, "_settings", loaded)
+
+        def __exit__(self, *args):
+            pass
+
+    object.__setattr__(lazy_settings, "_lock", Lock())
+    assert lazy_settings._get_settings() is loaded
@@ -0,0 +1,117 @@
+"""End to end tests of the flows against the local Keycloak and auth-manager emulator."""
+
+import logging
+from unittest.mock import Mock, patch
+
+import httpx2
+import pytest
+
+from obi_auth import client, metrics, resilience
+from obi_auth.config import settings
+from obi_auth.typedef import AuthMode, TokenProvider
+from tests.emulator import AuthEmulator, Faults
+
+
+@pytest.fixture
+def emulator(tmp_path, monkeypatch):
+    emulator = AuthEmulator(device_pending_polls=1)
+    with emulator.run():
+        monkeypatch.setattr(settings, "DOMAIN_URL", emulator.url)
+        monkeypatch.setattr(settings, "config_dir", tmp_path)
+        monkeypatch.setattr(settings, "AGENT_SOCKET", tmp_path / "agent.sock")
+        monkeypatch.setattr(settings, "AUTH_MANAGER_RETRY_BACKOFF_SECONDS", 0)
+        monkeypatch.setattr(resilience, "_BREAKERS", {})
+        client._MEMORY_TOKEN_CACHE.clear()
+        yield emulator
+        client._MEMORY_TOKEN_CACHE.clear()
+
+
+PERSISTENT_TOKEN_ID = "pers-id"  # noqa: S105
+
+
+def test_persistent_token(emulator):
+    kwargs = {"auth_mode": AuthMode.persistent_token, "persistent_token_id": PERSISTENT_TOKEN_ID}
+    token = client.get_token(**kwargs)
+    assert emulator.verify_token(token)["iss"] == "auth-manager"
+
+    client._MEMORY_TOKEN_CACHE.clear()
+    assert client.get_token(**kwargs) == token
+    assert emulator.requests["/api/auth-manager/v1/access-token"] == 1
+
+
+@patch("obi_auth.flows.daf._display_auth_prompt")
+def test_daf_auth_manager(mock_display_prompt, emulator):
+    token = client.get_token(auth_mode=AuthMode.daf, token_provider=TokenProvider.auth_manager)
+
+    assert emulator.verify_token(token)["sub"] == "emulated-user"
+    assert client.get_user_info(token)["sub"] == "emulated-user"
+    assert emulator.requests["/auth/realms/SBO/protocol/openid-connect/token"] == 2
+    assert emulator.requests["/api/auth-manager/v1/token-exchange"] == 1
+
+
+@patch("obi_auth.flows.daf._display_auth_prompt")
+def test_metrics(mock_display_prompt, emulator):
+    recorder = Mock()
+    metrics.set_recorder(recorder)
+    try:
+        client.get_token(auth_mode=AuthMode.daf, token_provider=TokenProvider.auth_manager)
+    finally:
+        metrics.set_recorder(None)
+
+    counts = [(c.args[0].name, c.args[1]) for c in recorder.increment.call_args_list]
+    assert counts == [
+        ("obi_auth_cache_lookups", {"cache": "memory", "result": "miss"}),
+        ("obi_auth_cache_lookups", {"cache": "disk", "result": "miss"}),
+        ("obi_auth_cache_lookups", {"cache": "disk", "result": "miss"}),
+        ("obi_auth_authentications", {"auth_mode": "daf"}),
+        ("obi_auth_exchanges", {"environment": "staging"}),
+        ("obi_auth_mints", {"environment": "staging"}),
+    ]
+    requests = [
+        (c.args[2]["endpoint"], c.args[2]["status"])
+        for c in recorder.observe.call_args_list
+        if c.args[0] == metrics.HTTP_REQUEST_DURATION
+    ]
+    assert requests == [
+        ("device", "200"),
+        ("token", "400"),
+        ("token", "200"),
+        ("token-exchange", "200"),
+        ("access-token", "200"),
+    ]
+
+
+@patch("obi_auth.flows.daf._display_auth_prompt")
+def test_profile(mock_display_prompt, emulator, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "PROFILE", True)
+    caplog.set_level(logging.INFO, logger="obi_auth.profiling")
+
+    client.get_token(auth_mode=AuthMode.daf, token_provider=TokenProvider.auth_manager)
+
+    [record] = caplog.records
+    assert record.profile["auth_mode"] == "daf"
+    names = [span["name"] for span in record.profile["spans"]]
+    assert names[:2] == ["agent", "acquire"]
+    assert names.count("daf.poll") == 2
+    for name in ("storage.read", "daf.device_code", "auth_manager.exchange", "auth_manager.mint"):
+        assert name in names
+
+
+def test_pkce(emulator):
+    def login(url):
+        # the emulator logs the user in and redirects to the local server
+        httpx2.get(url, follow_redirects=True)
+
+    with patch("obi_auth.flows.pkce.webbrowser.open", side_effect=login):
+        token = client.get_token(auth_mode=AuthMode.pkce)
+
+    assert emulator.verify_token(token)["sub"] == "emulated-user"
+
+
+def test_injected_errors(emulator, monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_MANAGER_MAX_RETRIES", 1)
+    emulator.faults = Faults(error_rate=1, paths=("/access-token",))
+
+    with pytest.raises(httpx2.HTTPStatusError):
+        client.get_token(auth_mode="persistent_token", persistent_token_id=PERSISTENT_TOKEN_ID)
+    assert emulator.requests["/api/auth-manager/v1/access-token"] == 2
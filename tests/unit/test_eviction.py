@@ -0,0 +1,335 @@
+import os
+import time
+
+import jwt
+import pytest
+
+from obi_auth import eviction as test_module
+from obi_auth.cache import AuthManagerTokenCache, TokenCache, _now
+from obi_auth.config import settings
+from obi_auth.storage import (
+    _MEMORY_ENTRIES,
+    STORAGE_CLASSES,
+    MemoryStorage,
+    RedisStorage,
+    SqliteStorage,
+    Storage,
+    _connect,
+)
+from obi_auth.typedef import (
+    AuthManagerTokenInfo,
+    CachedTokenInfo,
+    DeploymentEnvironment,
+    KeycloakTokenInfo,
+    StorageBackend,
+)
+
+STAGING = DeploymentEnvironment.staging
+
+
+def _make_token(iat, exp):
+    return jwt.encode({"iat": iat, "exp": exp}, key=None, algorithm="none")
+
+
+# the entries of a keyring cannot be listed, and are not evicted
+@pytest.fixture(
+    params=[
+        StorageBackend.file,
+        StorageBackend.sqlite,
+        StorageBackend.memory,
+        StorageBackend.redis,
+    ]
+)
+def backend(request):
+    if request.param == StorageBackend.redis:
+        request.getfixturevalue("redis_client")
+    yield request.param
+    _MEMORY_ENTRIES.clear()
+
+
+@pytest.fixture
+def make_storage(tmp_path, backend):
+    def make_storage(key):
+        return STORAGE_CLASSES[backend](tmp_path, STAGING, key)
+
+    return make_storage
+
+
+def _add_keycloak_entry(storage, *, expired):
+    now = _now()
+    iat = now - 7200 if expired else now
+    token = _make_token(iat, iat + 3600)
+    TokenCache().set(KeycloakTokenInfo(access_token=token), storage)
+
+
+def _add_auth_manager_entry(storage, *, expired_since=None):
+    now = _now()
+    iat = now - 3600 - expired_since if expired_since is not None else now
+    token = _make_token(iat, iat + 3600)
+    token_info = AuthManagerTokenInfo(access_token=token, persistent_token_id="id")  # noqa: S106
+    AuthManagerTokenCache().set(token_info, storage)
+
+
+def test_prune_cache(tmp_path, backend, make_storage):
+    valid = make_storage("valid")
+    expired = make_storage("expired")
+    recent_auth_manager = make_storage("recent")
+    old_auth_manager = make_storage("old")
+    _add_keycloak_entry(valid, expired=False)
+    _add_keycloak_entry(expired, expired=True)
+    _add_auth_manager_entry(recent_auth_manager, expired_since=600)
+    _add_auth_manager_entry(old_auth_manager, expired_since=7200)
+
+    report = test_module.prune_cache(config_dir=tmp_path, backend=backend, grace_seconds=3600)
+
+    assert sorted(report.expired) == sorted([expired.name, old_auth_manager.name])
+    assert report.over_capacity == []
+    assert report.kept == 2
+    assert report.removed == 2
+    assert valid.exists()
+    assert recent_auth_manager.exists()
+    assert not expired.exists()
+    assert not old_auth_manager.exists()
+
+
+def test_prune_cache_removes_lock_files(tmp_path):
+    storage = Storage(tmp_path, STAGING, "expired")
+    _add_keycloak_entry(storage, expired=True)
+    with storage.lock(timeout=1):
+        pass
+
+    assert len(list(tmp_path.iterdir())) == 2
+    test_module.prune_cache(config_dir=tmp_path, backend=StorageBackend.file)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_prune_cache_unreadable_entries(tmp_path, backend, make_storage):
+    # the entries of another key are kept for the grace period after their last write
+    other_key = make_storage("other_key")
+    other_key.write(CachedTokenInfo(token=b"not-a-fernet-token", ttl=3600))
+    stale_other_key = make_storage("stale_other_key")
+    stale_other_key.write(CachedTokenInfo(token=b"not-a-fernet-token", ttl=3600))
+    _set_updated_at(stale_other_key, 0)
+    corrupted = Storage(tmp_path, STAGING, "corrupted")
+    corrupted._file_path.write_text("{")
+
+    report = test_module.prune_cache(config_dir=tmp_path, backend=backend)
+
+    assert other_key.exists()
+    assert stale_other_key.name in report.expired
+    assert not stale_other_key.exists()
+    if backend == StorageBackend.file:
+        assert corrupted.name in report.expired
+        assert not corrupted.exists()
+
+
+def test_prune_cache_expired_metadata(tmp_path, backend, make_storage):
+    # the expiry is read from the metadata, even when the token cannot be decrypted
+    expired = make_storage("expired")
+    expired.write(CachedTokenInfo(token=b"not-a-fernet-token", ttl=3600, iat=0, exp=3600))
+    valid = make_storage("valid")
+    exp = int(time.time()) + 3600
+    valid.write(CachedTokenInfo(token=b"not-a-fernet-token", ttl=3600, iat=exp - 3600, exp=exp))
+
+    report = test_module.prune_cache(config_dir=tmp_path, backend=backend)
+
+    assert report.expired == [expired.name]
+    assert report.kept == 1
+    assert valid.exists()
+
+
+def _set_updated_at(storage, timestamp):
+    if isinstance(storage, SqliteStorage):
+        with (connection := _connect(storage._db_path)):
+            connection.execute(
+                "UPDATE tokens SET updated_at = ? WHERE key = ?", (timestamp, storage._key)
+            )
+    elif isinstance(storage, MemoryStorage):
+        _MEMORY_ENTRIES[storage._id] = (storage.read(), timestamp)
+    elif isinstance(storage, RedisStorage):
+        storage._client.hset(storage._redis_key, "updated_at", timestamp)
+    else:
+        os.utime(storage._file_path, (timestamp, timestamp))
+
+
+def test_prune_cache_max_entries(tmp_path, backend, make_storage):
+    storages = [make_storage(f"key-{i}") for i in range(5)]
+    for i, storage in reversed(list(enumerate(storages))):
+        _add_keycloak_entry(storage, expired=False)
+        _set_updated_at(storage, 1_000_000 + i)
+
+    report = test_module.prune_cache(config_dir=tmp_path, backend=backend, max_entries=2)
+
+    assert report.expired == []
+    assert report.over_capacity == [storage.name for storage in storages[:3]]
+    assert report.kept == 2
+    assert [storage.exists() for storage in storages] == [False, False, False, True, True]
+
+
+def test_prune_cache_dry_run(tmp_path, backend, make_storage):
+    expired = make_storage("expired")
+    _add_keycloak_entry(expired, expired=True)
+    valid = make_storage("valid")
+    _add_keycloak_entry(valid, expired=False)
+
+    report = test_module.prune_cache(
+        config_dir=tmp_path, backend=backend, max_entries=0, dry_run=True
+    )
+
+    assert report.expired == [expired.name]
+    assert report.over_capacity == [valid.name]
+    assert expired.exists()
+    assert valid.exists()
+
+
+def test_prune_cache_skips_locked_entries(tmp_path, backend, make_storage):
+    expired = make_storage("expired")
+    _add_keycloak_entry(expired, expired=True)
+
+    valid = make_storage("valid")
+    _add_keycloak_entry(valid, expired=False)
+
+    with make_storage("expired").lock(timeout=1), make_storage("valid").lock(timeout=1):
+        report = test_module.prune_cache(config_dir=tmp_path, backend=backend, max_entries=0)
+
+    assert report.removed == 0
+    assert report.kept == 2
+    assert expired.exists()
+    assert valid.exists()
+
+
+def test_prune_cache_locks_removed_entries(tmp_path, backend, make_storage, monkeypatch):
+    expired = make_storage("expired")
+    _add_keycloak_entry(expired, expired=True)
+    storage_class = type(expired)
+    purge = storage_class.purge
+    refreshed = []
+
+    def purge_while_refreshing(self):
+        # a refresher must not take the lease of the entry being removed
+        time.sleep(0.01)
+        lock = make_storage("expired").lock(timeout=1)
+        refreshed.append(lock.try_acquire())
+        lock.release()
+        purge(self)
+
+    monkeypatch.setattr(storage_class, "purge", purge_while_refreshing)
+    report = test_module.prune_cache(config_dir=tmp_path, backend=backend)
+
+    assert report.expired == [expired.name]
+    assert refreshed == [False]
+
+
+def test_prune_cache_entry_removed_concurrently(tmp_path, monkeypatch):
+    storage = Storage(tmp_path, STAGING, "gone")
+    _add_keycloak_entry(storage, expired=True)
+    monkeypatch.setattr(Storage, "read", lambda self: None)
+
+    report = test_module.prune_cache(config_dir=tmp_path, backend=StorageBackend.file)
+    assert report.removed == 0
+    assert report.kept == 0
+
+
+def test_prune_cache_temp_files(tmp_path, monkeypatch):
+    storage = Storage(tmp_path, STAGING, "valid")
+    _add_keycloak_entry(storage, expired=False)
+    # left by writes interrupted by a crash, or still being written
+    stale = tmp_path / f".{storage.name}.x1y2z3.tmp"
+    recent = tmp_path / f".{storage.name}.a1b2c3.tmp"
+    stale.write_bytes(b"partial")
+    recent.write_bytes(b"partial")
+    old = time.time() - test_module.TEMP_FILE_MAX_AGE_SECONDS - 1
+    os.utime(stale, (old, old))
+
+    report = test_module.prune_cache(config_dir=tmp_path, backend=StorageBackend.file, dry_run=True)
+    assert report.temp_files == [stale.name]
+    assert stale.exists()
+
+    report = test_module.prune_cache(config_dir=tmp_path, backend=StorageBackend.file)
+    assert report.temp_files == [stale.name]
+    assert report.removed == 0
+    assert not stale.exists()
+    assert recent.exists()
+    assert storage.exists()
+
+    # renamed by its writer meanwhile
+    monkeypatch.setattr(test_module, "scan_temp_files", lambda config_dir: [stale])
+    report = test_module.prune_cache(config_dir=tmp_path, backend=StorageBackend.file)
+    assert report.temp_files == []
+
+
+def test_prune_cache_defaults(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "config_dir", tmp_path)
+    monkeypatch.setattr(settings, "CACHE_MAX_ENTRIES", 0)
+    storage = Storage(tmp_path, STAGING, "valid")
+    _add_keycloak_entry(storage, expired=False)
+
+    report = test_module.prune_cache()
+    assert report.over_capacity == [storage.name]
+
+
+@pytest.fixture
+def prune_schedule(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "config_dir", tmp_path)
+    monkeypatch.setattr(test_module, "_NEXT_PRUNE_TIMES", {})
+    return tmp_path / test_module.MARKER_FILE_NAME
+
+
+def test_maybe_prune_cache(prune_schedule):
+    storage = Storage(prune_schedule.parent, STAGING, "expired")
+    _add_keycloak_entry(storage, expired=True)
+
+    report = test_module.maybe_prune_cache()
+    assert report.expired == [storage.name]
+    assert prune_schedule.exists()
+
+    # at most once per interval, in this process
+    _add_keycloak_entry(storage, expired=True)
+    assert test_module.maybe_prune_cache() is None
+    assert storage.exists()
+
+
+def test_maybe_prune_cache_memory_backend(prune_schedule, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", StorageBackend.memory)
+    storage = MemoryStorage(prune_schedule.parent, STAGING, "expired")
+    _add_keycloak_entry(storage, expired=True)
+    # the marker of the other processes is ignored
+    prune_schedule.touch()
+
+    report = test_module.maybe_prune_cache()
+    assert report.expired == [storage.name]
+    assert test_module.maybe_prune_cache() is None
+    _MEMORY_ENTRIES.clear()
+
+
+def test_maybe_prune_cache_other_process(prune_schedule):
+    # another process pruned recently
+    prune_schedule.touch()
+
+    assert test_module.maybe_prune_cache() is None
+    assert test_module._NEXT_PRUNE_TIMES[prune_schedule.parent] > time.time()
+
+    os.utime(prune_schedule, (0, 0))
+    assert test_module.maybe_prune_cache() is None  # remembered in this process
+
+
+def test_maybe_prune_cache_disabled(prune_schedule, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_EVICTION_INTERVAL_SECONDS", 0)
+    assert test_module.maybe_prune_cache() is None
+    assert not prune_schedule.exists()
+
+
+def test_maybe_prune_cache_already_running(prune_schedule):
+    with test_module._MAYBE_PRUNE_LOCK:
+        assert test_module.maybe_prune_cache() is None
+    assert not prune_schedule.exists()
+
+
+def test_maybe_prune_cache_failure(prune_schedule, monkeypatch, caplog):
+    def fail(**kwargs):
+        raise OSError("boom")
+
+    monkeypatch.setattr(test_module, "prune_cache", fail)
+
+    assert test_module.maybe_prune_cache() is None
+    assert "Failed to prune the token cache" in caplog.text
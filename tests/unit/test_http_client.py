@@ -0,0 +1,204 @@
+import asyncio
+import multiprocessing
+import sys
+from unittest.mock import Mock, patch
+
+import httpx2
+import pytest
+
+from obi_auth import http_client as test_module
+from obi_auth.config import settings
+from obi_auth.exception import ConfigError
+
+
+@pytest.fixture(autouse=True)
+def pool(monkeypatch):
+    pool = test_module._ClientPool()
+    monkeypatch.setattr(test_module, "_POOL", pool)
+    return pool
+
+
+def test_get_client():
+    client = test_module.get_client()
+    assert isinstance(client, httpx2.Client)
+    assert test_module.get_client() is client
+
+
+def test_get_client_settings(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_TIMEOUT", 12.0)
+    monkeypatch.setattr(settings, "HTTP_MAX_CONNECTIONS", 3)
+    monkeypatch.setattr(settings, "HTTP_MAX_KEEPALIVE_CONNECTIONS", 2)
+    monkeypatch.setattr(settings, "HTTP_KEEPALIVE_EXPIRY", 42.0)
+
+    with patch("obi_auth.http_client.httpx2.Client") as mock_client:
+        test_module.get_client()
+
+    kwargs = mock_client.call_args.kwargs
+    assert kwargs["timeout"] == 12.0
+    assert kwargs["limits"] == httpx2.Limits(
+        max_connections=3, max_keepalive_connections=2, keepalive_expiry=42.0
+    )
+    assert kwargs["http2"] is False
+
+
+def test_get_client_http2_not_installed(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP2", True)
+
+    with patch.dict(sys.modules, {"h2": None}):
+        with pytest.raises(ConfigError, match="pip install 'obi-auth\\[http2\\]'"):
+            test_module.get_client()
+
+
+def test_get_client_reuses_connection(httpx2_mock):
+    httpx2_mock.post("https://example.com/token").respond(json={"access_token": "foo"})
+
+    client = test_module.get_client()
+    client.post("https://example.com/token")
+    client.post("https://example.com/token")
+
+    assert test_module.get_client() is client
+    assert httpx2_mock.calls.call_count == 2
+
+
+def test_set_client():
+    default_client = test_module.get_client()
+    custom_client = Mock()
+
+    test_module.set_client(custom_client)
+    assert test_module.get_client() is custom_client
+    assert default_client.is_closed
+
+    test_module.set_client(None)
+    client = test_module.get_client()
+    assert client is not custom_client
+    assert client is not default_client
+    custom_client.close.assert_not_called()
+
+
+def test_get_async_client(pool):
+    async def get_clients():
+        return test_module.get_async_client(), test_module.get_async_client()
+
+    first, second = asyncio.run(get_clients())
+    assert isinstance(first, httpx2.AsyncClient)
+    assert first is second
+
+    # clients are not shared across event loops
+    other, _ = asyncio.run(get_clients())
+    assert other is not first
+
+
+def test_get_async_client_loop_closed(pool):
+    async def get_client():
+        return test_module.get_async_client()
+
+    loop = asyncio.new_event_loop()
+    client = loop.run_until_complete(get_client())
+    loop.close()
+
+    other = asyncio.run(get_client())
+    assert other is not client
+    assert loop not in pool._async_clients
+
+
+def test_aclose_clients(pool):
+    async def use_clients():
+        client = test_module.get_async_client()
+        await test_module.aclose_clients()
+        assert client.is_closed
+        assert test_module.get_async_client() is not client
+        await test_module.aclose_clients()
+        # nothing to close
+        await test_module.aclose_clients()
+
+    asyncio.run(use_clients())
+    assert pool._async_clients == {}
+
+
+def test_set_async_client(pool):
+    custom_client = Mock()
+
+    async def get_client():
+        return test_module.get_async_client()
+
+    async def replace_client():
+        default_client = test_module.get_async_client()
+        test_module.set_async_client(custom_client)
+        assert test_module.get_async_client() is custom_client
+        await asyncio.sleep(0)
+        return default_client
+
+    # the replaced default clients are closed in their loop
+    assert asyncio.run(replace_client()).is_closed
+    assert asyncio.run(get_client()) is custom_client
+
+    test_module.set_async_client(None)
+    assert asyncio.run(get_client()) is not custom_client
+    custom_client.aclose.assert_not_called()
+
+
+def test_close_async_clients(pool):
+    async def get_client():
+        return test_module.get_async_client()
+
+    # not running, the client is closed in its loop
+    idle_loop = asyncio.new_event_loop()
+    idle_client = idle_loop.run_until_complete(get_client())
+    # closed, its client cannot be closed anymore
+    closed_loop = asyncio.new_event_loop()
+    closed_client = closed_loop.run_until_complete(get_client())
+    closed_loop.close()
+
+    async def close_from_other_loop():
+        test_module.set_async_client(None)
+
+    # not from another loop
+    asyncio.run(close_from_other_loop())
+    assert not idle_client.is_closed
+    assert pool._async_clients == {}
+
+    pool._async_clients = {idle_loop: idle_client, closed_loop: closed_client}
+    test_module._close_at_exit()
+    assert idle_client.is_closed
+    assert not closed_client.is_closed
+    assert pool._async_clients == {}
+    idle_loop.close()
+
+
+def test_reset_after_fork():
+    parent_client = test_module.get_client()
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+
+    def child():
+        queue.put(test_module.get_client() is not parent_client)
+
+    process = context.Process(target=child)
+    process.start()
+    process.join(timeout=10)
+
+    assert queue.get(timeout=10) is True
+    assert process.exitcode == 0
+
+
+def test_reset_after_fork_keeps_custom_client():
+    default_client = test_module.get_client()
+    test_module._reset_after_fork()
+    assert test_module.get_client() is not default_client
+
+    custom_client = Mock()
+    test_module.set_client(custom_client)
+    test_module._reset_after_fork()
+    assert test_module.get_client() is custom_client
+
+
+def test_reset_after_fork_drops_async_clients(pool):
+    async def get_client():
+        client = test_module.get_async_client()
+        test_module._reset_after_fork()
+        return client, test_module.get_async_client()
+
+    client, other = asyncio.run(get_client())
+    assert other is not client
+    assert list(pool._async_clients.values()) == [other]
+    assert not client.is_closed
@@ -0,0 +1,102 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+# generous enough for slow CI runners, most of it is spent importing the dependencies
+IMPORT_TIME_BUDGET_SECONDS = 1.0
+
+IMPORT_SCRIPT = """
+import json, time
+
+start = time.perf_counter()
+import obi_auth
+elapsed = time.perf_counter() - start
+
+from obi_auth.config import settings
+from obi_auth.util import derive_fernet_key
+
+print(json.dumps({
+    "elapsed": elapsed,
+    "settings_loaded": settings._settings is not None,
+    "key_derived": derive_fernet_key.cache_info().currsize > 0,
+}))
+"""
+
+
+def _import_obi_auth() -> dict:
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", IMPORT_SCRIPT], capture_output=True, check=True, text=True
+    )
+    return json.loads(result.stdout)
+
+
+def test_import_is_lazy():
+    res = _import_obi_auth()
+    assert res["settings_loaded"] is False
+    assert res["key_derived"] is False
+
+
+def test_import_time_budget():
+    # best of a few runs, to ignore the cold filesystem cache of the first one
+    elapsed = min(_import_obi_auth()["elapsed"] for _ in range(3))
+    assert elapsed < IMPORT_TIME_BUDGET_SECONDS
+
+
+# cumulative cold import time of the obi_auth package itself, as reported by -X importtime
+PACKAGE_IMPORT_TIME_BUDGET_US = 50_000
+
+HEAVY_MODULES = ["cryptography", "http.server", "httpx2", "jwt", "pydantic", "pydantic_settings"]
+
+FLOW_MODULES = ["http.server", "obi_auth.flows.daf", "obi_auth.flows.pkce", "obi_auth.server"]
+
+
+def _imported_modules(statement: str) -> set[str]:
+    script = f"import json, sys\n{statement}\nprint(json.dumps(list(sys.modules)))"
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", script], capture_output=True, check=True, text=True
+    )
+    return set(json.loads(result.stdout))
+
+
+def test_import_importtime():
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", "import obi_auth"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    # each line is "import time: <self us> | <cumulative us> | <module>"
+    times = {
+        fields[2].strip(): int(fields[1])
+        for line in result.stderr.splitlines()
+        if len(fields := line.removeprefix("import time:").split("|")) == 3
+        and fields[1].strip().isdigit()
+    }
+    assert times["obi_auth"] < PACKAGE_IMPORT_TIME_BUDGET_US
+    assert not set(HEAVY_MODULES) & set(times)
+
+
+def test_import_get_token_info_only():
+    modules = _imported_modules("import obi_auth; obi_auth.get_token_info")
+    assert "jwt" in modules
+    assert "obi_auth.client" not in modules
+    assert not {"httpx2", "pydantic_settings", "http.server"} & modules
+
+
+def test_import_client_without_flows():
+    modules = _imported_modules("import obi_auth.client")
+    assert not set(FLOW_MODULES) & modules
+
+
+def test_lazy_exports():
+    import obi_auth
+    from obi_auth import client, token_info
+
+    assert obi_auth.get_token is client.get_token
+    assert obi_auth.get_token_info is token_info.get_token_info
+    assert set(obi_auth.__all__) <= set(dir(obi_auth))
+
+    with pytest.raises(AttributeError, match="has no attribute 'foo'"):
+        _ = obi_auth.foo
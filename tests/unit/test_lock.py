@@ -0,0 +1,548 @@
+import asyncio
+import concurrent.futures
+import functools
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from obi_auth import lock as test_module
+
+
+def test_file_lock(tmp_path):
+    path = tmp_path / "token.json.lock"
+    lock = test_module.FileLock(path, timeout=1)
+    assert not lock.locked
+
+    with lock:
+        assert lock.locked
+        assert path.exists()
+
+    assert not lock.locked
+
+    # releasing an unlocked lock is a no-op
+    lock.release()
+
+
+def test_file_lock__try_acquire(tmp_path):
+    path = tmp_path / "token.json.lock"
+    with test_module.FileLock(path, timeout=1):
+        lock = test_module.FileLock(path, timeout=1)
+        assert lock.try_acquire() is False
+        lock.release()
+
+    assert lock.try_acquire() is True
+    lock.release()
+
+
+def test_file_lock__timeout(tmp_path):
+    path = tmp_path / "token.json.lock"
+    context = multiprocessing.get_context("fork")
+    locked, done = context.Event(), context.Event()
+
+    def holder():
+        with test_module.FileLock(path, timeout=1):
+            locked.set()
+            done.wait(timeout=10)
+
+    process = context.Process(target=holder)
+    process.start()
+    try:
+        assert locked.wait(timeout=10)
+
+        lock = test_module.FileLock(path, timeout=0.1)
+        assert lock.acquire() is False
+        assert not lock.locked
+    finally:
+        done.set()
+        process.join(timeout=10)
+
+    with test_module.FileLock(path, timeout=1) as lock:
+        assert lock.locked
+
+
+def test_file_lock__async(tmp_path):
+    path = tmp_path / "token.json.lock"
+
+    async def run():
+        async with test_module.FileLock(path, timeout=1) as lock:
+            assert lock.locked
+        assert not lock.locked
+
+    asyncio.run(run())
+
+
+def test_file_lock__async_timeout(tmp_path):
+    path = tmp_path / "token.json.lock"
+
+    with test_module.FileLock(path, timeout=1):
+        # flock locks are per open file description, so a second one conflicts in-process
+        lock = test_module.FileLock(path, timeout=0.1)
+        assert asyncio.run(lock.acquire_async()) is False
+        assert not lock.locked
+
+
+def test_file_lock__async_cancelled(tmp_path):
+    path = tmp_path / "token.json.lock"
+
+    async def run(lock):
+        task = asyncio.create_task(lock.acquire_async())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    with test_module.FileLock(path, timeout=10):
+        lock = test_module.FileLock(path, timeout=10)
+        asyncio.run(run(lock))
+        assert not lock.locked
+        assert lock._fd is None
+
+
+class _SlowLock(test_module.BaseLock):
+    """Lock whose attempts take time, like a query to a busy database or a server."""
+
+    def __init__(self, *, timeout):
+        super().__init__("slow", timeout=timeout)
+        self.threads = set()
+        self.attempting = threading.Event()
+
+    def release(self):
+        self.threads.add(threading.get_ident())
+        self._locked = False
+
+    def _try_acquire(self):
+        self.threads.add(threading.get_ident())
+        self.attempting.set()
+        time.sleep(0.2)
+        self._locked = True
+        return True
+
+
+def test_lock__async_in_thread():
+    lock = _SlowLock(timeout=1)
+
+    async def run():
+        async with lock:
+            assert lock.locked
+        assert not lock.locked
+
+    asyncio.run(run())
+    assert lock.threads
+    assert threading.get_ident() not in lock.threads
+
+
+def test_lock__async_cancelled_while_attempting():
+    lock = _SlowLock(timeout=1)
+
+    async def run():
+        task = asyncio.create_task(lock.acquire_async())
+        await asyncio.to_thread(lock.attempting.wait)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    # released once the attempt ended, not before
+    asyncio.run(run())
+    assert not lock.locked
+
+
+@pytest.fixture
+def connect(tmp_path):
+    db_path = tmp_path / "locks.sqlite3"
+    connection = sqlite3.connect(db_path)
+    connection.execute(
+        "CREATE TABLE locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+    )
+    connection.close()
+    # a new connection per call, like separate threads or processes would have
+    return functools.partial(sqlite3.connect, db_path)
+
+
+def test_lease_lock(connect):
+    lock = test_module.LeaseLock(connect, "staging/key", timeout=1)
+    assert not lock.locked
+
+    with lock:
+        assert lock.locked
+        assert connect().execute("SELECT name FROM locks").fetchall() == [("staging/key",)]
+
+        other = test_module.LeaseLock(connect, "staging/key", timeout=0.1)
+        assert other.acquire() is False
+        assert not other.locked
+
+        with test_module.LeaseLock(connect, "staging/other", timeout=0.1) as other_key:
+            assert other_key.locked
+
+    assert not lock.locked
+    assert connect().execute("SELECT name FROM locks").fetchall() == []
+
+    # releasing an unlocked lock is a no-op
+    lock.release()
+
+
+def test_lease_lock__expired(connect, monkeypatch):
+    crashed = test_module.LeaseLock(connect, "staging/key", timeout=1)
+    assert crashed.acquire()
+
+    # the lease of a crashed holder is taken over once expired
+    monkeypatch.setattr(test_module.time, "time", lambda: time.monotonic() + 1e10)
+    lock = test_module.LeaseLock(connect, "staging/key", timeout=1)
+    assert lock.acquire()
+
+    # the stale holder cannot release the lease of the new one
+    crashed.release()
+    assert connect().execute("SELECT owner FROM locks").fetchall() == [(lock._owner,)]
+
+
+def test_lease_lock__busy_database():
+    connection = Mock()
+    connection.__enter__ = Mock(side_effect=sqlite3.OperationalError("database is locked"))
+    connection.__exit__ = Mock()
+
+    lock = test_module.LeaseLock(lambda: connection, "staging/key", timeout=0.1)
+    assert lock.acquire() is False
+    assert not lock.locked
+
+
+def test_lease_lock__async(connect):
+    async def run():
+        async with test_module.LeaseLock(connect, "staging/key", timeout=1) as lock:
+            assert lock.locked
+        assert not lock.locked
+
+    asyncio.run(run())
+
+
+def _lease_file_lock(path, *, timeout=1, ttl=10):
+    return test_module.LeaseFileLock(path, timeout=timeout, ttl=ttl)
+
+
+def test_lease_file_lock(tmp_path):
+    path = tmp_path / "token.json.lease"
+    lock = _lease_file_lock(path)
+    assert not lock.locked
+
+    with lock:
+        assert lock.locked
+        assert json.loads(path.read_text())["owner"] == lock._owner
+        # the temporary file of the lease is removed
+        assert list(tmp_path.iterdir()) == [path]
+
+        other = _lease_file_lock(path)
+        assert other.try_acquire() is False
+        assert not other.locked
+
+    assert not lock.locked
+    assert not path.exists()
+    # the waiters are told that the holder refreshed the token
+    done_path = test_module.LeaseFileLock.get_done_path(path)
+    assert json.loads(done_path.read_text()) == {"owner": lock._owner}
+
+    # releasing an unlocked lock is a no-op
+    lock.release()
+
+
+def test_lease_file_lock__timeout(tmp_path):
+    path = tmp_path / "token.json.lease"
+    with _lease_file_lock(path):
+        lock = _lease_file_lock(path, timeout=0.1)
+        assert lock.acquire() is False
+        assert not lock.locked
+        assert not lock.refreshed
+    assert not path.exists()
+
+
+def _wait_for_holder(holder, exit_holder, *, is_async=False):
+    """Return the waiter of the lease of holder, which exits with exit_holder while waited for."""
+
+    def wait(waiter):
+        if is_async:
+            return asyncio.run(waiter.acquire_async())
+        return waiter.acquire()
+
+    waiter = _lease_file_lock(holder._path, timeout=10)
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        future = executor.submit(wait, waiter)
+        time.sleep(0.2)
+        exit_holder(holder)
+        acquired = future.result(timeout=10)
+    assert acquired is waiter.locked
+    return waiter
+
+
+@pytest.mark.parametrize("is_async", [False, True])
+def test_lease_file_lock__refreshed_while_waiting(tmp_path, is_async):
+    holder = _lease_file_lock(tmp_path / "token.json.lease")
+    holder.__enter__()
+
+    waiter = _wait_for_holder(holder, lambda holder: holder.__exit__(None), is_async=is_async)
+
+    # the waiter reads the refreshed token without taking the lease
+    assert waiter.refreshed
+    assert not waiter.locked
+    waiter.__exit__(None)
+    done_path = test_module.LeaseFileLock.get_done_path(holder._path)
+    assert json.loads(done_path.read_text()) == {"owner": holder._owner}
+
+
+@pytest.mark.parametrize(
+    "exit_holder",
+    [
+        # the block of the holder raised
+        lambda holder: holder.__exit__(RuntimeError),
+        # released without a block, e.g. by the eviction
+        lambda holder: holder.release(),
+    ],
+    ids=["raised", "released"],
+)
+def test_lease_file_lock__holder_failed(tmp_path, exit_holder):
+    holder = _lease_file_lock(tmp_path / "token.json.lease")
+    holder.__enter__()
+
+    waiter = _wait_for_holder(holder, exit_holder)
+
+    # the waiter refreshes the token itself
+    assert waiter.locked
+    assert not waiter.refreshed
+    waiter.release()
+
+
+def test_lease_file_lock__refreshed_by_another_holder(tmp_path):
+    path = tmp_path / "token.json.lease"
+    with _lease_file_lock(path):
+        pass
+
+    holder = _lease_file_lock(path)
+    holder.__enter__()
+    waiter = _lease_file_lock(path)
+    assert waiter.try_acquire() is False
+    holder.release()
+
+    # the refresh recorded is the one of a previous holder
+    assert waiter.try_acquire() is True
+    assert not waiter.refreshed
+    waiter.release()
+
+
+@pytest.mark.parametrize("content", ["", "[]", "{}"])
+def test_lease_file_lock__corrupted_done(tmp_path, content):
+    path = tmp_path / "token.json.lease"
+    waiter = _lease_file_lock(path)
+    waiter._holder = "holder"
+    test_module.LeaseFileLock.get_done_path(path).write_text(content)
+
+    assert waiter.try_acquire() is True
+    waiter.release()
+
+
+def test_lease_file_lock__record_refresh_failed(tmp_path, monkeypatch, caplog):
+    path = tmp_path / "token.json.lease"
+    lock = _lease_file_lock(path)
+    with lock:
+        monkeypatch.setattr(lock, "_write", Mock(side_effect=OSError("disk full")))
+
+    assert "Failed to record the refresh" in caplog.text
+    assert not test_module.LeaseFileLock.get_done_path(path).exists()
+    assert not path.exists()
+
+
+def test_lease_file_lock__renewed(tmp_path):
+    path = tmp_path / "token.json.lease"
+    with _lease_file_lock(path, ttl=0.3) as lock:
+        expires_at = json.loads(path.read_text())["expires_at"]
+        # held longer than the TTL, e.g. during an interactive login
+        time.sleep(0.5)
+        assert _lease_file_lock(path).try_acquire() is False
+        assert json.loads(path.read_text())["owner"] == lock._owner
+        assert json.loads(path.read_text())["expires_at"] > expires_at
+
+    assert not lock._renewer.is_alive()
+    assert list(tmp_path.iterdir()) == [test_module.LeaseFileLock.get_done_path(path)]
+
+
+def test_lease_file_lock__renewal_failed(tmp_path, monkeypatch, caplog):
+    path = tmp_path / "token.json.lease"
+    lock = _lease_file_lock(path, ttl=0.15)
+    assert lock.acquire()
+    monkeypatch.setattr(lock, "_write", Mock(side_effect=OSError("stale file handle")))
+    time.sleep(0.2)
+    lock.release()
+
+    assert "Failed to renew lease" in caplog.text
+
+
+def test_lease_file_lock__lost(tmp_path, caplog):
+    path = tmp_path / "token.json.lease"
+    lock = _lease_file_lock(path, ttl=0.15)
+    assert lock.acquire()
+    # expired and broken by another process
+    path.write_text(json.dumps({"owner": "other", "expires_at": time.time() + 10}))
+    lock._renewer.join(timeout=10)
+
+    assert "Lease" in caplog.text and "was lost" in caplog.text
+    lock.release()
+    assert json.loads(path.read_text())["owner"] == "other"
+
+
+def test_lease_file_lock__expired(tmp_path, monkeypatch):
+    path = tmp_path / "token.json.lease"
+    crashed = _lease_file_lock(path)
+    assert crashed.acquire()
+    crashed._released.set()  # a crashed holder does not renew its lease
+    crashed._renewer.join()
+
+    # the lease of a crashed holder is broken once expired
+    monkeypatch.setattr(test_module.time, "time", lambda: time.monotonic() + 1e10)
+    lock = _lease_file_lock(path)
+    assert lock.acquire()
+    assert lock.locked
+    assert list(tmp_path.iterdir()) == [path]
+
+    # the stale holder cannot release the lease of the new one
+    crashed.release()
+    assert json.loads(path.read_text())["owner"] == lock._owner
+    lock.release()
+
+
+@pytest.mark.parametrize("content", ["", "not json", "[]", '{"owner": "other"}'])
+def test_lease_file_lock__corrupted(tmp_path, content):
+    path = tmp_path / "token.json.lease"
+    path.write_text(content)
+
+    lock = _lease_file_lock(path)
+    assert lock.try_acquire() is True
+    assert json.loads(path.read_text())["owner"] == lock._owner
+    lock.release()
+
+
+def test_lease_file_lock__broken_by_another_waiter(tmp_path):
+    path = tmp_path / "token.json.lease"
+    new_holder = _lease_file_lock(path)
+    assert new_holder.acquire()
+    # the expired lease seen by the waiter was already broken and replaced
+    waiter = _lease_file_lock(path)
+    waiter._break(("crashed", 0.0))
+
+    assert json.loads(path.read_text())["owner"] == new_holder._owner
+    assert list(tmp_path.iterdir()) == [path]
+    new_holder.release()
+
+    # nothing to break once released
+    waiter._break(("crashed", 0.0))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_lease_file_lock__link_reply_lost(tmp_path, monkeypatch):
+    path = tmp_path / "token.json.lease"
+    link = os.link
+
+    def link_with_lost_reply(src, dst):
+        # the server created the link, but the retransmitted request failed
+        link(src, dst)
+        raise FileExistsError(dst)
+
+    monkeypatch.setattr(test_module.os, "link", link_with_lost_reply)
+    lock = _lease_file_lock(path)
+    assert lock.try_acquire() is True
+    assert lock.locked
+    lock.release()
+
+
+def test_lease_file_lock__poll_interval(tmp_path):
+    lock = _lease_file_lock(tmp_path / "token.json.lease")
+    first = lock._get_poll_interval(0)
+    assert test_module.POLL_INTERVAL / 2 <= first <= test_module.POLL_INTERVAL
+
+    # the backoff is capped, with jitter
+    last = lock._get_poll_interval(100)
+    assert test_module.LEASE_MAX_POLL_INTERVAL / 2 <= last <= test_module.LEASE_MAX_POLL_INTERVAL
+
+
+def test_lease_file_lock__async(tmp_path):
+    path = tmp_path / "token.json.lease"
+
+    async def run():
+        async with _lease_file_lock(path) as lock:
+            assert lock.locked
+        assert not lock.locked
+
+    asyncio.run(run())
+    assert test_module.LeaseFileLock.get_done_path(path).exists()
+
+
+def test_thread_lock():
+    lock = test_module.ThreadLock(("dir", "staging", "key"), timeout=1)
+    with lock:
+        assert lock.locked
+
+        other = test_module.ThreadLock(("dir", "staging", "key"), timeout=0.1)
+        assert other.acquire() is False
+        assert not other.locked
+
+        with test_module.ThreadLock(("dir", "staging", "other"), timeout=0.1) as other_key:
+            assert other_key.locked
+
+    assert not lock.locked
+    assert other.try_acquire() is True
+    other.release()
+
+    # releasing an unlocked lock is a no-op
+    lock.release()
+
+
+def test_redis_lock(redis_client):
+    lock = test_module.RedisLock(redis_client, "obi-auth:lock:staging:key", timeout=1)
+    with lock:
+        assert lock.locked
+        assert redis_client.get("obi-auth:lock:staging:key") == lock._owner.encode()
+        assert 0 < redis_client.pttl("obi-auth:lock:staging:key") <= 1000
+
+        other = test_module.RedisLock(redis_client, "obi-auth:lock:staging:key", timeout=0.1)
+        assert other.acquire() is False
+        assert not other.locked
+
+    assert not lock.locked
+    assert redis_client.get("obi-auth:lock:staging:key") is None
+
+    # releasing an unlocked lock is a no-op
+    lock.release()
+
+
+def test_redis_lock__expired(redis_client):
+    crashed = test_module.RedisLock(redis_client, "obi-auth:lock:staging:key", timeout=1)
+    assert crashed.acquire()
+
+    # the lock of a crashed holder is taken over once expired
+    redis_client.delete("obi-auth:lock:staging:key")
+    lock = test_module.RedisLock(redis_client, "obi-auth:lock:staging:key", timeout=1)
+    assert lock.acquire()
+
+    # the stale holder cannot release the lock of the new one
+    crashed.release()
+    assert not crashed.locked
+    assert redis_client.get("obi-auth:lock:staging:key") == lock._owner.encode()
+
+
+def test_redis_lock__taken_over_while_releasing(redis_client, monkeypatch):
+    lock = test_module.RedisLock(redis_client, "obi-auth:lock:staging:key", timeout=1)
+    assert lock.acquire()
+
+    pipeline = redis_client.pipeline()
+    get = pipeline.get
+
+    def get_then_take_over(name):
+        value = get(name)
+        redis_client.set(name, "other")
+        return value
+
+    monkeypatch.setattr(pipeline, "get", get_then_take_over)
+    monkeypatch.setattr(redis_client, "pipeline", lambda: pipeline)
+
+    lock.release()
+    assert not lock.locked
+    assert redis_client.get("obi-auth:lock:staging:key") == b"other"
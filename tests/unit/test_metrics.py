@@ -0,0 +1,200 @@
+import asyncio
+import sys
+import time
+from unittest.mock import Mock, patch
+
+import httpx2
+import jwt
+import prometheus_client
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from obi_auth import cache, http_client, storage
+from obi_auth import metrics as test_module
+from obi_auth.exception import ConfigError
+from obi_auth.typedef import (
+    AuthMode,
+    DeploymentEnvironment,
+    KeycloakTokenInfo,
+    TokenCacheKey,
+    TokenProvider,
+)
+
+URL = "https://example.com/api/auth-manager/v1/access-token"
+KEY = TokenCacheKey(DeploymentEnvironment.staging, AuthMode.pkce, TokenProvider.keycloak)
+
+
+class RecordingMetrics:
+    def __init__(self):
+        self.counts = []
+        self.observations = []
+
+    def increment(self, metric, labels):
+        self.counts.append((metric.name, labels))
+
+    def observe(self, metric, value, labels):
+        self.observations.append((metric.name, labels))
+
+
+@pytest.fixture
+def token():
+    now = int(time.time())
+    return jwt.encode({"iat": now, "exp": now + 3600}, key=None, algorithm="none")
+
+
+@pytest.fixture
+def recorder():
+    recorder = RecordingMetrics()
+    test_module.set_recorder(recorder)
+    yield recorder
+    test_module.set_recorder(None)
+
+
+def test_set_recorder(recorder):
+    assert test_module.get_recorder() is recorder
+    test_module.set_recorder(None)
+    assert isinstance(test_module.get_recorder(), test_module.NoopMetrics)
+
+    # discarded
+    test_module.increment(test_module.MINTS, environment="staging")
+    with test_module.timer(test_module.DECRYPT_DURATION):
+        pass
+    assert recorder.counts == recorder.observations == []
+
+
+def test_noop_metrics():
+    noop = test_module.NoopMetrics()
+    assert noop.increment(test_module.MINTS, {}) is None
+    assert noop.observe(test_module.DECRYPT_DURATION, 1.0, {}) is None
+
+
+def test_timer(recorder):
+    with pytest.raises(RuntimeError):
+        with test_module.timer(test_module.STORAGE_READ_DURATION, backend="file"):
+            raise RuntimeError
+
+    # recorded even on error
+    assert recorder.observations == [
+        ("obi_auth_storage_read_duration_seconds", {"backend": "file"})
+    ]
+
+
+def test_memory_cache_lookups(recorder, token):
+    memory_cache = cache.MemoryTokenCache()
+    memory_cache.get(KEY)
+    memory_cache.set(KEY, token)
+    memory_cache.get(KEY)
+
+    lookups = [labels["result"] for _, labels in recorder.counts if labels["cache"] == "memory"]
+    assert lookups == ["miss", "hit"]
+
+
+@pytest.mark.parametrize(
+    ("storage_class", "backend"),
+    [(storage.Storage, "file"), (storage.SqliteStorage, "sqlite")],
+)
+def test_disk_cache_lookups(recorder, token, tmp_path, storage_class, backend):
+    token_storage = storage_class(tmp_path, DeploymentEnvironment.staging, "key")
+    token_cache = cache.TokenCache()
+    token_cache.get(token_storage)
+    token_cache.set(KeycloakTokenInfo(access_token=token), token_storage)
+    token_cache.get(token_storage)
+
+    assert [labels["result"] for _, labels in recorder.counts] == ["miss", "hit"]
+    assert [name for name, _ in recorder.observations] == [
+        "obi_auth_storage_read_duration_seconds",
+        "obi_auth_storage_read_duration_seconds",
+        "obi_auth_decrypt_duration_seconds",
+    ]
+    assert recorder.observations[0][1] == {"backend": backend}
+
+
+def test_auth_manager_cache_lookups(recorder):
+    token_storage = Mock()
+    token_storage.read.return_value = None
+    cache.AuthManagerTokenCache().get(token_storage)
+    assert recorder.counts == [("obi_auth_cache_lookups", {"cache": "disk", "result": "miss"})]
+
+
+def test_http_request_duration(recorder, httpx2_mock):
+    httpx2_mock.post(URL).respond(503)
+
+    with http_client._create_client(httpx2.Client) as client:
+        client.post(URL)
+
+    async def post():
+        async with http_client._create_client(httpx2.AsyncClient) as client:
+            await client.post(URL)
+
+    asyncio.run(post())
+
+    labels = {"endpoint": "access-token", "status": "503"}
+    assert recorder.observations == [("obi_auth_http_request_duration_seconds", labels)] * 2
+
+
+def test_http_request_duration_not_started(recorder):
+    response = httpx2.Response(200, request=httpx2.Request("GET", URL))
+    http_client._record_duration(response)
+    assert recorder.observations == []
+
+
+def test_opentelemetry_metrics():
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("test")
+    test_module.set_recorder(test_module.OpenTelemetryMetrics(meter))
+    try:
+        test_module.increment(test_module.MINTS, environment="staging")
+        test_module.observe(test_module.DECRYPT_DURATION, 0.5)
+    finally:
+        test_module.set_recorder(None)
+
+    data = reader.get_metrics_data()
+    points = {
+        metric.name: metric.data.data_points[0]
+        for resource_metrics in data.resource_metrics
+        for scope_metrics in resource_metrics.scope_metrics
+        for metric in scope_metrics.metrics
+    }
+    assert points["obi_auth_mints"].value == 1
+    assert points["obi_auth_mints"].attributes == {"environment": "staging"}
+    assert points["obi_auth_decrypt_duration_seconds"].sum == 0.5
+
+
+def test_opentelemetry_metrics_default_meter():
+    assert test_module.OpenTelemetryMetrics()._instruments.keys() == {
+        metric.name for metric in test_module.METRICS
+    }
+
+
+def test_prometheus_metrics():
+    registry = prometheus_client.CollectorRegistry()
+    test_module.set_recorder(test_module.PrometheusMetrics(registry))
+    try:
+        test_module.increment(test_module.CACHE_LOOKUPS, cache="memory", result="hit")
+        test_module.observe(test_module.DECRYPT_DURATION, 0.5)
+    finally:
+        test_module.set_recorder(None)
+
+    labels = {"cache": "memory", "result": "hit"}
+    assert registry.get_sample_value("obi_auth_cache_lookups_total", labels) == 1
+    assert registry.get_sample_value("obi_auth_decrypt_duration_seconds_sum") == 0.5
+
+
+def test_prometheus_metrics_default_registry():
+    with patch.object(prometheus_client, "REGISTRY", prometheus_client.CollectorRegistry()):
+        recorder = test_module.PrometheusMetrics()
+    assert recorder._metrics.keys() == {metric.name for metric in test_module.METRICS}
+
+
+@pytest.mark.parametrize(
+    ("recorder_class", "module", "extra"),
+    [
+        (test_module.OpenTelemetryMetrics, "opentelemetry", "opentelemetry"),
+        (test_module.PrometheusMetrics, "prometheus_client", "prometheus"),
+    ],
+)
+def test_missing_extra(recorder_class, module, extra):
+    with patch.dict(sys.modules, {module: None}):
+        with pytest.raises(ConfigError, match=rf"pip install 'obi-auth\[{extra}\]'"):
+            recorder_class()
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import logging
+
+import pytest
+
+from obi_auth import profiling as test_module
+from obi_auth.config import settings
+
+
+@pytest.fixture
+def profile(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "PROFILE", True)
+    caplog.set_level(logging.INFO, logger=test_module.__name__)
+    return caplog
+
+
+def _get_profiles(caplog):
+    return [record.profile for record in caplog.records if hasattr(record, "profile")]
+
+
+def test_disabled(caplog):
+    caplog.set_level(logging.INFO, logger=test_module.__name__)
+
+    with test_module.trace("get_token"):
+        with test_module.span("storage.read") as res:
+            assert res is None
+
+    assert test_module.trace("get_token") is test_module._NOOP_SPAN
+    assert test_module.span("storage.read") is test_module._NOOP_SPAN
+    assert caplog.records == []
+
+
+def test_trace(profile):
+    with test_module.trace("get_token", environment="staging"):
+        with test_module.span("acquire"):
+            with test_module.span("storage.read"):
+                pass
+        with test_module.span("decrypt"):
+            pass
+
+    [record] = profile.records
+    assert record.message.startswith("get_token took ")
+    assert json.loads(record.message.split(": ", 1)[1]) == record.profile
+    assert record.profile["name"] == "get_token"
+    assert record.profile["environment"] == "staging"
+    assert [(span["name"], span["depth"]) for span in record.profile["spans"]] == [
+        ("acquire", 1),
+        ("storage.read", 2),
+        ("decrypt", 1),
+    ]
+    assert all(span["duration_ms"] >= 0 for span in record.profile["spans"])
+
+
+def test_nested_trace(profile):
+    with test_module.trace("get_token"):
+        with test_module.trace("get_token"):
+            pass
+
+    [profile] = _get_profiles(profile)
+    assert [span["name"] for span in profile["spans"]] == ["get_token"]
+
+
+def test_error(profile):
+    with pytest.raises(RuntimeError):
+        with test_module.trace("get_token"):
+            with test_module.span("acquire"):
+                raise RuntimeError
+
+    [profile] = _get_profiles(profile)
+    assert profile["error"] == "RuntimeError"
+    assert profile["spans"][0]["error"] == "RuntimeError"
+
+
+def test_trace_async(profile):
+    def read():
+        with test_module.span("storage.read"):
+            pass
+
+    async def get_token():
+        with test_module.trace("get_token_async"):
+            await asyncio.gather(asyncio.to_thread(read), asyncio.to_thread(read))
+
+    asyncio.run(get_token())
+
+    [profile] = _get_profiles(profile)
+    assert [span["name"] for span in profile["spans"]] == ["storage.read"] * 2
@@ -0,0 +1,62 @@
+import struct
+
+import pytest
+
+from obi_auth import record as test_module
+from obi_auth.typedef import CachedAuthManagerTokenInfo, CachedTokenInfo
+
+RECORDS = [
+    CachedTokenInfo(token=b"token", ttl=300, iat=1_700_000_000, exp=1_700_000_300),
+    CachedTokenInfo(token=b"token", ttl=300),
+    CachedAuthManagerTokenInfo(
+        token=b"token", ttl=300, persistent_token_id=b"pers-id", iat=0, exp=300
+    ),
+    CachedAuthManagerTokenInfo(token=b"", ttl=-1, persistent_token_id=b"pers-id"),
+]
+
+
+@pytest.mark.parametrize("data", RECORDS)
+def test_roundtrip(data):
+    encoded = test_module.encode_record(data)
+    assert encoded.startswith(test_module.MAGIC)
+
+    res = test_module.decode_record(encoded)
+    assert type(res) is type(data)
+    assert res == data
+
+
+def test_encode_record():
+    data = CachedTokenInfo(token=b"token", ttl=300, exp=1_700_000_300)
+    assert test_module.encode_record(data) == (
+        struct.pack("<4sBBBxqqq", b"OBIT", 1, 1, 0b10, 300, 0, 1_700_000_300)
+        + struct.pack("<I", 5)
+        + b"token"
+    )
+
+
+@pytest.mark.parametrize("data", RECORDS)
+def test_decode_json(data):
+    assert test_module.decode_record(data.model_dump_json()) == data
+    assert test_module.decode_record(data.model_dump_json().encode()) == data
+
+
+@pytest.mark.parametrize(
+    ("transform", "match"),
+    [
+        (lambda data: data[:10], "Truncated cache record header"),
+        (lambda data: data[:34], "Truncated cache record"),
+        (lambda data: data[:-1], "Truncated cache record"),
+        (lambda data: data + b"x", "Truncated cache record"),
+        (lambda data: data[:4] + b"\x02" + data[5:], "Unsupported cache record version 2"),
+        (lambda data: data[:5] + b"\x09" + data[6:], "Unknown cache record type 9"),
+    ],
+)
+def test_decode_corrupted(transform, match):
+    data = test_module.encode_record(RECORDS[2])
+    with pytest.raises(ValueError, match=match):
+        test_module.decode_record(transform(data))
+
+
+def test_decode_invalid_json():
+    with pytest.raises(ValueError):
+        test_module.decode_record(b"{")
@@ -0,0 +1,120 @@
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from obi_auth import refresh as test_module
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = test_module.RefreshScheduler()
+    yield scheduler
+    scheduler.stop(timeout=1)
+
+
+def _wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not met before timeout"
+        time.sleep(0.01)
+
+
+def test_scheduler_runs_due_callback(scheduler):
+    callback = Mock(return_value=None)
+
+    scheduler.schedule("key", due=time.time(), callback=callback)
+
+    _wait_until(lambda: callback.call_count == 1)
+    _wait_until(lambda: scheduler._jobs == {})
+
+
+def test_scheduler_reschedules_callback(scheduler):
+    calls = []
+
+    def callback():
+        calls.append(time.time())
+        return time.time() + 0.05 if len(calls) < 3 else None
+
+    scheduler.schedule("key", due=time.time(), callback=callback)
+
+    _wait_until(lambda: len(calls) == 3)
+    _wait_until(lambda: scheduler._jobs == {})
+    assert calls[2] - calls[0] >= 0.1
+
+
+def test_scheduler_waits_until_due(scheduler):
+    callback = Mock(return_value=None)
+
+    scheduler.schedule("key", due=time.time() + 0.2, callback=callback)
+    time.sleep(0.1)
+    callback.assert_not_called()
+
+    _wait_until(lambda: callback.call_count == 1)
+
+
+def test_scheduler_logs_failures(scheduler, caplog):
+    callback = Mock(side_effect=RuntimeError("boom"))
+
+    scheduler.schedule("key", due=time.time(), callback=callback)
+
+    _wait_until(lambda: scheduler._jobs == {})
+    callback.assert_called_once()
+    assert "Background refresh of key failed" in caplog.text
+
+
+def test_scheduler_cancel(scheduler):
+    callback = Mock(return_value=None)
+
+    scheduler.schedule("key", due=time.time() + 60, callback=callback)
+    scheduler.cancel("key")
+    scheduler.cancel("missing")
+
+    assert scheduler._jobs == {}
+    callback.assert_not_called()
+
+
+def test_scheduler_job_replaced_while_running(scheduler):
+    started, release = threading.Event(), threading.Event()
+    replacement = Mock(return_value=None)
+
+    def callback():
+        started.set()
+        release.wait(timeout=2)
+        return time.time()
+
+    scheduler.schedule("key", due=time.time(), callback=callback)
+    assert started.wait(timeout=2)
+    scheduler.schedule("key", due=time.time() + 60, callback=replacement)
+    release.set()
+    time.sleep(0.1)
+
+    assert scheduler._jobs["key"][1] is replacement
+    replacement.assert_not_called()
+
+
+def test_scheduler_stop(scheduler):
+    scheduler.schedule("key", due=time.time() + 60, callback=Mock())
+    thread = scheduler._thread
+
+    scheduler.stop(timeout=1)
+
+    assert not thread.is_alive()
+    assert scheduler._thread is None
+    assert scheduler._jobs == {}
+
+    # stopping twice is a no-op
+    scheduler.stop()
+
+
+def test_scheduler_idle_thread(scheduler):
+    scheduler.schedule("key", due=time.time() + 60, callback=Mock())
+    scheduler.cancel("key")
+
+    # wake the thread up with no jobs left
+    with scheduler._condition:
+        scheduler._condition.notify()
+    time.sleep(0.05)
+
+    assert scheduler._thread.is_alive()
@@ -0,0 +1,244 @@
+import asyncio
+import email.utils
+import time
+from unittest.mock import Mock, patch
+
+import httpx2
+import pytest
+
+from obi_auth import resilience as test_module
+from obi_auth.config import settings
+from obi_auth.exception import CircuitOpenError, ClientError
+
+URL = "https://example.com/api"
+NAME = "service"
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    monkeypatch.setattr(test_module, "_BREAKERS", {})
+    monkeypatch.setattr(settings, "AUTH_MANAGER_MAX_RETRIES", 3)
+    monkeypatch.setattr(settings, "AUTH_MANAGER_RETRY_BACKOFF_SECONDS", 0.5)
+    monkeypatch.setattr(settings, "AUTH_MANAGER_RETRY_MAX_DELAY_SECONDS", 10)
+    monkeypatch.setattr(settings, "AUTH_MANAGER_CIRCUIT_BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "AUTH_MANAGER_CIRCUIT_BREAKER_RESET_SECONDS", 30)
+
+
+@pytest.fixture
+def events():
+    events = []
+    test_module.add_listener(events.append)
+    yield events
+    test_module.remove_listener(events.append)
+
+
+@pytest.fixture
+def sleep():
+    with patch("obi_auth.resilience.time.sleep") as mock_sleep:
+        yield mock_sleep
+
+
+def _response(status_code, headers=None):
+    return httpx2.Response(status_code, headers=headers, request=httpx2.Request("POST", URL))
+
+
+def _sender(*results):
+    """Return a send function returning or raising each result in turn."""
+    return Mock(side_effect=list(results))
+
+
+def test_call_with_retry(sleep, events):
+    send = _sender(_response(503), httpx2.ConnectError("reset"), _response(200))
+
+    assert test_module.call_with_retry(NAME, send).status_code == 200
+    assert send.call_count == 3
+    assert [event.attempt for event in events] == [1, 2]
+    assert {event.kind for event in events} == {"retry"}
+
+    # full jitter, below the exponential backoff
+    delays = [c.args[0] for c in sleep.call_args_list]
+    assert 0 <= delays[0] <= 0.5
+    assert 0 <= delays[1] <= 1.0
+    assert test_module.get_circuit_breaker(NAME).state == test_module.CircuitState.closed
+
+
+def test_call_with_retry_backoff_is_bounded(sleep, monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_MANAGER_MAX_RETRIES", 10)
+    monkeypatch.setattr(settings, "AUTH_MANAGER_CIRCUIT_BREAKER_THRESHOLD", 0)
+    monkeypatch.setattr(test_module.random, "uniform", lambda low, high: high)
+    send = _sender(*[_response(429)] * 11)
+
+    with pytest.raises(httpx2.HTTPStatusError):
+        test_module.call_with_retry(NAME, send)
+
+    assert [c.args[0] for c in sleep.call_args_list] == [0.5, 1, 2, 4, 8, 10, 10, 10, 10, 10]
+    assert test_module.get_circuit_breaker(NAME).state == test_module.CircuitState.closed
+
+
+def test_call_with_retry_gives_up(sleep):
+    send = _sender(*[_response(502)] * 4)
+    with pytest.raises(httpx2.HTTPStatusError):
+        test_module.call_with_retry(NAME, send)
+    assert send.call_count == 4
+
+    send = _sender(*[httpx2.ReadError("reset")] * 4)
+    with pytest.raises(httpx2.ReadError):
+        test_module.call_with_retry(NAME, send)
+    assert send.call_count == 4
+
+
+def test_call_with_retry_not_retried(sleep):
+    send = _sender(_response(401))
+    with pytest.raises(httpx2.HTTPStatusError):
+        test_module.call_with_retry(NAME, send)
+    send.assert_called_once()
+    sleep.assert_not_called()
+
+
+def test_call_with_retry_not_idempotent(sleep, monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_MANAGER_CIRCUIT_BREAKER_THRESHOLD", 0)
+    # the service may have handled the request
+    send = _sender(_response(504))
+    with pytest.raises(httpx2.HTTPStatusError):
+        test_module.call_with_retry(NAME, send, idempotent=False)
+    send.assert_called_once()
+
+    send = _sender(httpx2.ReadTimeout("timeout"))
+    with pytest.raises(httpx2.ReadTimeout):
+        test_module.call_with_retry(NAME, send, idempotent=False)
+    send.assert_called_once()
+    sleep.assert_not_called()
+
+    # the request was not sent
+    send = _sender(httpx2.ConnectError("refused"), httpx2.ConnectTimeout("timeout"), _response(200))
+    assert test_module.call_with_retry(NAME, send, idempotent=False).status_code == 200
+    assert send.call_count == 3
+
+
+def test_call_with_retry_async_not_idempotent(sleep):
+    async def send():
+        raise httpx2.ReadError("reset")
+
+    with pytest.raises(httpx2.ReadError):
+        asyncio.run(test_module.call_with_retry_async(NAME, send, idempotent=False))
+
+
+def test_call_with_retry_after(sleep):
+    send = _sender(_response(429, {"Retry-After": "3"}), _response(200))
+    test_module.call_with_retry(NAME, send)
+    sleep.assert_called_once_with(3.0)
+
+    # longer than the max delay
+    send = _sender(_response(503, {"Retry-After": "60"}))
+    with pytest.raises(httpx2.HTTPStatusError):
+        test_module.call_with_retry(NAME, send)
+    send.assert_called_once()
+
+
+def test_parse_retry_after():
+    assert test_module._parse_retry_after(_response(503)) is None
+    assert test_module._parse_retry_after(_response(503, {"Retry-After": "1.5"})) == 1.5
+    assert test_module._parse_retry_after(_response(503, {"Retry-After": "-1"})) == 0
+    assert test_module._parse_retry_after(_response(503, {"Retry-After": "soon"})) is None
+
+    retry_at = email.utils.formatdate(time.time() + 120, usegmt=True)
+    delay = test_module._parse_retry_after(_response(503, {"Retry-After": retry_at}))
+    assert 115 <= delay <= 120
+
+
+def test_circuit_breaker(sleep, events, monkeypatch):
+    breaker = test_module.get_circuit_breaker(NAME)
+    assert test_module.get_circuit_breaker(NAME) is breaker
+
+    for _ in range(2):
+        with pytest.raises(httpx2.HTTPStatusError):
+            test_module.call_with_retry(NAME, _sender(*[_response(503)] * 4))
+    assert breaker.state == test_module.CircuitState.open
+
+    # fails fast, without any request
+    send = _sender(_response(200))
+    with pytest.raises(CircuitOpenError, match="service is unavailable") as exc_info:
+        test_module.call_with_retry(NAME, send)
+    assert isinstance(exc_info.value, ClientError)
+    send.assert_not_called()
+
+    # a single trial after the cool down, opening again on failure
+    now = time.monotonic()
+    monkeypatch.setattr(test_module.time, "monotonic", lambda: now + 31)
+    with pytest.raises(httpx2.ConnectError):
+        test_module.call_with_retry(NAME, _sender(*[httpx2.ConnectError("reset")] * 4))
+    assert breaker.state == test_module.CircuitState.open
+    with pytest.raises(CircuitOpenError):
+        test_module.call_with_retry(NAME, send)
+
+    # and closing on success
+    monkeypatch.setattr(test_module.time, "monotonic", lambda: now + 62)
+    assert test_module.call_with_retry(NAME, send).status_code == 200
+    assert breaker.state == test_module.CircuitState.closed
+
+    states = [event.state for event in events if event.kind == "state_change"]
+    assert states == ["open", "half_open", "open", "half_open", "closed"]
+
+
+def test_circuit_breaker_half_open_single_trial(monkeypatch):
+    breaker = test_module.get_circuit_breaker(NAME)
+    breaker.record_failure()
+    breaker.record_failure()
+
+    now = time.monotonic()
+    monkeypatch.setattr(test_module.time, "monotonic", lambda: now + 31)
+    breaker.before_call()
+    assert breaker.state == test_module.CircuitState.half_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # the trial never ended, let another one through after the cool down
+    monkeypatch.setattr(test_module.time, "monotonic", lambda: now + 62)
+    breaker.before_call()
+    assert breaker.state == test_module.CircuitState.half_open
+
+
+def test_circuit_breaker_failures_while_open(events):
+    breaker = test_module.get_circuit_breaker(NAME)
+    for _ in range(3):
+        # calls started before the circuit opened
+        breaker.record_failure()
+    assert breaker.state == test_module.CircuitState.open
+    assert len(events) == 1
+
+
+def test_listener_failure(events):
+    def failing(event):
+        raise RuntimeError("boom")
+
+    test_module.add_listener(failing)
+    try:
+        test_module.get_circuit_breaker(NAME)._set_state(test_module.CircuitState.open)
+    finally:
+        test_module.remove_listener(failing)
+    assert len(events) == 1
+
+
+def test_call_with_retry_async(events):
+    async def send_503():
+        return _response(503)
+
+    async def send_200():
+        return _response(200)
+
+    async def fail():
+        raise httpx2.ConnectError("reset")
+
+    sends = iter([send_503, fail, send_200])
+
+    async def always_fail():
+        raise httpx2.ConnectError("reset")
+
+    with patch.object(test_module.random, "uniform", return_value=0):
+        response = asyncio.run(test_module.call_with_retry_async(NAME, lambda: next(sends)()))
+        assert response.status_code == 200
+        assert [event.attempt for event in events] == [1, 2]
+
+        with pytest.raises(httpx2.ConnectError):
+            asyncio.run(test_module.call_with_retry_async(NAME, always_fail))
+        assert [event.kind for event in events].count("retry") == 5
@@ -1,3 +1,5 @@
+import asyncio
+
 import httpx2
 import pytest
 
@@ -174,3 +176,43 @@ def test_callback_rejects_code_without_expected_state(running_server):
     response = httpx2.get(f"{running_server.redirect_uri}?code=mock-code&state=any")
     assert response.status_code == 400
     assert response.json() == {"detail": "Invalid OAuth state"}
+
+
+def test_wait_for_code_async(running_server):
+    running_server.expect_state("expected-state")
+
+    with pytest.raises(LocalServerError, match="Timeout waiting for authorization code"):
+        asyncio.run(running_server.wait_for_code_async(timeout=0.1))
+
+    response = httpx2.get(f"{running_server.redirect_uri}?code=mock-code&state=expected-state")
+    response.raise_for_status()
+
+    assert asyncio.run(running_server.wait_for_code_async()) == "mock-code"
+    assert running_server.auth_state.code is None
+
+
+def test_wait_for_code_async_waits_for_callback(running_server):
+    running_server.expect_state("expected-state")
+
+    async def run():
+        url = f"{running_server.redirect_uri}?code=mock-code&state=expected-state"
+        waiter = asyncio.create_task(running_server.wait_for_code_async(timeout=5))
+        await asyncio.sleep(0.2)
+        assert not waiter.done()
+        await asyncio.to_thread(httpx2.get, url)
+        return await waiter
+
+    assert asyncio.run(run()) == "mock-code"
+
+
+def test_run_async(server):
+    async def run():
+        async with server.run_async() as local_server:
+            port = local_server.port
+            response = await asyncio.to_thread(httpx2.get, f"http://localhost:{port}/callback")
+            assert response.status_code == 400
+        return port
+
+    port = asyncio.run(run())
+    with pytest.raises(httpx2.ConnectError):
+        httpx2.get(f"http://localhost:{port}/callback", timeout=0.5)
@@ -1,10 +1,26 @@
+import multiprocessing
 import os
+import sqlite3
 import stat
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
 import pytest
 
+from obi_auth import record
 from obi_auth import storage as test_module
-from obi_auth.typedef import CachedTokenInfo, DeploymentEnvironment
+from obi_auth.config import settings
+from obi_auth.exception import ConfigError
+from obi_auth.record import decode_record
+from obi_auth.typedef import (
+    CachedAuthManagerTokenInfo,
+    CachedTokenInfo,
+    DeploymentEnvironment,
+    LockMode,
+    StorageBackend,
+)
 
 PROD = DeploymentEnvironment.production
 STAGING = DeploymentEnvironment.staging
@@ -51,7 +67,7 @@ def test_storage_init__existing_dir(config_dir):
 
     assert get_unix_permissions(config_dir) == 0o700
 
-    expected_file = config_dir / "token_staging.json"
+    expected_file = config_dir / "token_staging.bin"
     assert storage._file_path == expected_file
 
     storage = test_module.Storage(config_dir, "staging", "key")
@@ -59,7 +75,7 @@ def test_storage_init__existing_dir(config_dir):
 
     assert get_unix_permissions(config_dir) == 0o700
 
-    expected_file = config_dir / "token_staging_key.json"
+    expected_file = config_dir / "token_staging_key.bin"
     assert storage._file_path == expected_file
 
     # not written yet
@@ -94,16 +110,39 @@ def test_storage__read(config_dir):
     assert not storage3.exists()
 
 
+def test_storage__legacy_json(config_dir):
+    legacy = CachedTokenInfo(token=b"foo", ttl=100)
+    storage = test_module.Storage(config_dir, STAGING, "key")
+    legacy_path = config_dir / "token_staging_key.json"
+    legacy_path.write_text(legacy.model_dump_json())
+    os.utime(legacy_path, (1000, 1000))
+
+    assert storage.exists()
+    assert storage.read() == legacy
+    assert storage.updated_at() == 1000
+
+    # the older versions keep reading their JSON file
+    obj = CachedTokenInfo(token=b"bar", ttl=100)
+    storage.write(obj)
+    assert storage.read() == obj
+    assert storage.updated_at() == storage._file_path.stat().st_mtime
+    assert CachedTokenInfo.model_validate_json(legacy_path.read_text()) == legacy
+
+    storage.clear()
+    assert not storage.exists()
+    assert list(config_dir.iterdir()) == []
+
+
 def test_storage__write(config_dir):
     storage = test_module.Storage(config_dir, PROD)
     obj = CachedTokenInfo(token=b"foo", ttl=100)
     storage.write(obj)
-    res = CachedTokenInfo.model_validate_json(storage._file_path.read_bytes())
+    res = decode_record(storage._file_path.read_bytes())
     assert res == obj
 
     obj2 = CachedTokenInfo(token=b"bar", ttl=100)
     storage.write(obj2)
-    res = CachedTokenInfo.model_validate_json(storage._file_path.read_bytes())
+    res = decode_record(storage._file_path.read_bytes())
     assert res == obj2
 
 
@@ -137,3 +176,401 @@ def test_file_permissions(config_dir):
     storage.clear()
     storage.write(CachedTokenInfo(token=b"bar", ttl=100))
     assert get_unix_permissions(storage._file_path) == 0o600
+
+
+def test_sqlite_storage(config_dir):
+    storage = test_module.SqliteStorage(config_dir, STAGING, "key")
+    assert get_unix_permissions(config_dir) == 0o700
+    assert not storage.exists()
+    assert storage.read() is None
+
+    obj = CachedTokenInfo(token=b"foo", ttl=100)
+    storage.write(obj)
+    assert storage.exists()
+    assert storage.read() == obj
+    assert get_unix_permissions(config_dir / "tokens.sqlite3") == 0o600
+
+    obj2 = CachedTokenInfo(token=b"bar", ttl=100)
+    storage.write(obj2)
+    assert test_module.SqliteStorage(config_dir, STAGING, "key").read() == obj2
+
+    # entries are keyed by environment and key
+    assert not test_module.SqliteStorage(config_dir, PROD, "key").exists()
+    assert not test_module.SqliteStorage(config_dir, STAGING, "other").exists()
+    assert not test_module.SqliteStorage(config_dir, STAGING).exists()
+
+    storage.clear()
+    assert not storage.exists()
+    assert storage.read() is None
+
+    # nothing should happen
+    storage.clear()
+
+
+@pytest.mark.parametrize("storage_class", [test_module.Storage, test_module.SqliteStorage])
+def test_storage__json_entries(config_dir, storage_class):
+    storage = storage_class(config_dir, STAGING, "key")
+    obj = CachedTokenInfo(token=b"foo", ttl=100, iat=1, exp=101)
+    storage.write(obj)
+    # written by an older version
+    if storage_class is test_module.Storage:
+        storage._file_path.write_text(obj.model_dump_json())
+    else:
+        with (connection := test_module._connect(storage._db_path)):
+            connection.execute("UPDATE tokens SET data = ?", (obj.model_dump_json(),))
+
+    assert storage.read() == obj
+
+    storage.write(obj)
+    assert storage.read() == obj
+
+
+def test_sqlite_storage__wal(config_dir):
+    test_module.SqliteStorage(config_dir, STAGING).write(CachedTokenInfo(token=b"foo", ttl=100))
+
+    connection = sqlite3.connect(config_dir / "tokens.sqlite3")
+    assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    connection.close()
+
+
+def test_storage__write_atomic(config_dir, monkeypatch):
+    storage = test_module.Storage(config_dir, STAGING, "key")
+    storage.write(CachedTokenInfo(token=b"foo", ttl=100))
+
+    def fail(*args):
+        raise OSError
+
+    monkeypatch.setattr(test_module.os, "replace", fail)
+    with pytest.raises(OSError):
+        storage.write(CachedTokenInfo(token=b"bar", ttl=100))
+
+    # the previous token is intact and the temporary file is removed
+    assert storage.read() == CachedTokenInfo(token=b"foo", ttl=100)
+    assert [path.name for path in config_dir.iterdir()] == [storage.name]
+
+
+def test_storage__write_fsync(config_dir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(test_module.os, "fsync", calls.append)
+
+    test_module.Storage(config_dir, STAGING).write(CachedTokenInfo(token=b"foo", ttl=100))
+    assert calls == []
+
+    storage = test_module.Storage(config_dir, STAGING, fsync=True)
+    storage.write(CachedTokenInfo(token=b"bar", ttl=100))
+    # the file and the directory
+    assert len(calls) == 2
+    assert storage.read() == CachedTokenInfo(token=b"bar", ttl=100)
+
+
+def _hammer_write(config_dir, n_writes):
+    storage = test_module.Storage(config_dir, STAGING, "key")
+    for i in range(n_writes):
+        storage.write(CachedTokenInfo(token=b"x" * (i % 50 + 1) * 100, ttl=100))
+
+
+def _hammer_read(config_dir, stop):
+    storage = test_module.Storage(config_dir, STAGING, "key")
+    while not stop.is_set():
+        # raises if a partially written file is read
+        assert storage.read() is not None
+
+
+def test_storage__concurrent_processes(config_dir):
+    test_module.Storage(config_dir, STAGING, "key").write(CachedTokenInfo(token=b"foo", ttl=100))
+    context = multiprocessing.get_context("fork")
+    stop = context.Event()
+
+    readers = [context.Process(target=_hammer_read, args=(config_dir, stop)) for _ in range(4)]
+    writers = [context.Process(target=_hammer_write, args=(config_dir, 200)) for _ in range(4)]
+    for process in readers + writers:
+        process.start()
+    for process in writers:
+        process.join(timeout=30)
+    stop.set()
+    for process in readers:
+        process.join(timeout=10)
+
+    assert [process.exitcode for process in readers + writers] == [0] * 8
+    assert [path.name for path in config_dir.iterdir()] == ["token_staging_key.bin"]
+
+
+def test_sqlite_storage__threads(config_dir):
+    storage = test_module.SqliteStorage(config_dir, STAGING, "key")
+    storage.write(CachedTokenInfo(token=b"foo", ttl=100))
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: storage.read(), range(16)))
+
+    assert results == [CachedTokenInfo(token=b"foo", ttl=100)] * 16
+
+
+def test_sqlite_storage__fork(config_dir):
+    storage = test_module.SqliteStorage(config_dir, STAGING, "key")
+    storage.write(CachedTokenInfo(token=b"foo", ttl=100))
+    context = multiprocessing.get_context("fork")
+
+    def child():
+        storage.write(CachedTokenInfo(token=b"bar", ttl=100))
+
+    process = context.Process(target=child)
+    process.start()
+    process.join(timeout=10)
+
+    assert process.exitcode == 0
+    assert storage.read() == CachedTokenInfo(token=b"bar", ttl=100)
+
+
+def test_sqlite_storage__reconnect_after_fork(config_dir, monkeypatch):
+    storage = test_module.SqliteStorage(config_dir, STAGING, "key")
+    storage.write(CachedTokenInfo(token=b"foo", ttl=100))
+    connection = test_module._connect(storage._db_path)
+
+    monkeypatch.setattr(test_module._CONNECTIONS, "pid", -1)
+
+    assert test_module._connect(storage._db_path) is not connection
+    assert storage.read() == CachedTokenInfo(token=b"foo", ttl=100)
+
+
+def test_sqlite_storage__lock(config_dir):
+    storage = test_module.SqliteStorage(config_dir, STAGING, "key")
+    with storage.lock(timeout=1) as lock:
+        assert lock.locked
+        # the lease is held in the database, not in a file per key
+        assert not test_module.SqliteStorage(config_dir, STAGING, "key").lock(timeout=0).acquire()
+        assert test_module.SqliteStorage(config_dir, STAGING, "other").lock(timeout=0).acquire()
+    assert not lock.locked
+
+
+def test_storage__scan(config_dir):
+    assert test_module.scan(config_dir, StorageBackend.file) == []
+
+    obj = CachedTokenInfo(token=b"foo", ttl=100)
+    test_module.Storage(config_dir, STAGING).write(obj)
+    test_module.Storage(config_dir, PROD, "pkce_auth_manager").write(obj)
+    (config_dir / "token_unknown.json").write_text("foo")
+    (config_dir / "other.json").write_text("foo")
+    # written by an older version, also with a record for staging
+    (config_dir / "token_production_legacy.json").write_text(obj.model_dump_json())
+    (config_dir / "token_staging.json").write_text(obj.model_dump_json())
+
+    storages = test_module.scan(config_dir, StorageBackend.file)
+    assert [storage.name for storage in storages] == [
+        "token_production_legacy.json",
+        "token_production_pkce_auth_manager.bin",
+        "token_staging.bin",
+    ]
+    assert all(storage.read() == obj for storage in storages)
+
+
+def test_storage__updated_at(config_dir):
+    storage = test_module.Storage(config_dir, STAGING)
+    assert storage.updated_at() is None
+
+    storage.write(CachedTokenInfo(token=b"foo", ttl=100))
+    assert storage.updated_at() == storage._file_path.stat().st_mtime
+
+
+def test_storage__purge(config_dir):
+    storage = test_module.Storage(config_dir, STAGING, "key")
+    storage.write(CachedTokenInfo(token=b"foo", ttl=100))
+    with storage.lock(timeout=1):
+        storage.purge()
+
+    assert list(config_dir.iterdir()) == []
+
+    # nothing should happen
+    storage.purge()
+
+
+def test_storage__lock_mode(config_dir, monkeypatch):
+    monkeypatch.setattr(settings, "LOCK_MODE", LockMode.lease)
+    storage = test_module.Storage(config_dir, STAGING, "key")
+    storage.write(CachedTokenInfo(token=b"foo", ttl=100))
+    with storage.lock(timeout=1) as lock:
+        assert isinstance(lock, test_module.LeaseFileLock)
+        assert (config_dir / "token_staging_key.bin.lease").exists()
+    assert (config_dir / "token_staging_key.bin.lease.done").exists()
+
+    # purged while locked by the eviction
+    lock = storage.lock(timeout=0)
+    assert lock.try_acquire()
+    storage.purge()
+    lock.release()
+
+    assert list(config_dir.iterdir()) == []
+
+    lock = test_module.Storage(config_dir, STAGING, "key", lock_mode=LockMode.flock).lock(1)
+    assert isinstance(lock, test_module.FileLock)
+
+
+def test_sqlite_storage__scan(config_dir):
+    assert test_module.scan(config_dir, StorageBackend.sqlite) == []
+
+    obj = CachedTokenInfo(token=b"foo", ttl=100)
+    test_module.SqliteStorage(config_dir, STAGING).write(obj)
+    test_module.SqliteStorage(config_dir, PROD, "pkce_auth_manager").write(obj)
+
+    storages = test_module.scan(config_dir, StorageBackend.sqlite)
+    assert sorted(storage.name for storage in storages) == [
+        "production/pkce_auth_manager",
+        "staging/",
+    ]
+    assert all(storage.read() == obj for storage in storages)
+
+
+def test_sqlite_storage__updated_at(config_dir):
+    storage = test_module.SqliteStorage(config_dir, STAGING, "key")
+    assert storage.updated_at() is None
+
+    before = time.time()
+    storage.write(CachedTokenInfo(token=b"foo", ttl=100))
+    assert before <= storage.updated_at() <= time.time()
+
+    storage.purge()
+    assert not storage.exists()
+
+
+@pytest.fixture(params=list(StorageBackend))
+def storage_class(request):
+    if request.param == StorageBackend.redis:
+        request.getfixturevalue("redis_client")
+    elif request.param == StorageBackend.keyring:
+        request.getfixturevalue("memory_keyring")
+    yield test_module.STORAGE_CLASSES[request.param]
+    test_module._MEMORY_ENTRIES.clear()
+
+
+def test_backend__entry(config_dir, storage_class):
+    storage = storage_class(config_dir, STAGING, "key")
+    assert storage.read() is None
+    assert not storage.exists()
+    assert storage.updated_at() is None
+
+    obj = CachedAuthManagerTokenInfo(token=b"foo", ttl=100, persistent_token_id=b"id")
+    before = time.time()
+    storage.write(obj)
+    assert storage.read() == obj
+    assert storage_class(config_dir, STAGING, "key").read() == obj
+    assert storage.exists()
+    assert before - 1 <= storage.updated_at() <= time.time() + 1
+    assert not storage_class(config_dir, PROD, "key").exists()
+    assert not storage_class(config_dir, STAGING, "other").exists()
+
+    with storage.lock(timeout=1) as lock:
+        assert lock.locked
+        assert not storage_class(config_dir, STAGING, "key").lock(timeout=0).acquire()
+        storage.purge()
+    assert not storage.exists()
+
+    # nothing should happen
+    storage.clear()
+    storage.purge()
+
+
+def test_backend__batch(config_dir, storage_class):
+    storages = [storage_class(config_dir, STAGING, f"key-{i}") for i in range(3)]
+    objs = [CachedTokenInfo(token=f"token-{i}".encode(), ttl=100) for i in range(3)]
+
+    storages[0].write(objs[0])
+    storages[2].write(objs[2])
+    assert test_module.read_many(storages) == [objs[0], None, objs[2]]
+
+    assert test_module.read_many([]) == []
+    assert storage_class.read_many([]) == []
+
+
+def test_sqlite_storage__read_many_batches(config_dir, monkeypatch):
+    monkeypatch.setattr(test_module, "SQLITE_MAX_BATCH_SIZE", 2)
+    storages = [test_module.SqliteStorage(config_dir, STAGING, f"key-{i}") for i in range(5)]
+    for storage in storages[::2]:
+        storage.write(CachedTokenInfo(token=storage._key.encode(), ttl=100))
+
+    assert [obj and obj.token for obj in test_module.read_many(storages)] == [
+        b"key-0",
+        None,
+        b"key-2",
+        None,
+        b"key-4",
+    ]
+
+
+def test_memory_storage(config_dir, tmp_path):
+    storage = test_module.MemoryStorage(config_dir, STAGING, "key")
+    storage.write(CachedTokenInfo(token=b"foo", ttl=100))
+    test_module.MemoryStorage(tmp_path / "other", PROD).write(CachedTokenInfo(token=b"foo", ttl=1))
+
+    # nothing is written to disk
+    assert not config_dir.exists()
+
+    assert [storage.name for storage in test_module.scan(config_dir, StorageBackend.memory)] == [
+        "staging/key"
+    ]
+    storage.clear()
+    assert test_module.scan(config_dir, StorageBackend.memory) == []
+    test_module._MEMORY_ENTRIES.clear()
+
+
+def test_keyring_storage(config_dir, memory_keyring):
+    storage = test_module.KeyringStorage(config_dir, STAGING, "key")
+    storage.write(CachedTokenInfo(token=b"foo", ttl=100))
+
+    assert list(memory_keyring.passwords) == [("obi-auth", "staging/key")]
+    assert storage.name == "staging/key"
+    # keyrings cannot be listed
+    assert test_module.scan(config_dir, StorageBackend.keyring) == []
+
+    with storage.lock(timeout=1):
+        storage.purge()
+    assert memory_keyring.passwords == {}
+    assert list(config_dir.iterdir()) == []
+
+
+def test_redis_storage(config_dir, redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_KEY_PREFIX", "prefix")
+    obj = CachedTokenInfo(token=b"foo", ttl=100)
+    test_module.RedisStorage(config_dir, STAGING).write(obj)
+    test_module.RedisStorage(config_dir, PROD, "pkce_auth_manager").write(obj)
+    redis_client.set("prefix:token:unknown:key", b"foo")
+    redis_client.set("other:token:staging:key", b"foo")
+
+    assert redis_client.hget("prefix:token:staging:", "data") == record.encode_record(obj)
+    storages = test_module.scan(config_dir, StorageBackend.redis)
+    assert [storage.name for storage in storages] == ["production/pkce_auth_manager", "staging/"]
+    assert all(storage.read() == obj for storage in storages)
+
+    with storages[0].lock(timeout=1):
+        assert redis_client.exists("prefix:lock:production:pkce_auth_manager")
+
+
+def test_redis_storage__client(config_dir, monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://redis.example.com:6380/1")
+    test_module._get_redis_client.cache_clear()
+
+    # the client connects on the first command
+    storage = test_module.RedisStorage(config_dir, STAGING)
+    assert storage._client.connection_pool.connection_kwargs["port"] == 6380
+    assert test_module.RedisStorage(config_dir, PROD)._client is storage._client
+    test_module._get_redis_client.cache_clear()
+
+
+@pytest.mark.parametrize(
+    ("storage_class", "module", "extra"),
+    [
+        (test_module.KeyringStorage, "keyring", "keyring"),
+        (test_module.RedisStorage, "redis", "redis"),
+    ],
+)
+def test_missing_extra(config_dir, storage_class, module, extra):
+    test_module._get_redis_client.cache_clear()
+    with patch.dict(sys.modules, {module: None}):
+        with pytest.raises(ConfigError, match=rf"pip install 'obi-auth\[{extra}\]'"):
+            storage_class(config_dir, STAGING)
+    test_module._get_redis_client.cache_clear()
+
+
+def test_storage__fsync_setting(config_dir, monkeypatch):
+    assert test_module.Storage(config_dir, STAGING)._fsync is False
+    monkeypatch.setattr(settings, "STORAGE_FSYNC", True)
+    assert test_module.Storage(config_dir, STAGING)._fsync is True
+    assert test_module.Storage(config_dir, STAGING, fsync=False)._fsync is False
@@ -122,3 +122,21 @@ def test_get_config_dir(mock_home):
     mock_home.return_value = Path("/foo")
     res = test_module.get_config_dir()
     assert res == Path("/foo/.config/obi-auth")
+
+
+def test_derive_fernet_key_once():
+    test_module.derive_fernet_key.cache_clear()
+    with patch.object(test_module, "get_machine_salt", wraps=test_module.get_machine_salt) as m:
+        res1 = test_module.derive_fernet_key()
+        res2 = test_module.derive_fernet_key()
+    assert res1 == res2
+    m.assert_called_once()
+
+
+def test_derive_fernet_key_secret():
+    with patch.object(test_module, "get_machine_salt", return_value=b"host-a"):
+        key = test_module.derive_fernet_key.__wrapped__("secret")
+        assert key != test_module.derive_fernet_key.__wrapped__()
+    # the same on all the hosts
+    with patch.object(test_module, "get_machine_salt", return_value=b"host-b"):
+        assert test_module.derive_fernet_key.__wrapped__("secret") == key